@@ -12,5 +12,10 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Share one MySQL connection pool per process (see DB_POOL in settings.py);
+# set DB_POOL=0 to fall back to per-thread persistent connections.
+os.environ.setdefault('DB_POOL', '1')
+# Async views for the hot read endpoints (see ASYNC_READ_VIEWS).
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
 
 application = get_asgi_application()
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -57,6 +60,8 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    # First, so its total covers every other middleware.
+    'store.profiling.profiling_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,6 +70,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'store.replicas.replica_stickiness_middleware',
+    'store.pooled_mysql.middleware.PoolTimeoutMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -86,12 +93,54 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+# JWT_STATELESS_AUTH builds request.user from token claims and a cached
+# per-user state record (store.authentication) instead of loading the user
+# row on every request; set it to 0 for simplejwt's database lookup.
+JWT_STATELESS_AUTH = os.getenv('JWT_STATELESS_AUTH', '1').lower() in ('1', 'true', 'yes')
+JWT_USER_STATE_TTL = int(os.getenv('JWT_USER_STATE_TTL', '60'))
+
+# Serve the hot catalog/cart reads from async views (store.async_views).
+# backend/asgi.py turns this on; under WSGI async views would only add an
+# event loop per request.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', '').lower() in ('1', 'true', 'yes')
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        'store.authentication.StatelessJWTAuthentication'
+        if JWT_STATELESS_AUTH else
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'store.profiling.ProfiledJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+# Request profiling (store.profiling): a request is profiled when it sends
+# PROFILING_HEADER set to PROFILING_TOKEN (the header is ignored while no
+# token is configured), or at random for PROFILING_SAMPLE_RATE (0-1) of
+# requests. Profiled responses get a Server-Timing header and a
+# "store.profiling" log record.
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+PROFILING_HEADER = os.getenv('PROFILING_HEADER', 'X-Profile')
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+# Slowest serializer fields listed in Server-Timing (the log has all).
+PROFILING_TOP_FIELDS = int(os.getenv('PROFILING_TOP_FIELDS', '5'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {
+        'store.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
 }
 
+# Catalog page size (store.pagination.KeysetCursorPagination, used by the
+# category and product endpoints) and the upper bound for `?page_size=`.
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', '20'))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', '100'))
+
 AUTHENTICATION_BACKENDS = [
     'store.backends.EmailBackend',  # 👈 add this
     'django.contrib.auth.backends.ModelBackend',
@@ -117,6 +166,152 @@ DATABASES = {
     }
 }
 
+# Local runs and the test/benchmark suite can use SQLite instead of MySQL.
+if os.getenv('USE_SQLITE', '').lower() in ('1', 'true', 'yes'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
+# Read replicas (store.replicas): catalog reads from the category/product
+# endpoints go to these; everything else stays on the primary. Each
+# MYSQL_REPLICA_HOSTS entry becomes "replica<N>" with the primary's
+# credentials; with USE_SQLITE, SQLITE_REPLICAS lists database files
+# instead (e.g. copies of db.sqlite3) for trying the routing locally.
+# REPLICA_READS=0 keeps the aliases but reads everything from the primary.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.mysql':
+    _replicas = [
+        {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+        for host in os.getenv('MYSQL_REPLICA_HOSTS', '').split(',') if host.strip()
+    ]
+else:
+    _replicas = [
+        {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path.strip()}
+        for path in os.getenv('SQLITE_REPLICAS', '').split(',') if path.strip()
+    ]
+for _number, _replica in enumerate(_replicas, start=1):
+    DATABASES[f'replica{_number}'] = _replica
+
+DATABASE_ROUTERS = ['store.replicas.ReplicaRouter']
+REPLICA_DATABASES = [
+    alias for alias in DATABASES if alias.startswith('replica')
+] if os.getenv('REPLICA_READS', '1').lower() in ('1', 'true', 'yes') else []
+# How long a user's reads stay on the primary after they write; keep it
+# above the usual replication lag. For as long after a catalog change,
+# responses read from a replica are not stored in the response cache.
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '10'))
+
+# Persistent connections: keep a connection open for DB_CONN_MAX_AGE seconds
+# across requests instead of reconnecting (and re-authenticating) for each
+# one; 0 closes it after every request. With health checks on, a reused
+# connection is pinged once per request before use, so a connection the
+# server dropped is replaced instead of failing the request.
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', '1').lower() in ('1', 'true', 'yes')
+for _database in DATABASES.values():
+    _database.setdefault('CONN_MAX_AGE', DB_CONN_MAX_AGE)
+    _database.setdefault('CONN_HEALTH_CHECKS', DB_CONN_HEALTH_CHECKS)
+
+# Pooled MySQL (store.pooled_mysql): one pool per process shared by all
+# threads, for the ASGI server, where persistent per-thread connections do
+# not work. backend/asgi.py turns it on unless DB_POOL=0; WSGI workers keep
+# plain persistent connections.
+#
+# Sizing: under ASGI every in-flight request runs its ORM work on its own
+# thread and holds a connection until it finishes, so DB_POOL_SIZE caps the
+# concurrent database-using requests per worker process. Each alias
+# (primary and every replica) gets its own pool, so the server needs
+# workers x DB_POOL_SIZE connections per alias below MySQL's
+# max_connections. A request that waits DB_POOL_TIMEOUT seconds without a
+# connection gets a 503 with Retry-After: DB_POOL_RETRY_AFTER
+# (PoolTimeoutMiddleware). Keep the timeout short so a saturated worker
+# sheds load instead of queueing it.
+DB_POOL = os.getenv('DB_POOL', '').lower() in ('1', 'true', 'yes')
+DB_POOL_RETRY_AFTER = int(os.getenv('DB_POOL_RETRY_AFTER', '1'))
+for _database in DATABASES.values():
+    if not DB_POOL or _database['ENGINE'] != 'django.db.backends.mysql':
+        continue
+    _database.update({
+        'ENGINE': 'store.pooled_mysql',
+        # close() returns the connection to the pool.
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'SIZE': int(os.getenv('DB_POOL_SIZE', '10')),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', '5')),
+            'RECYCLE': int(os.getenv('DB_POOL_RECYCLE', '3600')),
+        },
+    })
+
+
+# Cache
+# Local memory by default; point REDIS_URL at a Redis server to share the
+# catalog response cache between workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '300'))
+
+
+# Product/category search
+# 'auto' uses MySQL FULLTEXT on MySQL and the in-process inverted index
+# elsewhere; set a dotted path to force a backend from store.search.
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'auto')
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', '1000'))
+SEARCH_INDEX_MAX_AGE = int(os.getenv('SEARCH_INDEX_MAX_AGE', '300'))
+
+
+# Stock reservations
+# How long a cart holds flash-deal stock before the hold lapses.
+STOCK_RESERVATION_SECONDS = int(os.getenv('STOCK_RESERVATION_SECONDS', '600'))
+
+
+# Admin
+# Unfiltered order/order item changelists show the database's row estimate
+# instead of running COUNT(*) once a table is at least this big.
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', '100000'))
+
+
+# Password hashing
+# PASSWORD_HASHER picks the hasher for new hashes: pbkdf2 (default), scrypt,
+# or argon2 (needs argon2-cffi). The others stay listed so existing hashes
+# still verify; they are rehashed with the preferred one at the next login.
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'store.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'store.hashers.ScryptPasswordHasher',
+    'argon2': 'store.hashers.Argon2PasswordHasher',
+}
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'pbkdf2')
+if PASSWORD_HASHER not in _PASSWORD_HASHERS:
+    raise ImproperlyConfigured(
+        f"PASSWORD_HASHER must be one of {', '.join(_PASSWORD_HASHERS)}, not {PASSWORD_HASHER!r}"
+    )
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+PASSWORD_PBKDF2_ITERATIONS = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', '1000000'))
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.getenv('PASSWORD_SCRYPT_WORK_FACTOR', str(2 ** 14)))
+PASSWORD_ARGON2_TIME_COST = int(os.getenv('PASSWORD_ARGON2_TIME_COST', '2'))
+PASSWORD_ARGON2_MEMORY_COST = int(os.getenv('PASSWORD_ARGON2_MEMORY_COST', '102400'))  # KiB
+PASSWORD_ARGON2_PARALLELISM = int(os.getenv('PASSWORD_ARGON2_PARALLELISM', '8'))
+
+# Hashing runs on a bounded thread pool (store.hashers); requests that wait
+# longer than PASSWORD_HASH_TIMEOUT seconds for a slot get a 503.
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 2)))
+PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', '32'))
+PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', '10'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
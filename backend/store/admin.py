@@ -1,12 +1,96 @@
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
 from django.utils.html import format_html
+from .checkout import recalculate_cart_totals, recalculate_order_totals
 from .models import (
     CustomUser, Category, Product, Cart, CartItem,
     PaymentMethod, Payment, PaymentDetail,
     ShippingAddress, Order, OrderItem, ProductVariant
 )
 
+# =======================
+# CHANGELIST HELPERS
+# =======================
+def thumbnail(obj, field, width=50):
+    """<img> from the model's cached image_urls; no Cloudinary SDK call per row."""
+    url = obj.get_image_url(field, "thumbnail")
+    if url:
+        return format_html('<img src="{}" style="width:{}px;height:auto;" />', url, width)
+    return "-"
+
+
+def estimated_row_count(model):
+    """The database's own row estimate, or None where it keeps none (SQLite)."""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "mysql":
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES"
+                " WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [table],
+            )
+        elif connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    COUNT(*) scans the whole table on InnoDB. For an unfiltered changelist
+    of a big table use the statistics estimate instead; filtered lists and
+    small tables still get an exact count.
+    """
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if not query.where:
+            estimate = estimated_row_count(self.object_list.model)
+            if estimate is not None and estimate >= getattr(settings, "ADMIN_ESTIMATED_COUNT_THRESHOLD", 100000):
+                return estimate
+        return super().count
+
+
+class RelatedLabelsAdmin(admin.ModelAdmin):
+    """
+    Some __str__ methods read a related row (Cart -> user, OrderItem ->
+    product, ...). Load it with the admin's own objects (`label_related`)
+    and with foreign-key choices (`choice_related`, {field: relations}), so
+    change and delete pages don't query once per object or option.
+    """
+    label_related = ()
+    choice_related = {}
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if not self.label_related:
+            return queryset
+        # The changelist ignores list_select_related once the queryset has
+        # a select_related() of its own, so carry those relations too.
+        return queryset.select_related(*self.label_related, *self.list_select_related)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        related = self.choice_related.get(db_field.name)
+        if related and "queryset" not in kwargs:
+            queryset = self.get_field_queryset(None, db_field, request)
+            if queryset is None:
+                queryset = db_field.remote_field.model._default_manager.all()
+            kwargs["queryset"] = queryset.select_related(*related)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # The "(N total)" link runs a second, unfiltered COUNT(*).
+    show_full_result_count = False
+
+
 # =======================
 # CUSTOM USER ADMIN
 # =======================
@@ -52,9 +136,7 @@ class ProductVariantInline(admin.TabularInline):
     readonly_fields = ("variant_image_tag",)
 
     def variant_image_tag(self, obj):
-        if obj.image_main:
-            return format_html('<img src="{}" style="width:60px;height:auto;" />', obj.image_main.url)
-        return "-"
+        return thumbnail(obj, "image_main", width=60)
     variant_image_tag.short_description = "Main Variant Image"
 
 
@@ -70,37 +152,28 @@ class ProductAdmin(admin.ModelAdmin):
     )
     list_filter = ('category', 'is_deal_of_the_day', 'is_featured', 'is_new', 'is_abroad_order')
     search_fields = ('name', 'description')
+    list_select_related = ('category',)
     inlines = [ProductVariantInline]
 
     # Thumbnails
     def main_image_tag(self, obj):
-        if obj.main_image:
-            return format_html('<img src="{}" style="width:50px;height:auto;" />', obj.main_image.url)
-        return "-"
+        return thumbnail(obj, 'main_image')
     main_image_tag.short_description = 'Main Image'
 
     def image1_tag(self, obj):
-        if obj.image1:
-            return format_html('<img src="{}" style="width:50px;height:auto;" />', obj.image1.url)
-        return "-"
+        return thumbnail(obj, 'image1')
     image1_tag.short_description = 'Image 1'
 
     def image2_tag(self, obj):
-        if obj.image2:
-            return format_html('<img src="{}" style="width:50px;height:auto;" />', obj.image2.url)
-        return "-"
+        return thumbnail(obj, 'image2')
     image2_tag.short_description = 'Image 2'
 
     def image3_tag(self, obj):
-        if obj.image3:
-            return format_html('<img src="{}" style="width:50px;height:auto;" />', obj.image3.url)
-        return "-"
+        return thumbnail(obj, 'image3')
     image3_tag.short_description = 'Image 3'
 
     def image4_tag(self, obj):
-        if obj.image4:
-            return format_html('<img src="{}" style="width:50px;height:auto;" />', obj.image4.url)
-        return "-"
+        return thumbnail(obj, 'image4')
     image4_tag.short_description = 'Image 4'
 
 
@@ -115,39 +188,83 @@ class CategoryAdmin(admin.ModelAdmin):
 # =======================
 # OTHER MODELS ADMIN
 # =======================
-class CartAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'created_at')
+class CartAdmin(RelatedLabelsAdmin):
+    list_display = ('id', 'user', 'item_count', 'subtotal', 'created_at')
+    list_select_related = ('user',)
+    label_related = ('user',)
+
+
+class TotalsRecalculatingAdmin(admin.ModelAdmin):
+    """Item admins bypass store.checkout, so recompute the parent's stored totals."""
+    def recalculate(self, parent_ids):
+        raise NotImplementedError
 
+    def save_model(self, request, obj, form, change):
+        previous = type(obj).objects.filter(pk=obj.pk).values_list(self.parent_field, flat=True).first()
+        super().save_model(request, obj, form, change)
+        self.recalculate({getattr(obj, self.parent_field), previous} - {None})
 
-class CartItemAdmin(admin.ModelAdmin):
-    list_display = ('cart_item_id', 'cart', 'product', 'quantity')
+    def delete_model(self, request, obj):
+        parent_id = getattr(obj, self.parent_field)
+        super().delete_model(request, obj)
+        self.recalculate({parent_id})
+
+    def delete_queryset(self, request, queryset):
+        parent_ids = set(queryset.values_list(self.parent_field, flat=True))
+        super().delete_queryset(request, queryset)
+        self.recalculate(parent_ids)
+
+
+class CartItemAdmin(RelatedLabelsAdmin, TotalsRecalculatingAdmin):
+    list_display = ('cart_item_id', 'cart', 'product', 'variant', 'quantity')
+    list_select_related = ('cart__user', 'product', 'variant__product')
+    label_related = ('product',)
+    choice_related = {'cart': ('user',), 'variant': ('product',)}
+    parent_field = 'cart_id'
+
+    def recalculate(self, parent_ids):
+        recalculate_cart_totals(Cart.objects.filter(pk__in=parent_ids))
 
 
 class PaymentMethodAdmin(admin.ModelAdmin):
     list_display = ('payment_method_id', 'user', 'method_name', 'created_at')
+    list_select_related = ('user',)
 
 
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ('payment_id', 'order_id', 'payment_method', 'amount', 'status', 'payment_date')
+    list_select_related = ('payment_method',)
     list_filter = ('status',)
 
 
 class PaymentDetailAdmin(admin.ModelAdmin):
     list_display = ('payment_detail_id', 'payment', 'amount', 'status', 'reference')
+    list_select_related = ('payment',)
 
 
 class ShippingAddressAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'full_name', 'city', 'state', 'country')
+    list_select_related = ('user',)
 
 
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ('order_id', 'user', 'total_amount', 'status', 'created_at')
+class OrderAdmin(RelatedLabelsAdmin, LargeTableAdmin):
+    list_display = ('order_id', 'user', 'item_count', 'total_amount', 'status', 'created_at')
+    list_select_related = ('user',)
+    label_related = ('user',)
     list_filter = ('status',)
     search_fields = ('user__username',)
 
 
-class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ('id', 'order', 'product', 'quantity', 'price')
+class OrderItemAdmin(RelatedLabelsAdmin, LargeTableAdmin, TotalsRecalculatingAdmin):
+    list_display = ('id', 'order', 'product', 'variant', 'quantity', 'price')
+    list_select_related = ('order__user', 'product', 'variant__product')
+    label_related = ('product',)
+    choice_related = {'order': ('user',), 'variant': ('product',)}
+    parent_field = 'order_id'
+
+    def recalculate(self, parent_ids):
+        # The amount charged stays as it was (see store/checkout.py).
+        recalculate_order_totals(Order.objects.filter(pk__in=parent_ids), amounts=False)
 
 
 # =======================
@@ -0,0 +1,89 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import URLPattern
+
+from .cache import get_cache
+
+
+# =======================
+#  ASYNC READ ROUTES
+# =======================
+# Under ASGI a sync DRF view runs on a worker thread for the whole request.
+# These routes run the hot reads (product list/detail, category list, cart
+# list/detail) on the event loop instead: the viewset's own queryset,
+# serializers and pagination, with only the queries awaited through the
+# async ORM (AsyncReadMixin in store/views.py), so a worker can hold many
+# more requests open while they wait on the database.
+#
+# Everything else on the same URL (writes, HEAD/OPTIONS, ?search=) is
+# handed to the sync view unchanged. Enabled by ASYNC_READ_VIEWS, which
+# backend/asgi.py turns on; WSGI keeps the plain sync views.
+
+ASYNC_ROUTES = {"category-list", "product-list", "product-detail", "cart-list", "cart-detail"}
+ASYNC_ACTIONS = {"list": "alist", "retrieve": "aretrieve"}
+
+
+def _plain(response):
+    """
+    Render here and return a plain HttpResponse; the ASGI handler would
+    otherwise hop to a thread just to call render().
+    """
+    if not hasattr(response, "render"):
+        return response
+    response.render()
+    plain = HttpResponse(response.content, status=response.status_code)
+    for header, value in response.items():
+        plain[header] = value
+    return plain
+
+
+def async_read_view(sync_view):
+    """Async view for a router route; falls back to `sync_view` where needed."""
+    cls, initkwargs, actions = sync_view.cls, sync_view.initkwargs, sync_view.actions
+    fallback = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        action = actions.get(request.method.lower())
+        if request.method != "GET" or action not in ASYNC_ACTIONS:
+            return await fallback(request, *args, **kwargs)
+
+        # What ViewSetMixin.as_view() and APIView.dispatch() set up.
+        self = cls(**initkwargs)
+        self.action_map = actions
+        self.args, self.kwargs = args, kwargs
+        self.defer_cache_store = True
+        drf_request = self.initialize_request(request, *args, **kwargs)
+        self.request = drf_request
+        self.headers = self.default_response_headers
+        if not self.async_supported(drf_request):
+            return await fallback(request, *args, **kwargs)
+
+        try:
+            if "HTTP_AUTHORIZATION" in request.META:
+                # Token checks may read the user state from the database.
+                await sync_to_async(self.initial)(drf_request, *args, **kwargs)
+            else:
+                self.initial(drf_request, *args, **kwargs)
+            response = await getattr(self, ASYNC_ACTIONS[action])(drf_request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        response = self.finalize_response(drf_request, response, *args, **kwargs)
+
+        entry = getattr(response, "_catalog_cache_entry", None)
+        if entry is not None:
+            await get_cache().aset(*entry, getattr(settings, "CATALOG_CACHE_TIMEOUT", 300))
+        return _plain(response)
+
+    view.csrf_exempt = True
+    view.cls, view.initkwargs, view.actions = cls, initkwargs, actions
+    return view
+
+
+def async_read_routes(patterns):
+    """Swap the ASYNC_ROUTES of router-generated url patterns for async views."""
+    return [
+        URLPattern(p.pattern, async_read_view(p.callback), p.default_args, p.name)
+        if isinstance(p, URLPattern) and p.name in ASYNC_ROUTES else p
+        for p in patterns
+    ]
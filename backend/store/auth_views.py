@@ -1,7 +1,7 @@
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import tokens_for_user
 from .models import CustomUser
 from .serializers import UserSerializer, RegisterSerializer, LoginSerializer
 
@@ -22,7 +22,7 @@ class RegisterView(generics.CreateAPIView):
         user = serializer.save()
 
         # still return tokens if you want — frontend will not auto-save on register
-        refresh = RefreshToken.for_user(user)
+        refresh = tokens_for_user(user)
         return Response({
             "user": UserSerializer(user).data,
             "refresh": str(refresh),
@@ -62,7 +62,7 @@ class LoginView(generics.GenericAPIView):
 
         # valid: return tokens + user
         user = serializer.validated_data['user']
-        refresh = RefreshToken.for_user(user)
+        refresh = tokens_for_user(user)
         return Response({
             'user': UserSerializer(user).data,
             'refresh': str(refresh),
@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import CustomUser
+
+
+# =======================
+#  STATELESS JWT AUTH
+# =======================
+# simplejwt's JWTAuthentication loads the CustomUser row on every request.
+# StatelessJWTAuthentication builds request.user from the token's claims
+# instead and only checks a small per-user state record (active, staff,
+# token version) kept in the cache for JWT_USER_STATE_TTL seconds.
+#
+# Revocation: deactivating a user or changing their password (which bumps
+# CustomUser.token_version) drops the cached record (store/signals.py); the
+# next request reloads it and rejects tokens whose "ver" claim no longer
+# matches. A hash upgrade at login does not bump the version. With a
+# per-process cache other workers notice within the TTL.
+
+USER_STATE_PREFIX = "auth-user-state:v2:"
+
+
+def _cache():
+    return caches[getattr(settings, "CATALOG_CACHE_ALIAS", "default")]
+
+
+def tokens_for_user(user):
+    """RefreshToken.for_user() plus the claims the stateless path reads."""
+    refresh = RefreshToken.for_user(user)
+    refresh["username"] = user.username
+    refresh["is_staff"] = user.is_staff
+    refresh["ver"] = user.token_version
+    return refresh
+
+
+def get_user_state(user_id):
+    key = f"{USER_STATE_PREFIX}{user_id}"
+    state = _cache().get(key)
+    if state is None:
+        state = CustomUser.objects.filter(pk=user_id).values("is_active", "is_staff", "token_version").first()
+        if state is None:
+            return None
+        _cache().set(key, state, getattr(settings, "JWT_USER_STATE_TTL", 60))
+    return state
+
+
+def forget_user_state(user_id):
+    _cache().delete(f"{USER_STATE_PREFIX}{user_id}")
+
+
+class ClaimsUser(TokenUser):
+    """
+    request.user built from token claims. Anything the claims do not carry
+    (email, address, ...) loads the CustomUser row on first access.
+    """
+
+    def __init__(self, token, state):
+        super().__init__(token)
+        self._state = state
+
+    @cached_property
+    def id(self):
+        # simplejwt writes the user id claim as a string.
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @property
+    def is_staff(self):
+        # From the state record, not the claim: a demotion applies before
+        # the token expires.
+        return self._state["is_staff"]
+
+    @cached_property
+    def instance(self):
+        return CustomUser.objects.get(pk=self.id)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.instance, name)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        state = get_user_state(user_id)
+        if state is None:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        if not state["is_active"]:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        # Tokens issued before the claim existed have no version to check.
+        version = validated_token.get("ver")
+        if version is not None and version != state["token_version"]:
+            raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+        return ClaimsUser(validated_token, state)
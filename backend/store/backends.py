@@ -1,14 +1,15 @@
 from django.contrib.auth.backends import ModelBackend
+from .hashers import verify_password
 from .models import CustomUser
 
 
 class EmailBackend(ModelBackend):
-    def authenticate(self, request, email=None, password=None, **kwargs):
-        try:
-            user = CustomUser.objects.get(email=email)
-        except CustomUser.DoesNotExist:
+    """Accepts an email or a username, matched case-insensitively."""
+    def authenticate(self, request, email=None, password=None, username=None, **kwargs):
+        user = CustomUser.objects.get_by_identifier(email or username)
+        if user is None:
             return None
 
-        if user.check_password(password):
+        if verify_password(user, password):
             return user
         return None
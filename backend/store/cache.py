@@ -0,0 +1,230 @@
+import hashlib
+import time
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import CatalogVersion
+
+
+# =======================
+#  CATALOG RESPONSE CACHE
+# =======================
+# Cached responses are keyed by absolute URL, query string, media type and the current
+# version token of every namespace the response depends on. Invalidation
+# replaces a namespace token (see store/signals.py); entries built under the
+# old token are never read again and simply expire. The time of the last
+# invalidation is kept too, so views can decline to store a response that
+# may predate it (a lagging read replica, see ReplicaReadMixin).
+#
+# Namespaces:
+#   catalog          every catalog response (bumped on Category changes)
+#   product-list     GET /api/products/
+#   product:<id>     GET /api/products/<id>/
+#   category-list    GET /api/categories/
+#   category:<id>    GET /api/categories/<id>/
+
+VERSION_PREFIX = "catalog-version:"
+RESPONSE_PREFIX = "catalog-response:"
+CHANGED_AT_KEY = "catalog-changed-at"
+CACHED_HEADERS = ("ETag", "Last-Modified")
+
+
+def get_cache():
+    return caches[getattr(settings, "CATALOG_CACHE_ALIAS", "default")]
+
+
+def get_versions(namespaces):
+    cache = get_cache()
+    keys = [VERSION_PREFIX + ns for ns in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # A missing token (never set or evicted) gets a fresh random one,
+            # so entries cached under an earlier token can never resurface.
+            token = uuid.uuid4().hex
+            cache.add(key, token, timeout=None)
+            # Falls back to our token if the cache keeps nothing (DummyCache).
+            versions[key] = cache.get(key) or token
+    return [versions[key] for key in keys]
+
+
+async def aget_versions(namespaces):
+    cache = get_cache()
+    keys = [VERSION_PREFIX + ns for ns in namespaces]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            token = uuid.uuid4().hex
+            await cache.aadd(key, token, timeout=None)
+            versions[key] = await cache.aget(key) or token
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*namespaces):
+    """Invalidate namespaces once the current transaction commits."""
+    def bump():
+        get_cache().set_many(
+            {**{VERSION_PREFIX + ns: uuid.uuid4().hex for ns in namespaces}, CHANGED_AT_KEY: time.time()},
+            timeout=None,
+        )
+    transaction.on_commit(bump)
+
+
+class CachedResponseMixin:
+    """
+    Serves list/retrieve from the catalog cache. Views declare which
+    namespaces a response depends on through `get_cache_namespaces()`.
+    The async views (store/async_views.py) set `defer_cache_store` and
+    write the entry left on the response with the async cache API.
+    """
+    defer_cache_store = False
+
+    def get_cache_namespaces(self):
+        raise NotImplementedError
+
+    def detail_namespace(self, prefix):
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        # "/products/07/" and "/products/7/" are the same object.
+        return f"{prefix}:{int(pk)}" if str(pk).isdigit() else f"{prefix}:{pk}"
+
+    def _response_cache_key(self, request, versions=None):
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        if versions is None:
+            versions = get_versions(self.get_cache_namespaces())
+        # Absolute URL: paginated responses embed host-specific next/previous links.
+        url = request.build_absolute_uri(request.path)
+        raw = "|".join([url, query, request.accepted_media_type, *versions])
+        return RESPONSE_PREFIX + hashlib.sha256(raw.encode()).hexdigest()
+
+    def _cache_hit(self, cached):
+        content, content_type, headers = cached
+        response = HttpResponse(content, content_type=content_type, headers=headers)
+        response["X-Cache"] = "HIT"
+        return response
+
+    def cacheable(self, response, changed_at):
+        """
+        Whether to store a fresh 200 `response`; `changed_at` is the time of
+        the last catalog invalidation (None if unknown).
+        """
+        return True
+
+    def _cached_or(self, handler, request, *args, **kwargs):
+        key = self._response_cache_key(request)
+        found = get_cache().get_many([key, CHANGED_AT_KEY])
+        if key in found:
+            return self._cache_hit(found[key])
+        response = handler(request, *args, **kwargs)
+        response._catalog_cache_key = key
+        response._catalog_changed_at = found.get(CHANGED_AT_KEY)
+        return response
+
+    async def _acached_or(self, handler, request, *args, **kwargs):
+        versions = await aget_versions(self.get_cache_namespaces())
+        key = self._response_cache_key(request, versions)
+        found = await get_cache().aget_many([key, CHANGED_AT_KEY])
+        if key in found:
+            return self._cache_hit(found[key])
+        response = await handler(request, *args, **kwargs)
+        response._catalog_cache_key = key
+        response._catalog_changed_at = found.get(CHANGED_AT_KEY)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_or(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_or(super().retrieve, request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        return await self._acached_or(super().alist, request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self._acached_or(super().aretrieve, request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(response, "_catalog_cache_key", None)
+        if key and response.status_code == 200:
+            if self.cacheable(response, response._catalog_changed_at):
+                response.render()
+                # Validators are stored with the body they describe, so a hit
+                # never pairs an old body with a newer ETag.
+                headers = {h: response[h] for h in CACHED_HEADERS if response.has_header(h)}
+                entry = (key, (response.content, response["Content-Type"], headers))
+                if self.defer_cache_store:
+                    response._catalog_cache_entry = entry
+                else:
+                    get_cache().set(*entry, getattr(settings, "CATALOG_CACHE_TIMEOUT", 300))
+            response["X-Cache"] = "MISS"
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    Answers If-None-Match / If-Modified-Since on list/retrieve from the
+    CatalogVersion stamp (one primary-key lookup) before any serialization.
+    """
+
+    def _catalog_validators(self, request, stamp):
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        raw = "|".join([
+            str(stamp.version), request.build_absolute_uri(request.path),
+            query, request.accepted_media_type,
+        ])
+        etag = '"%s"' % hashlib.sha256(raw.encode()).hexdigest()[:32]
+        return etag, int(stamp.updated_at.timestamp())
+
+    def _not_modified(self, request, etag, last_modified):
+        not_modified = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified
+        )
+        if not_modified is not None:
+            not_modified["ETag"] = etag
+        return not_modified
+
+    def _conditional_or(self, handler, request, *args, **kwargs):
+        etag, last_modified = self._catalog_validators(request, CatalogVersion.current())
+        not_modified = self._not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = handler(request, *args, **kwargs)
+        response._catalog_validators = (etag, last_modified)
+        return response
+
+    async def _aconditional_or(self, handler, request, *args, **kwargs):
+        etag, last_modified = self._catalog_validators(request, await CatalogVersion.acurrent())
+        not_modified = self._not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = await handler(request, *args, **kwargs)
+        response._catalog_validators = (etag, last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional_or(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional_or(super().retrieve, request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        return await self._aconditional_or(super().alist, request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self._aconditional_or(super().aretrieve, request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Set before the response cache stores the response; cache hits
+        # already carry the validators they were stored with.
+        validators = getattr(response, "_catalog_validators", None)
+        if validators and response.status_code == 200 and not response.has_header("ETag"):
+            response["ETag"], last_modified = validators
+            response["Last-Modified"] = http_date(last_modified)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,285 @@
+import csv
+import json
+from decimal import Decimal
+from itertools import islice
+
+from cloudinary import CloudinaryResource
+from django.core.exceptions import ValidationError
+from django.db import DataError, IntegrityError, models, transaction
+
+from .cache import bump_versions
+from .checkout import recalculate_cart_totals
+from .models import Cart, CartItem, CatalogVersion, Category, Product, ProductVariant
+from .search import InvertedIndexBackend, SuggestionIndex
+
+
+# =======================
+#  CATALOG IMPORT / EXPORT
+# =======================
+# Rows are matched on natural keys, since primary keys differ between
+# environments:
+#
+#   category  name
+#   product   category (name), name
+#   variant   category, product (names), color_name, storage_option
+#
+# Both directions stream: exports read with iterator() and write row by row;
+# imports read the file lazily and upsert one chunk at a time (one lookup
+# query per model, then bulk_create/bulk_update), so memory depends on the
+# chunk size, not the file size. Each chunk commits on its own; an import
+# stopped by a bad row can simply be re-run once the row is fixed.
+#
+# Values go through the model field's clean() (validators included), so a
+# bad row is reported by line before anything is written. What only the
+# database can catch is reported for the chunk's line range.
+
+FORMATS = ("csv", "jsonl")
+
+# kind -> [(column, ORM lookup)]
+COLUMNS = {
+    "category": [
+        ("name", "name"), ("description", "description"), ("image", "image"),
+    ],
+    "product": [
+        ("category", "category__name"), ("name", "name"), ("description", "description"),
+        ("price", "price"), ("original_price", "original_price"), ("stock", "stock"),
+        ("main_image", "main_image"), ("image1", "image1"), ("image2", "image2"),
+        ("image3", "image3"), ("image4", "image4"),
+        ("is_deal_of_the_day", "is_deal_of_the_day"), ("is_featured", "is_featured"),
+        ("is_new", "is_new"), ("is_abroad_order", "is_abroad_order"),
+        ("abroad_delivery_days", "abroad_delivery_days"),
+    ],
+    "variant": [
+        ("category", "product__category__name"), ("product", "product__name"),
+        ("color_name", "color_name"), ("color_code", "color_code"),
+        ("storage_option", "storage_option"), ("price", "price"), ("stock", "stock"),
+        ("image_main", "image_main"), ("image1", "image1"), ("image2", "image2"),
+        ("image3", "image3"), ("image4", "image4"),
+    ],
+}
+MODELS = {"category": Category, "product": Product, "variant": ProductVariant}
+# Columns that identify a row rather than being written to it.
+KEY_COLUMNS = {"category": (), "product": ("category",), "variant": ("category", "product")}
+# Written columns that are also part of the natural key: stored stripped,
+# exactly as they are looked up, so a re-run finds the row again.
+NATURAL_KEY_COLUMNS = {"category": ("name",), "product": ("name",), "variant": ("color_name", "storage_option")}
+BOOLEAN_VALUES = {
+    **dict.fromkeys(("1", "true", "yes", "t", "y"), True),
+    **dict.fromkeys(("0", "false", "no", "f", "n"), False),
+}
+
+
+class CatalogImportError(Exception):
+    def __init__(self, line, message, last_line=None):
+        where = f"row {line}" if last_line in (None, line) else f"rows {line}-{last_line}"
+        super().__init__(f"{where}: {message}")
+
+
+# -----------------------
+#  Export
+# -----------------------
+def _export_value(value, fmt):
+    if isinstance(value, CloudinaryResource):
+        value = value.get_prep_value()
+    if isinstance(value, Decimal):
+        value = str(value)
+    if value is None and fmt == "csv":
+        value = ""
+    return value
+
+
+def export_rows(kind, chunk_size=2000):
+    """Yield one dict per row, in primary-key order."""
+    columns = COLUMNS[kind]
+    queryset = MODELS[kind].objects.order_by("pk").values_list(*(lookup for _, lookup in columns))
+    for values in queryset.iterator(chunk_size=chunk_size):
+        yield dict(zip((column for column, _ in columns), values))
+
+
+def write_rows(stream, kind, fmt, rows):
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, fieldnames=[column for column, _ in COLUMNS[kind]])
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: _export_value(v, fmt) for k, v in row.items()})
+            count += 1
+    else:
+        for row in rows:
+            stream.write(json.dumps({k: _export_value(v, fmt) for k, v in row.items()}) + "\n")
+            count += 1
+    return count
+
+
+# -----------------------
+#  Import
+# -----------------------
+def read_rows(stream, fmt):
+    """Yield (line number, dict) pairs without reading the whole stream."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line, text in enumerate(stream, start=1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except ValueError as exc:
+                    raise CatalogImportError(line, f"invalid JSON ({exc})")
+
+
+def _coerce(field, raw, line):
+    if raw is None or raw == "":
+        if field.null:
+            return None
+        if field.has_default():
+            return field.get_default()
+        if isinstance(field, (models.CharField, models.TextField)):
+            return ""
+        raise CatalogImportError(line, f"{field.name} is required")
+    if isinstance(field, models.BooleanField) and isinstance(raw, str):
+        try:
+            return BOOLEAN_VALUES[raw.strip().lower()]
+        except KeyError:
+            raise CatalogImportError(line, f"{field.name}: {raw!r} is not a boolean")
+    try:
+        return field.clean(raw, None)
+    except ValidationError as exc:
+        raise CatalogImportError(line, f"{field.name}: {'; '.join(exc.messages)}")
+
+
+def _key_value(row, column):
+    # Optional key parts (variant colour/storage) are stored as NULL.
+    return (row.get(column) or "").strip() or None
+
+
+def _apply(obj, kind, row, line):
+    """Copy the row's writable columns onto obj; returns the fields set."""
+    opts = MODELS[kind]._meta
+    fields = []
+    for column, _ in COLUMNS[kind]:
+        if column in KEY_COLUMNS[kind] or column not in row:
+            continue
+        field = opts.get_field(column)
+        raw = _key_value(row, column) if column in NATURAL_KEY_COLUMNS[kind] else row[column]
+        setattr(obj, field.attname, _coerce(field, raw, line))
+        fields.append(field.name)
+    obj.refresh_image_urls()
+    return fields + ["image_urls"]
+
+
+def _upsert(kind, chunk, existing, build):
+    """
+    chunk: [(line, row, key)], existing: {key: instance}. Rows repeating a
+    key within the chunk update the same pending object.
+    """
+    model = MODELS[kind]
+    pending, new = dict(existing), []
+    changed, update_fields = {}, set()
+    for line, row, key in chunk:
+        obj = pending.get(key)
+        if obj is None:
+            obj = pending[key] = build(key)
+            new.append(obj)
+        update_fields.update(_apply(obj, kind, row, line))
+        if obj.pk is not None:
+            changed[obj.pk] = obj
+    model.objects.bulk_create(new)
+    if changed:
+        model.objects.bulk_update(list(changed.values()), sorted(update_fields))
+    return len(new), len(changed)
+
+
+def _import_categories(chunk):
+    keyed = [(line, row, _key_value(row, "name")) for line, row in chunk]
+    for line, row, key in keyed:
+        if key is None:
+            raise CatalogImportError(line, "name is required")
+    existing = {c.name: c for c in Category.objects.filter(name__in={key for _, _, key in keyed})}
+    return _upsert("category", keyed, existing, lambda key: Category(name=key)), []
+
+
+def _category_ids(chunk):
+    names = {_key_value(row, "category") for _, row in chunk}
+    ids = dict(Category.objects.filter(name__in=names).values_list("name", "pk"))
+    for line, row in chunk:
+        if _key_value(row, "category") not in ids:
+            raise CatalogImportError(line, f"unknown category {row.get('category')!r}")
+    return ids
+
+
+def _import_products(chunk):
+    category_ids = _category_ids(chunk)
+    keyed = []
+    for line, row in chunk:
+        name = _key_value(row, "name")
+        if name is None:
+            raise CatalogImportError(line, "name is required")
+        keyed.append((line, row, (category_ids[_key_value(row, "category")], name)))
+    existing = {}
+    for product in Product.objects.filter(
+        category_id__in={key[0] for _, _, key in keyed}, name__in={key[1] for _, _, key in keyed}
+    ).order_by("-pk"):
+        existing[product.category_id, product.name] = product  # oldest duplicate wins
+    counts = _upsert("product", keyed, existing, lambda key: Product(category_id=key[0], name=key[1]))
+    return counts, [p.pk for p in existing.values()]
+
+
+def _import_variants(chunk):
+    wanted = {(_key_value(row, "category"), _key_value(row, "product")) for _, row in chunk}
+    product_ids = {}
+    for category, name, pk in (
+        Product.objects.filter(
+            category__name__in={c for c, _ in wanted}, name__in={p for _, p in wanted}
+        ).order_by("-pk").values_list("category__name", "name", "pk")
+    ):
+        product_ids[category, name] = pk
+    keyed = []
+    for line, row in chunk:
+        product_id = product_ids.get((_key_value(row, "category"), _key_value(row, "product")))
+        if product_id is None:
+            raise CatalogImportError(line, f"unknown product {row.get('product')!r} in {row.get('category')!r}")
+        keyed.append((line, row, (product_id, _key_value(row, "color_name"), _key_value(row, "storage_option"))))
+    existing = {}
+    for variant in ProductVariant.objects.filter(product_id__in=set(product_ids.values())).order_by("-pk"):
+        existing[variant.product_id, variant.color_name or None, variant.storage_option or None] = variant
+    counts = _upsert(
+        "variant", keyed, existing,
+        lambda key: ProductVariant(product_id=key[0], color_name=key[1], storage_option=key[2]),
+    )
+    return counts, list(set(product_ids.values()))
+
+
+IMPORTERS = {"category": _import_categories, "product": _import_products, "variant": _import_variants}
+
+
+def import_rows(kind, rows, chunk_size=1000):
+    """Upsert (line, row) pairs chunk by chunk; returns (created, updated)."""
+    created = updated = 0
+    rows = iter(rows)
+    try:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            try:
+                with transaction.atomic():
+                    (new, changed), product_ids = IMPORTERS[kind](chunk)
+                    if product_ids:
+                        # Bulk writes skip the price signal that reprices carts.
+                        recalculate_cart_totals(Cart.objects.filter(
+                            pk__in=CartItem.objects.filter(product_id__in=product_ids).values("cart_id")
+                        ))
+            except (DataError, IntegrityError) as exc:
+                raise CatalogImportError(chunk[0][0], str(exc), last_line=chunk[-1][0]) from exc
+            created += new
+            updated += changed
+    finally:
+        # ...and the catalog cache/search signals, so invalidate once.
+        if created or updated:
+            CatalogVersion.bump()
+            bump_versions("catalog")
+            InvertedIndexBackend.reset()
+            SuggestionIndex.reset()
+    return created, updated
@@ -0,0 +1,380 @@
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Subquery, Sum, Value,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .cache import bump_versions
+from .models import (
+    Cart, CartItem, CatalogVersion, Order, OrderItem, Product, ProductVariant, StockReservation,
+)
+
+
+class InsufficientStock(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Some items are no longer available in the requested quantity."
+    default_code = "insufficient_stock"
+
+    def __init__(self, shortages):
+        super().__init__()
+        # Set directly: the base class would coerce the numbers to strings.
+        self.detail = {"detail": self.default_detail, "items": shortages}
+
+
+class EmptyCart(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = "The cart is empty."
+    default_code = "empty_cart"
+
+
+# =======================
+#  CART OPERATIONS
+# =======================
+# Cart.item_count/subtotal and Order.item_count/total_amount are stored, so
+# the summary endpoint and order lists never sum items. The write paths here
+# adjust them by deltas in the same transaction as the item change; admin
+# edits, cascade deletes and catalog price changes fall back to
+# recalculate_*_totals(), one UPDATE with correlated subqueries.
+#
+# An order's total_amount is what the customer was charged. It is fixed at
+# checkout and only recomputed for orders built from their items (seeding);
+# item edits afterwards recount item_count and leave the amount alone.
+
+def _cart_line_total():
+    return ExpressionWrapper(
+        F("quantity") * Coalesce("variant__price", "product__price"),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def recalculate_cart_totals(carts):
+    """Recompute the stored totals of every cart in the `carts` queryset."""
+    items = CartItem.objects.filter(cart=OuterRef("pk")).order_by().values("cart")
+    carts.update(
+        item_count=Coalesce(
+            Subquery(items.annotate(n=Sum("quantity")).values("n"), output_field=IntegerField()), Value(0)
+        ),
+        subtotal=Coalesce(
+            Subquery(items.annotate(t=Sum(_cart_line_total())).values("t"),
+                     output_field=DecimalField(max_digits=12, decimal_places=2)),
+            Value(Decimal("0.00")),
+        ),
+    )
+
+
+def recalculate_order_totals(orders, amounts=True):
+    """
+    Recompute item_count of every order in `orders`, and total_amount too
+    unless `amounts` is False.
+    """
+    items = OrderItem.objects.filter(order=OuterRef("pk")).order_by().values("order")
+    totals = {
+        "item_count": Coalesce(
+            Subquery(items.annotate(n=Sum("quantity")).values("n"), output_field=IntegerField()), Value(0)
+        ),
+    }
+    if amounts:
+        line_total = ExpressionWrapper(F("quantity") * F("price"), output_field=DecimalField(max_digits=12, decimal_places=2))
+        totals["total_amount"] = Coalesce(
+            Subquery(items.annotate(t=Sum(line_total)).values("t"),
+                     output_field=DecimalField(max_digits=12, decimal_places=2)),
+            Value(Decimal("0.00")),
+        )
+    orders.update(**totals)
+
+
+def _unit_prices(keys):
+    """Return {(product_id, variant_id): current unit price} in two queries."""
+    product_ids = {pid for pid, _ in keys}
+    variant_ids = {vid for _, vid in keys if vid is not None}
+    products = dict(Product.objects.filter(pk__in=product_ids).values_list("pk", "price"))
+    variants = dict(
+        ProductVariant.objects.filter(pk__in=variant_ids).values_list("pk", "price")
+    ) if variant_ids else {}
+    return {
+        (pid, vid): variants.get(vid) if variants.get(vid) is not None else products[pid]
+        for pid, vid in keys
+    }
+
+
+def apply_cart_operations(cart, operations):
+    """
+    Apply validated CartOperationSerializer data to `cart` in one transaction:
+    one read of the current lines, then at most one bulk_create, one
+    bulk_update and one delete, and the cart totals move by the difference.
+    Returns (lines, {"item_count", "subtotal"}).
+    """
+    with transaction.atomic():
+        item_count, subtotal = (
+            Cart.objects.select_for_update().filter(pk=cart.pk).values_list("item_count", "subtotal").get()
+        )
+        lines = {}
+        for item in CartItem.objects.filter(cart=cart).order_by("pk"):
+            lines.setdefault((item.product_id, item.variant_id), item)
+        existing = dict(lines)
+        original = {key: (item.pk, item.quantity) for key, item in lines.items()}
+
+        for op in operations:
+            key = (op["product"], op["variant"])
+            item = lines.get(key)
+            if op["op"] == "remove" or (op["op"] == "set" and op["quantity"] == 0):
+                lines.pop(key, None)
+            elif item is None:
+                # Re-adding a line removed earlier in the batch reuses its row.
+                item = existing.get(key) or CartItem(cart=cart, product_id=key[0], variant_id=key[1])
+                item.quantity = op["quantity"]
+                lines[key] = item
+            elif op["op"] == "add":
+                item.quantity += op["quantity"]
+            else:
+                item.quantity = op["quantity"]
+
+        removed = [pk for key, (pk, _) in original.items() if key not in lines]
+        new = [item for item in lines.values() if item.pk is None]
+        changed = [
+            item for key, item in lines.items()
+            if item.pk is not None and item.quantity != original[key][1]
+        ]
+        if removed:
+            CartItem.objects.filter(pk__in=removed).delete()
+        CartItem.objects.bulk_create(new)
+        CartItem.objects.bulk_update(changed, ["quantity"])
+
+        deltas = Counter()
+        for key, (_, quantity) in original.items():
+            deltas[key] -= quantity
+        for key, item in lines.items():
+            deltas[key] += item.quantity
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if deltas:
+            prices = _unit_prices(deltas)
+            count_delta = sum(deltas.values())
+            amount_delta = sum((prices[key] * delta for key, delta in deltas.items()), Decimal("0.00"))
+            Cart.objects.filter(pk=cart.pk).update(
+                item_count=F("item_count") + count_delta, subtotal=F("subtotal") + amount_delta,
+            )
+            item_count += count_delta
+            subtotal += amount_delta
+    return list(lines.values()), {"item_count": item_count, "subtotal": subtotal}
+
+
+# =======================
+#  STOCK RESERVATIONS
+# =======================
+# Flash-deal items in a cart hold their stock for STOCK_RESERVATION_SECONDS.
+# A hold is a row, not a lock: reserving locks the stock row only for the
+# few milliseconds it takes to check availability and write the hold, and
+# expired holds stop counting the moment they expire, sweeper or not.
+#
+# Stock lives on the variant for variant lines and on the product otherwise,
+# so every line is keyed by (product_id, variant_id) with variant_id None for
+# product-level lines.
+
+def reservation_ttl():
+    return timedelta(seconds=getattr(settings, "STOCK_RESERVATION_SECONDS", 600))
+
+
+def active_reservations(now=None, exclude_cart=None):
+    queryset = StockReservation.objects.filter(expires_at__gt=now or timezone.now())
+    if exclude_cart is not None:
+        queryset = queryset.exclude(cart_item__cart=exclude_cart)
+    return queryset
+
+
+def with_available_stock(queryset, now=None, exclude_cart=None):
+    """
+    Annotate products or variants with `available_stock` = stock - active
+    holds. Product holds only count product-level lines.
+    """
+    if queryset.model is ProductVariant:
+        held = active_reservations(now, exclude_cart).filter(variant_id=OuterRef("pk"))
+        group = "variant_id"
+    else:
+        held = active_reservations(now, exclude_cart).filter(product_id=OuterRef("pk"), variant__isnull=True)
+        group = "product_id"
+    held = held.values(group).annotate(held=Sum("quantity")).values("held")
+    return queryset.annotate(
+        available_stock=F("stock") - Coalesce(Subquery(held, output_field=IntegerField()), Value(0))
+    )
+
+
+def lock_available_stock(keys, cart, now=None):
+    """
+    Lock the stock rows behind `keys` -- products, then variants, each in
+    primary-key order -- and return {(product_id, variant_id): available},
+    not counting holds that belong to `cart` itself.
+    """
+    product_ids = sorted({pid for pid, vid in keys if vid is None})
+    variant_ids = sorted({vid for pid, vid in keys if vid is not None})
+    available = {}
+    if product_ids:
+        rows = with_available_stock(
+            Product.objects.select_for_update().filter(pk__in=product_ids).order_by("pk"),
+            now=now, exclude_cart=cart,
+        ).values_list("pk", "available_stock")
+        available.update(((pk, None), units) for pk, units in rows)
+    if variant_ids:
+        rows = with_available_stock(
+            ProductVariant.objects.select_for_update().filter(pk__in=variant_ids).order_by("pk"),
+            now=now, exclude_cart=cart,
+        ).values_list("product_id", "pk", "available_stock")
+        available.update(((pid, vid), units) for pid, vid, units in rows)
+    return available
+
+
+def _line_order(line):
+    (product_id, variant_id), _ = line
+    return product_id, variant_id or 0
+
+
+def check_shortages(wanted, available):
+    shortages = [
+        {"product": pid, "variant": vid, "requested": qty, "available": max(available.get((pid, vid), 0), 0)}
+        for (pid, vid), qty in sorted(wanted.items(), key=_line_order)
+        if available.get((pid, vid), 0) < qty
+    ]
+    if shortages:
+        raise InsufficientStock(shortages)
+
+
+def reserve_cart(cart, deals_only=True):
+    """
+    Hold stock for the cart's items (flash deals only by default) and extend
+    existing holds. All-or-nothing: raises InsufficientStock with per-line
+    shortages and leaves earlier holds untouched. Returns the hold expiry.
+    """
+    now = timezone.now()
+    expires_at = now + reservation_ttl()
+    with transaction.atomic():
+        items = CartItem.objects.filter(cart=cart).select_related("reservation")
+        if deals_only:
+            items = items.filter(product__is_deal_of_the_day=True)
+        items = list(items.only("cart_item_id", "product_id", "variant_id", "quantity", "reservation"))
+        if not items:
+            return None
+
+        wanted = Counter()
+        for item in items:
+            wanted[item.product_id, item.variant_id] += item.quantity
+        # Same lock order as checkout, held only for this short block.
+        check_shortages(wanted, lock_available_stock(wanted, cart, now=now))
+
+        existing, new = [], []
+        for item in items:
+            reservation = getattr(item, "reservation", None)
+            if reservation is None:
+                new.append(StockReservation(
+                    cart_item=item, product_id=item.product_id, variant_id=item.variant_id,
+                    quantity=item.quantity, expires_at=expires_at,
+                ))
+            else:
+                reservation.variant_id = item.variant_id
+                reservation.quantity = item.quantity
+                reservation.expires_at = expires_at
+                existing.append(reservation)
+        StockReservation.objects.bulk_create(new)
+        StockReservation.objects.bulk_update(existing, ["variant", "quantity", "expires_at"])
+    return expires_at
+
+
+def release_expired(batch_size=1000, now=None):
+    """Delete expired holds in primary-key batches; returns rows deleted."""
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        ids = list(
+            StockReservation.objects.filter(expires_at__lte=now)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += StockReservation.objects.filter(pk__in=ids).delete()[0]
+
+
+# =======================
+#  CHECKOUT
+# =======================
+# Turning a cart into an order is the one write path that races: every buyer
+# on a sale day decrements the same few stock rows. The whole conversion runs
+# in one transaction:
+#
+#   1. lock the cart (a double-tapped checkout button waits instead of
+#      ordering twice), then the stock rows with SELECT ... FOR UPDATE in a
+#      fixed order (products, then variants, each by primary key) so two
+#      carts sharing items cannot deadlock each other;
+#   2. check stock minus other carts' active holds against the locked rows and
+#      fail the whole checkout if any line is short;
+#   3. decrement with `stock = stock - n WHERE stock >= n`, so even a backend
+#      without row locks (SQLite) cannot go below zero;
+#   4. bulk_create the order items and empty the cart, which also drops the
+#      cart's own holds;
+#   5. on commit, bump the catalog version and cache namespaces.
+
+def checkout(cart, shipping_address=None):
+    """Convert `cart` into an Order, decrementing stock. Returns the order."""
+    with transaction.atomic():
+        list(Cart.objects.select_for_update().filter(pk=cart.pk).values_list("pk"))
+        items = list(
+            CartItem.objects.filter(cart=cart)
+            .select_related("product", "variant")
+            .only("product__id", "product__category_id", "product__price",
+                  "variant__id", "variant__price", "quantity", "cart_id")
+        )
+        if not items:
+            raise EmptyCart()
+
+        wanted = Counter()
+        prices = {}
+        for item in items:
+            wanted[item.product_id, item.variant_id] += item.quantity
+            prices[item.product_id, item.variant_id] = item.unit_price
+        check_shortages(wanted, lock_available_stock(wanted, cart))
+
+        for (product_id, variant_id), quantity in sorted(wanted.items(), key=_line_order):
+            if variant_id is None:
+                rows = Product.objects.filter(pk=product_id)
+            else:
+                rows = ProductVariant.objects.filter(pk=variant_id)
+            if not rows.filter(stock__gte=quantity).update(stock=F("stock") - quantity):
+                # Only reachable without row locks: another checkout won the race.
+                raise InsufficientStock([{
+                    "product": product_id,
+                    "variant": variant_id,
+                    "requested": quantity,
+                    "available": rows.values_list("stock", flat=True).first() or 0,
+                }])
+
+        order = Order.objects.create(
+            user_id=cart.user_id,
+            shipping_address=shipping_address,
+            total_amount=sum((prices[key] * qty for key, qty in wanted.items()), Decimal("0.00")),
+            item_count=sum(wanted.values()),
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=pid, variant_id=vid, quantity=qty, price=prices[pid, vid])
+            for (pid, vid), qty in wanted.items()
+        ])
+        CartItem.objects.filter(cart=cart).delete()
+        Cart.objects.filter(pk=cart.pk).update(item_count=0, subtotal=Decimal("0.00"))
+
+        # Queryset updates skip the catalog signals; stock is part of the
+        # product payload, so invalidate here. The stamp is one hot row every
+        # admin save also writes: bump it after commit, once the stock locks
+        # are released, or checkouts queue behind each other on it.
+        transaction.on_commit(CatalogVersion.bump)
+        bump_versions(
+            "product-list",
+            "category-list",
+            *{f"product:{item.product_id}" for item in items},
+            *{f"category:{item.product.category_id}" for item in items},
+        )
+    return order
@@ -0,0 +1,123 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+# =======================
+#  TUNABLE HASHERS
+# =======================
+# Same algorithm names as Django's hashers, so existing hashes keep
+# verifying; only the work factors come from settings (see PASSWORD_* in
+# settings.py). Django's check_password() reports a hash as outdated when
+# its algorithm or parameters differ from the preferred hasher, and
+# verify_password() below then stores a fresh hash.
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return getattr(settings, "PASSWORD_PBKDF2_ITERATIONS", hashers.PBKDF2PasswordHasher.iterations)
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Needs the argon2-cffi package."""
+    @property
+    def time_cost(self):
+        return getattr(settings, "PASSWORD_ARGON2_TIME_COST", hashers.Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, "PASSWORD_ARGON2_MEMORY_COST", hashers.Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, "PASSWORD_ARGON2_PARALLELISM", hashers.Argon2PasswordHasher.parallelism)
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return getattr(settings, "PASSWORD_SCRYPT_WORK_FACTOR", hashers.ScryptPasswordHasher.work_factor)
+
+
+# =======================
+#  HASHING POOL
+# =======================
+# Hashing is deliberately slow. Running it on a small, fixed pool caps how
+# many cores sign-up/login spikes can take from the rest of the API; hashlib
+# and argon2 release the GIL, so the pool threads run in parallel. Requests
+# that cannot get a slot within PASSWORD_HASH_TIMEOUT seconds get a 503
+# instead of piling up behind the pool.
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many sign-in attempts right now, please retry shortly."
+    default_code = "hashing_busy"
+
+
+class HashingPool:
+    def __init__(self, workers, queue, timeout):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        # Running plus waiting jobs; beyond this callers are turned away.
+        self.slots = threading.BoundedSemaphore(workers + queue)
+        self.timeout = timeout
+
+    def run(self, fn, *args):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise HashingBusy()
+        try:
+            return self.executor.submit(fn, *args).result()
+        finally:
+            self.slots.release()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool(
+                    workers=getattr(settings, "PASSWORD_HASH_WORKERS", 4),
+                    queue=getattr(settings, "PASSWORD_HASH_QUEUE", 32),
+                    timeout=getattr(settings, "PASSWORD_HASH_TIMEOUT", 10),
+                )
+    return _pool
+
+
+@receiver(setting_changed)
+def reset_pool(setting, **kwargs):
+    global _pool
+    if setting.startswith("PASSWORD_HASH_"):
+        _pool = None
+
+
+def _check(raw_password, encoded):
+    outdated = []
+    valid = hashers.check_password(raw_password, encoded, setter=lambda raw: outdated.append(True))
+    return valid, bool(outdated)
+
+
+def hash_password(raw_password):
+    """make_password() on the hashing pool."""
+    return get_pool().run(hashers.make_password, raw_password)
+
+
+def verify_password(user, raw_password):
+    """
+    user.check_password() with the hashing on the pool. An outdated hash is
+    replaced in the calling thread, which owns the request's DB connection.
+    """
+    valid, outdated = get_pool().run(_check, raw_password, user.password)
+    if valid and outdated:
+        user.password = hash_password(raw_password)
+        user.save(update_fields=["password"])
+    return valid
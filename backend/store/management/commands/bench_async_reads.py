@@ -0,0 +1,159 @@
+import asyncio
+import io
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.urls import include, path
+
+from store.async_views import async_read_routes
+from store.models import Product
+from store.urls import router
+
+
+def urlconf(async_reads):
+    patterns = async_read_routes(router.urls) if async_reads else router.urls
+
+    class URLConf:
+        urlpatterns = [path("api/", include(patterns))]
+    return URLConf
+
+
+class Command(BaseCommand):
+    help = (
+        "In-process load test of the catalog read endpoints: the WSGI path "
+        "(sync views on a thread pool, like a threaded WSGI server) against "
+        "the ASGI handler with the sync views and with the async read views, "
+        "at the same concurrency. Pass --no-cache to measure cache misses and "
+        "--db-latency to add a network round trip to every query, as against "
+        "a remote MySQL server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=2000, help="Total requests per run.")
+        parser.add_argument("--threads", type=int, default=8,
+                            help="Worker threads of the simulated WSGI server.")
+        parser.add_argument("--no-cache", action="store_true",
+                            help="Disable the catalog response cache.")
+        parser.add_argument("--db-latency", type=float, default=0,
+                            help="Milliseconds to sleep before every query.")
+
+    def handle(self, *args, **options):
+        product = Product.objects.order_by("pk").first()
+        self.paths = ["/api/products/", "/api/categories/"]
+        if product is not None:
+            self.paths.append(f"/api/products/{product.pk}/")
+        latency = options["db_latency"] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def add_latency(connection, **kwargs):
+            # Fires on every reconnect of a thread's (reused) wrapper.
+            if slow_query not in connection.execute_wrappers:
+                connection.execute_wrappers.append(slow_query)
+
+        if latency:
+            connection_created.connect(add_latency, weak=False)
+            connections.close_all()
+        caches = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        extra = {"CACHES": caches} if options["no_cache"] else {}
+
+        self.stdout.write(
+            f"{options['requests']} requests, {options['concurrency']} concurrent, over {', '.join(self.paths)}"
+        )
+        self.stdout.write(f"{'path':<24}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+        runs = [
+            ("WSGI, sync views", False, self._run_wsgi),
+            ("ASGI, sync views", False, self._run_asgi),
+            ("ASGI, async views", True, self._run_asgi),
+        ]
+        for label, async_reads, run in runs:
+            with override_settings(ROOT_URLCONF=urlconf(async_reads), **extra):
+                run(options, warmup=True)
+                start = time.perf_counter()
+                timings, errors = run(options)
+                elapsed = time.perf_counter() - start
+            connections.close_all()
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f"{label:<24}{len(timings) / elapsed:>10.0f}{statistics.median(timings):>10.2f}"
+                f"{p95:>10.2f}{errors:>8}"
+            )
+
+    def _targets(self, options, warmup):
+        total = len(self.paths) * 2 if warmup else options["requests"]
+        return [self.paths[i % len(self.paths)] for i in range(total)]
+
+    # -----------------------
+    #  WSGI
+    # -----------------------
+    def _run_wsgi(self, options, warmup=False):
+        handler = WSGIHandler()
+
+        def request(target):
+            environ = {
+                "REQUEST_METHOD": "GET", "PATH_INFO": target, "QUERY_STRING": "",
+                "SERVER_NAME": "localhost", "SERVER_PORT": "80", "HTTP_HOST": "localhost",
+                "wsgi.input": io.BytesIO(b""), "wsgi.url_scheme": "http",
+            }
+            status = []
+            start = time.perf_counter()
+            body = handler(environ, lambda s, headers: status.append(s))
+            b"".join(body)
+            body.close()
+            return (time.perf_counter() - start) * 1000, not status[0].startswith("200")
+
+        # Requests beyond the thread count queue, as in a threaded server.
+        with ThreadPoolExecutor(max_workers=min(options["threads"], options["concurrency"])) as pool:
+            results = list(pool.map(request, self._targets(options, warmup)))
+        return [t for t, _ in results], sum(e for _, e in results)
+
+    # -----------------------
+    #  ASGI
+    # -----------------------
+    def _run_asgi(self, options, warmup=False):
+        return asyncio.run(self._asgi_load(ASGIHandler(), self._targets(options, warmup), options["concurrency"]))
+
+    async def _asgi_load(self, handler, targets, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request(target):
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+                "method": "GET", "scheme": "http", "path": target, "raw_path": target.encode(),
+                "query_string": b"", "root_path": "", "headers": [(b"host", b"localhost")],
+                "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+            }
+            sent = asyncio.Event()
+            messages = [{"type": "http.request", "body": b"", "more_body": False}]
+            status = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await sent.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status.append(message["status"])
+                elif not message.get("more_body"):
+                    sent.set()
+
+            async with semaphore:
+                start = time.perf_counter()
+                await handler(scope, receive, send)
+                return (time.perf_counter() - start) * 1000, status[0] != 200
+
+        results = await asyncio.gather(*(request(target) for target in targets))
+        return [t for t, _ in results], sum(e for _, e in results)
@@ -0,0 +1,59 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-request database connection overhead: a request cycle "
+        "(request_started, one tiny query, request_finished) with "
+        "reconnect-per-request, persistent connections, and persistent "
+        "connections with health checks. Run once with DB_POOL=1 to measure "
+        "the pooled backend instead of reconnecting."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        settings_dict = connection.settings_dict
+        original = settings_dict["CONN_MAX_AGE"], settings_dict["CONN_HEALTH_CHECKS"]
+        pooled = settings_dict["ENGINE"] == "store.pooled_mysql"
+        modes = [
+            ("pool checkout" if pooled else "reconnect", 0, False),
+            ("persistent", 600, False),
+            ("persistent + health check", 600, True),
+        ]
+        self.stdout.write(f"{settings_dict['ENGINE']}, {options['requests']} requests per mode")
+        self.stdout.write(f"{'mode':<28}{'p50 ms':>10}{'p95 ms':>10}{'req/s':>10}")
+        try:
+            for label, max_age, health_checks in modes:
+                connection.close()
+                settings_dict["CONN_MAX_AGE"], settings_dict["CONN_HEALTH_CHECKS"] = max_age, health_checks
+                timings = self._run(connection, options["requests"])
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                self.stdout.write(
+                    f"{label:<28}{statistics.median(timings):>10.3f}{p95:>10.3f}"
+                    f"{1000 * len(timings) / sum(timings):>10.0f}"
+                )
+        finally:
+            settings_dict["CONN_MAX_AGE"], settings_dict["CONN_HEALTH_CHECKS"] = original
+            connection.close()
+
+    def _run(self, connection, requests):
+        timings = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            request_started.send(sender=self.__class__)
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            request_finished.send(sender=self.__class__)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return timings
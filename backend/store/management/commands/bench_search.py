@@ -0,0 +1,75 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.models import Product
+from store.search import InvertedIndex, get_search_backend
+
+WORDS = [
+    "apple", "iphone", "samsung", "galaxy", "pixel", "redmi", "tecno", "infinix",
+    "pro", "max", "ultra", "lite", "plus", "mini", "case", "charger", "cable",
+    "earbuds", "watch", "tablet", "laptop", "speaker", "screen", "protector",
+    "wireless", "fast", "original", "leather", "silicone", "black", "white", "blue",
+]
+QUERIES = ["iph", "iphone pro", "gal ultra", "wireless char", "s24", "s", "leather black x1", "zzz"]
+
+
+class Command(BaseCommand):
+    help = "Measure product search latency: in-memory index at scale, then the configured backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100_000,
+                            help="Synthetic documents for the in-memory index benchmark.")
+        parser.add_argument("--runs", type=int, default=50)
+        parser.add_argument("--skip-db", action="store_true",
+                            help="Only benchmark the in-memory index, not the database backend.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        rows = [
+            (
+                pk,
+                " ".join(rng.choices(WORDS, k=3) + [f"{rng.choice('asxmz')}{rng.randint(1, 999)}"]),
+                " ".join(rng.choices(WORDS, k=25)),
+            )
+            for pk in range(1, options["products"] + 1)
+        ]
+
+        start = time.perf_counter()
+        index = InvertedIndex(["name", "description"])
+        index.build(rows)
+        self.stdout.write(
+            f"In-memory index: {len(rows)} products built in {time.perf_counter() - start:.2f}s"
+        )
+        self._report(lambda q: index.search([q]), options["runs"])
+
+        if options["skip_db"]:
+            return
+        backend = get_search_backend()
+        count = Product.objects.count()
+        self.stdout.write(f"\n{type(backend).__name__} over {count} products in the database")
+        backend.search(Product.objects.all(), ["warmup"], ["name", "description"]).exists()
+        self._report(
+            lambda q: list(
+                backend.search(Product.objects.all(), q.split(), ["name", "description"])
+                .order_by("-search_rank")
+                .values_list("pk", flat=True)[:20]
+            ),
+            options["runs"],
+        )
+
+    def _report(self, run, runs):
+        self.stdout.write(f"{'query':<16}{'hits':>8}{'p50 ms':>10}{'p95 ms':>10}")
+        for query in QUERIES:
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                hits = run(query)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f"{query:<16}{len(hits):>8}{statistics.median(timings):>10.2f}{p95:>10.2f}"
+            )
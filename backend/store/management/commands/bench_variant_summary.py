@@ -0,0 +1,95 @@
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.models import Product, ProductVariant
+from store.serializers import summarize_variants
+
+
+# =======================
+#  PRE-SINGLE-PASS REFERENCE
+# =======================
+# The four walks ProductSerializer used to make, kept here as the baseline.
+def legacy_summary(product):
+    colors, seen = [], set()
+    for v in product.variants.all():
+        key = (v.color_name, v.color_code)
+        if key not in seen:
+            seen.add(key)
+            colors.append({"color_name": v.color_name, "color_hex": v.color_code})
+
+    storages, seen = [], set()
+    for v in product.variants.all():
+        s = v.storage_option
+        if s and s not in seen:
+            seen.add(s)
+            storages.append(s)
+
+    availability = {}
+    for v in product.variants.all():
+        key = v.color_code or v.color_name or f"color_{v.id}"
+        if key not in availability:
+            availability[key] = []
+        if v.storage_option and v.storage_option not in availability[key]:
+            availability[key].append(v.storage_option)
+
+    by_storage = {}
+    for v in product.variants.all():
+        s = v.storage_option or "default"
+        key = v.color_code or v.color_name or f"color_{v.id}"
+        if s not in by_storage:
+            by_storage[s] = []
+        if key not in by_storage[s]:
+            by_storage[s].append(key)
+
+    return {
+        "available_colors": colors,
+        "available_storages": storages,
+        "availability_map": availability,
+        "storage_map": by_storage,
+    }
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark ProductSerializer variant aggregation (no database access)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--variants", type=int, nargs="+", default=[10, 50, 200, 1000])
+        parser.add_argument("--repeat", type=int, default=200)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'variants':>8}  {'legacy µs':>10}  {'single µs':>10}  {'speedup':>7}")
+        for count in options["variants"]:
+            product = self._build_product(count)
+            single_pass = lambda: summarize_variants(product.variants.all())
+            if legacy_summary(product) != single_pass():
+                raise CommandError(f"summarize_variants() disagrees with the reference for {count} variants")
+
+            repeat = options["repeat"]
+            legacy = min(timeit.repeat(lambda: legacy_summary(product), number=repeat, repeat=5))
+            single = min(timeit.repeat(single_pass, number=repeat, repeat=5))
+            self.stdout.write(
+                f"{count:>8}  {legacy / repeat * 1e6:>10.1f}  {single / repeat * 1e6:>10.1f}  "
+                f"{legacy / single:>6.1f}x"
+            )
+
+    def _build_product(self, count):
+        # Unsaved rows served from the prefetch cache, exactly as the viewsets
+        # hand them to the serializer after prefetch_related("variants").
+        product = Product(id=1, name="Bench")
+        colors = max(1, int(count ** 0.5))
+        variants = [
+            ProductVariant(
+                id=i + 1,
+                product=product,
+                color_name=f"Color {i % colors}",
+                color_code=f"#{i % colors:06x}",
+                storage_option=f"{(i // colors) * 64}GB",
+            )
+            for i in range(count)
+        ]
+        queryset = ProductVariant.objects.filter(product=product)
+        queryset._result_cache = variants
+        queryset._prefetch_done = True
+        product._prefetched_objects_cache = {"variants": queryset}
+        return product
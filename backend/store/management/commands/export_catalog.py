@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.catalog_io import COLUMNS, FORMATS, export_rows, write_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream categories, products or variants to CSV or JSONL, keyed by "
+        "natural keys so the file can be loaded with import_catalog elsewhere."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(COLUMNS))
+        parser.add_argument("output", nargs="?", default="-", help="File path, or - for stdout.")
+        parser.add_argument("--format", choices=FORMATS,
+                            help="Defaults to the output file's extension, else csv.")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        fmt = options["format"] or (output.rsplit(".", 1)[-1] if output.endswith(FORMATS) else "csv")
+        if fmt not in FORMATS:
+            raise CommandError(f"Unknown format {fmt!r}")
+
+        rows = export_rows(options["kind"], chunk_size=options["chunk_size"])
+        if output == "-":
+            count = write_rows(sys.stdout, options["kind"], fmt, rows)
+        else:
+            with open(output, "w", newline="", encoding="utf-8") as stream:
+                count = write_rows(stream, options["kind"], fmt, rows)
+        self.stderr.write(f"Exported {count} {options['kind']} rows")
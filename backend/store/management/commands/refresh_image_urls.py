@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from store.cache import bump_versions
+from store.models import CatalogVersion, Category, Product, ProductVariant
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the precomputed Cloudinary URLs in `image_urls`, e.g. after "
+        "bulk imports or a change to IMAGE_SIZES."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        for model in (Category, Product, ProductVariant):
+            fields = model.IMAGE_FIELDS
+            batch, total = [], 0
+            for row in model.objects.only("pk", *fields).iterator(chunk_size=batch_size):
+                row.refresh_image_urls()
+                batch.append(row)
+                if len(batch) == batch_size:
+                    model.objects.bulk_update(batch, ["image_urls"])
+                    total += len(batch)
+                    batch = []
+            model.objects.bulk_update(batch, ["image_urls"])
+            total += len(batch)
+            self.stdout.write(f"{model.__name__}: refreshed {total} rows")
+        # bulk_update() sends no signals, so drop cached responses and ETags
+        # that still carry the old URLs.
+        CatalogVersion.bump()
+        bump_versions("catalog")
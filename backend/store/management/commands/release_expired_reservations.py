@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.checkout import release_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired stock reservations in batches. Expired holds already "
+        "stop counting against stock; this keeps the table small. Run from "
+        "cron, or with --interval as a long-lived sweeper."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--interval", type=float, default=0,
+                            help="Seconds between sweeps; 0 sweeps once and exits.")
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = release_expired(batch_size=options["batch_size"])
+            self.stdout.write(f"Released {deleted} expired reservations")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
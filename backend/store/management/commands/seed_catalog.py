@@ -0,0 +1,124 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.checkout import recalculate_cart_totals, recalculate_order_totals
+from store.models import (
+    Cart, CartItem, Category, CustomUser, Order, OrderItem, Product, ProductVariant,
+)
+
+COLORS = [
+    ("Black", "#000000"), ("White", "#ffffff"), ("Blue", "#1e40af"),
+    ("Red", "#b91c1c"), ("Green", "#15803d"), ("Gold", "#ca8a04"),
+]
+STORAGES = ["64GB", "128GB", "256GB", "512GB", "1TB"]
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic catalog, users, carts and orders for benchmarks and load tests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--categories", type=int, default=10)
+        parser.add_argument("--products-per-category", type=int, default=50)
+        parser.add_argument("--variants-per-product", type=int, default=6)
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--cart-items", type=int, default=5, help="Items in each user's cart.")
+        parser.add_argument("--orders-per-user", type=int, default=3)
+        parser.add_argument("--items-per-order", type=int, default=4)
+        parser.add_argument("--password", default="password123", help="Password for every seeded user.")
+        parser.add_argument("--prefix", default="seed", help="Prefix for generated names, keeps reruns unique.")
+        parser.add_argument("--random-seed", type=int, default=0)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rng = random.Random(options["random_seed"])
+        prefix = options["prefix"]
+
+        categories = self._bulk(Category, [
+            Category(name=f"{prefix} category {i}", description=f"Synthetic category {i}")
+            for i in range(options["categories"])
+        ], name__startswith=f"{prefix} category ")
+
+        products = self._bulk(Product, [
+            self._product(rng, category, f"{prefix} product {category.pk}-{i}")
+            for category in categories
+            for i in range(options["products_per_category"])
+        ], name__startswith=f"{prefix} product ")
+
+        combos = [(color, storage) for color in COLORS for storage in STORAGES]
+        ProductVariant.objects.bulk_create([
+            ProductVariant(
+                product=product,
+                color_name=color[0],
+                color_code=color[1],
+                storage_option=storage,
+                stock=rng.randint(0, 50),
+                price=product.price + Decimal(STORAGES.index(storage) * 50),
+            )
+            for product in products
+            for color, storage in rng.sample(combos, min(options["variants_per_product"], len(combos)))
+        ], batch_size=1000)
+
+        # Hash once; every seeded user shares the same password.
+        password = make_password(options["password"])
+        users = self._bulk(CustomUser, [
+            CustomUser(
+                email=f"{prefix}-user{i}@example.com",
+                username=f"{prefix}-user{i}",
+                # bulk_create skips save(), which normally fills these.
+                email_lower=f"{prefix}-user{i}@example.com".lower(),
+                username_lower=f"{prefix}-user{i}".lower(),
+                password=password,
+            )
+            for i in range(options["users"])
+        ], username__startswith=f"{prefix}-user")
+
+        carts = self._bulk(Cart, [Cart(user=user) for user in users], user__in=users)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=rng.randint(1, 3))
+            for cart in carts
+            for product in rng.sample(products, min(options["cart_items"], len(products)))
+        ], batch_size=1000)
+
+        orders = self._bulk(Order, [
+            Order(user=user, total_amount=Decimal("0.00"))
+            for user in users
+            for _ in range(options["orders_per_user"])
+        ], user__in=users)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=1, price=product.price)
+            for order in orders
+            for product in rng.sample(products, min(options["items_per_order"], len(products)))
+        ], batch_size=1000)
+        # bulk_create bypasses the incremental totals.
+        recalculate_cart_totals(Cart.objects.filter(pk__in=[cart.pk for cart in carts]))
+        recalculate_order_totals(Order.objects.filter(pk__in=[order.pk for order in orders]))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(categories)} categories, {len(products)} products, "
+            f"{len(users)} users, {len(carts)} carts and {len(orders)} orders."
+        ))
+
+    def _bulk(self, model, objects, **lookup):
+        # MySQL does not return primary keys from bulk_create, so re-read the
+        # rows we just inserted instead of relying on the in-memory objects.
+        model.objects.bulk_create(objects, batch_size=1000)
+        return list(model.objects.filter(**lookup).order_by("pk"))
+
+    def _product(self, rng, category, name):
+        price = Decimal(rng.randrange(5_000, 500_000)) / 100
+        return Product(
+            category=category,
+            name=name,
+            description=f"{name} synthetic description. " * 5,
+            price=price,
+            original_price=(price * Decimal("1.20")).quantize(Decimal("0.01")) if rng.random() < 0.3 else None,
+            stock=rng.randint(0, 100),
+            is_deal_of_the_day=rng.random() < 0.05,
+            is_featured=rng.random() < 0.1,
+            is_new=rng.random() < 0.2,
+            is_abroad_order=rng.random() < 0.1,
+        )
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# FULLTEXT indexes only exist on MySQL; other databases use the in-process
+# inverted index from store.search and skip these statements.
+FULLTEXT_INDEXES = [
+    ('store_product', 'product_fulltext_idx', ('name', 'description')),
+    ('store_category', 'category_fulltext_idx', ('name', 'description')),
+]
+
+
+def add_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    quote = schema_editor.quote_name
+    for table, name, columns in FULLTEXT_INDEXES:
+        schema_editor.execute(
+            'ALTER TABLE %s ADD FULLTEXT INDEX %s (%s)'
+            % (quote(table), quote(name), ', '.join(quote(c) for c in columns))
+        )
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    quote = schema_editor.quote_name
+    for table, name, _ in FULLTEXT_INDEXES:
+        schema_editor.execute('ALTER TABLE %s DROP INDEX %s' % (quote(table), quote(name)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_product_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_fulltext_indexes, drop_fulltext_indexes),
+    ]
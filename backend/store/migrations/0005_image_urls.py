@@ -0,0 +1,67 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:25
+
+from django.db import migrations, models
+
+# Frozen copy of store.models.IMAGE_SIZES / build_image_urls() as of this
+# migration, so later changes to them cannot break it. Rows are brought up
+# to date with `manage.py refresh_image_urls`.
+IMAGE_SIZES = {
+    'original': {},
+    'thumbnail': {'width': 300, 'height': 300, 'crop': 'fill', 'quality': 'auto', 'fetch_format': 'auto'},
+    'detail': {'width': 1080, 'crop': 'limit', 'quality': 'auto', 'fetch_format': 'auto'},
+}
+
+
+def build_image_urls(image):
+    if not image or not hasattr(image, 'build_url'):
+        return None
+    return {
+        size: image.build_url(**options) if options else image.url
+        for size, options in IMAGE_SIZES.items()
+    }
+
+
+IMAGE_FIELDS = {
+    'Category': ('image',),
+    'Product': ('main_image', 'image1', 'image2', 'image3', 'image4'),
+    'ProductVariant': ('image_main', 'image1', 'image2', 'image3', 'image4'),
+}
+
+
+def backfill_image_urls(apps, schema_editor):
+    for model_name, fields in IMAGE_FIELDS.items():
+        model = apps.get_model('store', model_name)
+        batch = []
+        for row in model.objects.only('pk', *fields).iterator(chunk_size=500):
+            row.image_urls = {name: build_image_urls(getattr(row, name)) for name in fields}
+            batch.append(row)
+            if len(batch) == 500:
+                model.objects.bulk_update(batch, ['image_urls'])
+                batch = []
+        model.objects.bulk_update(batch, ['image_urls'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_fulltext_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='image_urls',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_urls',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='image_urls',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(backfill_image_urls, migrations.RunPython.noop),
+    ]
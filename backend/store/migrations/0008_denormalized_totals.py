@@ -0,0 +1,64 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:34
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def _total(items, expression):
+    return Coalesce(
+        Subquery(items.annotate(t=Sum(expression)).values('t'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        Value(Decimal('0.00')),
+    )
+
+
+def _count(items):
+    return Coalesce(Subquery(items.annotate(n=Sum('quantity')).values('n'), output_field=IntegerField()), Value(0))
+
+
+def backfill_totals(apps, schema_editor):
+    Cart = apps.get_model('store', 'Cart')
+    CartItem = apps.get_model('store', 'CartItem')
+    Order = apps.get_model('store', 'Order')
+    OrderItem = apps.get_model('store', 'OrderItem')
+    money = DecimalField(max_digits=12, decimal_places=2)
+
+    cart_items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    Cart.objects.update(
+        item_count=_count(cart_items),
+        subtotal=_total(cart_items, ExpressionWrapper(
+            F('quantity') * Coalesce('variant__price', 'product__price'), output_field=money,
+        )),
+    )
+    # Only item_count is backfilled for orders: existing total_amount values
+    # may include charges that were never itemized.
+    order_items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    Order.objects.update(item_count=_count(order_items))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_item_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:37
+
+from django.db import migrations, models
+from django.db.models.functions import Lower, Trim
+
+
+def backfill_identifiers(apps, schema_editor):
+    CustomUser = apps.get_model('store', 'CustomUser')
+    CustomUser.objects.update(email_lower=Lower(Trim('email')), username_lower=Lower(Trim('username')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_denormalized_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='email_lower',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='username_lower',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(backfill_identifiers, migrations.RunPython.noop),
+    ]
@@ -9,6 +9,10 @@ from cloudinary.models import CloudinaryField
 # =======================
 #  CUSTOM USER MANAGER
 # =======================
+def normalize_identifier(value):
+    return (value or "").strip().lower()
+
+
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, username, password=None, **extra_fields):
         if not email:
@@ -22,6 +26,23 @@ class CustomUserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+    def get_by_identifier(self, identifier):
+        """
+        Resolve an email or username, case-insensitively, with one query over
+        the indexed lowercase columns. An email match wins if the identifier
+        is one user's email and another's username.
+        """
+        key = normalize_identifier(identifier)
+        if not key:
+            return None
+        matches = list(
+            self.filter(models.Q(email_lower=key) | models.Q(username_lower=key))[:2]
+        )
+        for user in matches:
+            if user.email_lower == key:
+                return user
+        return matches[0] if matches else None
+
     def create_superuser(self, email, username, password=None, **extra_fields):
         extra_fields.setdefault("is_staff", True)
         extra_fields.setdefault("is_superuser", True)
@@ -41,20 +62,108 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     date_joined = models.DateTimeField(default=timezone.now)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Lowercased copies kept by save() so login can use plain index seeks;
+    # iexact on email/username cannot use their unique indexes.
+    email_lower = models.CharField(max_length=254, db_index=True, editable=False, default="")
+    username_lower = models.CharField(max_length=100, db_index=True, editable=False, default="")
+    # Carried in issued JWTs; bumping it revokes them (store/authentication.py).
+    token_version = models.PositiveIntegerField(default=0, editable=False)
 
     objects = CustomUserManager()
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
 
+    def save(self, *args, **kwargs):
+        self.email_lower = normalize_identifier(self.email)
+        self.username_lower = normalize_identifier(self.username)
+        update_fields = kwargs.get("update_fields")
+        # set_password() keeps the raw password in _password until the save.
+        # A hash upgrade at login assigns .password directly and is not a
+        # password change.
+        password_changed = self._password is not None and (
+            update_fields is None or "password" in update_fields
+        )
+        if password_changed:
+            self.token_version += 1
+        if update_fields is not None:
+            extra = {"email": "email_lower", "username": "username_lower"}
+            if password_changed:
+                extra["password"] = "token_version"
+            kwargs["update_fields"] = {*update_fields, *(extra[f] for f in update_fields if f in extra)}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.username
 
 
+# =======================
+#  IMAGE URL CACHE
+# =======================
+# Cloudinary delivery URLs per size. "original" is the plain `.url` the API
+# has always returned; the others add responsive transformations.
+IMAGE_SIZES = {
+    "original": {},
+    "thumbnail": {"width": 300, "height": 300, "crop": "fill", "quality": "auto", "fetch_format": "auto"},
+    "detail": {"width": 1080, "crop": "limit", "quality": "auto", "fetch_format": "auto"},
+}
+
+
+def build_image_urls(image):
+    """Return {size: url} for a CloudinaryField value, or None when empty."""
+    if not image or not hasattr(image, "build_url"):
+        return None
+    return {
+        size: image.build_url(**options) if options else image.url
+        for size, options in IMAGE_SIZES.items()
+    }
+
+
+class ImageURLCacheMixin(models.Model):
+    """
+    Stores every image's delivery URLs in `image_urls` at save time so
+    serializers and the admin never call into the Cloudinary SDK per request.
+    Rows written without save() (bulk_create/update) fall back to building
+    the URL on read; `manage.py refresh_image_urls` backfills them.
+    """
+    IMAGE_FIELDS = ()
+
+    image_urls = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def refresh_image_urls(self):
+        self.image_urls = {name: build_image_urls(getattr(self, name)) for name in self.IMAGE_FIELDS}
+
+    def get_image_url(self, name, size="original"):
+        if name in self.image_urls:
+            urls = self.image_urls[name]
+        else:
+            urls = build_image_urls(getattr(self, name))
+        return urls.get(size) if urls else None
+
+    def save(self, *args, **kwargs):
+        # CloudinaryField uploads pending files in pre_save, so resolve them
+        # first; otherwise a freshly uploaded image has no public_id yet.
+        # Raw "image/upload/v1/..." strings are parsed into resources too.
+        for name in self.IMAGE_FIELDS:
+            field = self._meta.get_field(name)
+            value = field.pre_save(self, kwargs.get("force_insert", False))
+            setattr(self, name, field.to_python(value) if value else value)
+        self.refresh_image_urls()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and set(update_fields) & set(self.IMAGE_FIELDS):
+            kwargs["update_fields"] = {*update_fields, "image_urls"}
+        super().save(*args, **kwargs)
+
+
 # =======================
 #  CATEGORY
 # =======================
-class Category(models.Model):
+class Category(ImageURLCacheMixin, models.Model):
+    IMAGE_FIELDS = ("image",)
+
     category_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
@@ -67,7 +176,9 @@ class Category(models.Model):
 # =======================
 #  PRODUCT
 # =======================
-class Product(models.Model):
+class Product(ImageURLCacheMixin, models.Model):
+    IMAGE_FIELDS = ("main_image", "image1", "image2", "image3", "image4")
+
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="products")
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
@@ -91,12 +202,29 @@ class Product(models.Model):
         help_text="Estimated delivery days for orders from abroad. Only applies if 'Is Abroad Order' is checked."
     )
 
+    class Meta:
+        # Match the catalog access patterns: keyset pagination over
+        # (created_at, id) / (price, id), category pages and home-screen flag
+        # rails ordered by newest first. Composite rather than partial indexes
+        # because MySQL does not support conditional indexes.
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="product_created_id_idx"),
+            models.Index(fields=["price", "id"], name="product_price_id_idx"),
+            models.Index(fields=["category", "created_at"], name="product_category_created_idx"),
+            models.Index(fields=["is_deal_of_the_day", "created_at"], name="product_deal_created_idx"),
+            models.Index(fields=["is_featured", "created_at"], name="product_featured_created_idx"),
+            models.Index(fields=["is_new", "created_at"], name="product_new_created_idx"),
+            models.Index(fields=["is_abroad_order", "created_at"], name="product_abroad_created_idx"),
+        ]
+
     def __str__(self):
         return self.name
     
 
 
-class ProductVariant(models.Model):
+class ProductVariant(ImageURLCacheMixin, models.Model):
+    IMAGE_FIELDS = ("image_main", "image1", "image2", "image3", "image4")
+
     product = models.ForeignKey(
         "Product", on_delete=models.CASCADE, related_name="variants"
     )
@@ -124,12 +252,55 @@ class ProductVariant(models.Model):
     
 
 
+# =======================
+#  CATALOG VERSION
+# =======================
+class CatalogVersion(models.Model):
+    """
+    Single-row stamp bumped whenever a Category, Product or ProductVariant
+    changes; catalog endpoints derive their ETag / Last-Modified from it.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    SINGLETON_PK = 1
+
+    @classmethod
+    def current(cls):
+        # Read first: get_or_create() always goes to the primary database.
+        stamp = cls.objects.filter(pk=cls.SINGLETON_PK).first()
+        if stamp is None:
+            stamp, _ = cls.objects.get_or_create(pk=cls.SINGLETON_PK)
+        return stamp
+
+    @classmethod
+    async def acurrent(cls):
+        stamp = await cls.objects.filter(pk=cls.SINGLETON_PK).afirst()
+        if stamp is None:
+            stamp, _ = await cls.objects.aget_or_create(pk=cls.SINGLETON_PK)
+        return stamp
+
+    @classmethod
+    def bump(cls):
+        updated = cls.objects.filter(pk=cls.SINGLETON_PK).update(
+            version=models.F("version") + 1, updated_at=timezone.now()
+        )
+        if not updated:
+            cls.objects.get_or_create(pk=cls.SINGLETON_PK, defaults={"version": 1})
+
+    def __str__(self):
+        return f"Catalog v{self.version}"
+
+
 # =======================
 #  CART AND CART ITEM
 # =======================
 class Cart(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized from the items by store.checkout; never edit by hand.
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
 
     def __str__(self):
         return f"{self.user.username}'s Cart"
@@ -139,12 +310,51 @@ class CartItem(models.Model):
     cart_item_id = models.AutoField(primary_key=True)
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    variant = models.ForeignKey(
+        ProductVariant, on_delete=models.CASCADE, related_name="cart_items", null=True, blank=True
+    )
     quantity = models.PositiveIntegerField(default=1)
 
+    @property
+    def unit_price(self):
+        if self.variant_id and self.variant.price is not None:
+            return self.variant.price
+        return self.product.price
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
 
+# =======================
+#  STOCK RESERVATION
+# =======================
+class StockReservation(models.Model):
+    """
+    Short hold on stock for one cart item (used for flash deals). Available
+    stock is `stock` minus the unexpired holds; expired rows are ignored by
+    every read and deleted by `manage.py release_expired_reservations`.
+    """
+    cart_item = models.OneToOneField(CartItem, on_delete=models.CASCADE, related_name="reservation")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations")
+    variant = models.ForeignKey(
+        ProductVariant, on_delete=models.CASCADE, related_name="reservations", null=True, blank=True
+    )
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        # "Active holds for these products" aggregates over (product,
+        # expires_at > now); the sweeper scans expires_at alone.
+        indexes = [
+            models.Index(fields=["product", "expires_at"], name="reservation_product_exp_idx"),
+            models.Index(fields=["variant", "expires_at"], name="reservation_variant_exp_idx"),
+            models.Index(fields=["expires_at"], name="reservation_expires_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} until {self.expires_at:%H:%M:%S}"
+
+
 
 # =======================
 #  PAYMENT MODELS
@@ -228,7 +438,8 @@ class Order(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     shipping_address = models.ForeignKey(ShippingAddress, on_delete=models.SET_NULL, null=True)
     payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True)
-    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0, editable=False)
     status = models.CharField(max_length=50, choices=ORDER_STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -240,8 +451,10 @@ class Order(models.Model):
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
+    variant = models.ForeignKey(ProductVariant, on_delete=models.SET_NULL, null=True, blank=True)
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
     def __str__(self):
-        return f"{self.quantity} x {self.product.name}"
+        # Orders outlive their products (SET_NULL).
+        return f"{self.quantity} x {self.product.name if self.product_id else 'deleted product'}"
@@ -0,0 +1,185 @@
+import json
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, _reverse_ordering
+from rest_framework.utils.urls import replace_query_param
+
+
+# =======================
+#  KEYSET (CURSOR) PAGINATION
+# =======================
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination that seeks on the full ordering tuple plus the primary
+    key, e.g. `(created_at, id)` or `(price, id)`.
+
+    DRF's stock CursorPagination only filters on the first ordering field and
+    falls back to OFFSET for ties, which degrades on columns like `price`.
+    Here every cursor carries the values of all ordering fields, so each page
+    is a single `WHERE (a, id) > (x, y) ... LIMIT n` and rows inserted while a
+    client is paging never shift or duplicate results.
+    """
+    ordering = "-created_at"
+    page_size_query_param = "page_size"
+
+    def get_page_size(self, request):
+        # Read per request rather than at import, so settings changes apply.
+        self.page_size = getattr(settings, "API_PAGE_SIZE", 20)
+        self.max_page_size = getattr(settings, "API_MAX_PAGE_SIZE", 100)
+        return super().get_page_size(request)
+
+    def get_ordering(self, request, queryset, view):
+        # Views without an OrderingFilter can still pick their own default.
+        self.ordering = getattr(view, "ordering", None) or type(self).ordering
+        ordering = super().get_ordering(request, queryset, view)
+        # The primary key always ends the tuple as a tiebreaker.
+        pk_name = queryset.model._meta.pk.name
+        names = [field.lstrip("-") for field in ordering]
+        if "pk" in names or pk_name in names:
+            return tuple(ordering)
+        tiebreaker = "-pk" if ordering[0].startswith("-") else "pk"
+        return tuple(ordering) + (tiebreaker,)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self._page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self._set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() with the page fetched through the async ORM."""
+        queryset = self._page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self._set_page([obj async for obj in queryset])
+
+    def _page_queryset(self, queryset, request, view):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self._ordering_fields = [self._ordering_field(queryset, name.lstrip("-")) for name in self.ordering]
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            self.reverse, current_position = False, None
+        else:
+            self.reverse, current_position = self.cursor.reverse, self.cursor.position
+
+        if self.reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(self._seek_filter(current_position, self.reverse))
+
+        # Fetch one extra row to know whether another page follows.
+        return queryset[:self.page_size + 1]
+
+    def _set_page(self, results):
+        has_following = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        has_cursor = self.cursor is not None
+
+        if self.reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = has_cursor
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = has_cursor
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def _ordering_field(self, queryset, name):
+        """Model field or annotation (e.g. search_rank) a cursor value is compared with."""
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        opts = queryset.model._meta
+        if name == "pk":
+            return opts.pk
+        try:
+            return opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def _seek_filter(self, position, reverse):
+        # Lexicographic "row comparison" spelled out with Q objects so it works
+        # on every backend: (a > x) OR (a = x AND b > y) OR ...
+        condition = Q()
+        equal_prefix = {}
+        for field, value in zip(self.ordering, position):
+            attr = field.lstrip("-")
+            descending = field.startswith("-")
+            lookup = "lt" if descending != reverse else "gt"
+            condition |= Q(**equal_prefix, **{f"{attr}__{lookup}": value})
+            equal_prefix[attr] = value
+        return condition
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[-1], self.ordering)
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode("ascii")).decode("ascii")
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get("r", ["0"])[0]))
+            position = json.loads(tokens["p"][0])
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError
+            # A tampered value would otherwise fail while the filter is built.
+            position = [
+                field.to_python(value) if field is not None else value
+                for field, value in zip(self._ordering_fields, position)
+            ]
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        tokens = {"p": json.dumps(cursor.position, separators=(",", ":"))}
+        if cursor.reverse:
+            tokens["r"] = "1"
+        querystring = parse.urlencode(tokens)
+        encoded = b64encode(querystring.encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _get_position_from_instance(self, instance, ordering):
+        position = []
+        for field in ordering:
+            attr = field.lstrip("-")
+            value = instance[attr] if isinstance(instance, dict) else getattr(instance, attr)
+            position.append(value if isinstance(value, int) else str(value))
+        return position
@@ -0,0 +1,52 @@
+import threading
+from functools import partial
+
+from django.db.backends.mysql import base
+
+from .pool import ConnectionPool
+
+
+# =======================
+#  POOLED MYSQL BACKEND
+# =======================
+# django.db.backends.mysql with a per-process connection pool. Meant for the
+# ASGI deployment: there every request runs its sync code on a fresh
+# thread, so CONN_MAX_AGE would leave one idle connection per thread behind
+# and still reconnect for the next request. Here Django's close() at the
+# end of a request hands the connection back to the pool instead, so it
+# runs with CONN_MAX_AGE = 0. Pool settings live under DATABASES[...]["POOL"]
+# (SIZE, TIMEOUT, RECYCLE); see DB_POOL in settings.py.
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    @property
+    def pool(self):
+        with _pools_lock:
+            if self.alias not in _pools:
+                options = self.settings_dict.get("POOL", {})
+                _pools[self.alias] = ConnectionPool(
+                    connect=partial(base.DatabaseWrapper.get_new_connection, self, self.get_connection_params()),
+                    size=options.get("SIZE", 10),
+                    timeout=options.get("TIMEOUT", 5),
+                    recycle=options.get("RECYCLE", 3600),
+                    ping=lambda conn: conn.ping(),
+                )
+            return _pools[self.alias]
+
+    def get_new_connection(self, conn_params):
+        return self.pool.acquire()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # Never hand on a connection mid-transaction or after an error.
+        reusable = not self.in_atomic_block and not self.errors_occurred
+        if reusable and not self.autocommit:
+            try:
+                self.connection.rollback()
+            except Exception:
+                reusable = False
+        self.pool.release(self.connection, discard=not reusable)
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+
+from .pool import PoolTimeout
+
+
+# =======================
+#  POOL EXHAUSTION
+# =======================
+# A request that cannot get a pooled connection within DB_POOL_TIMEOUT gets
+# a 503 with Retry-After, as a busy hashing pool does, not a 500: the
+# server is saturated, not broken, and clients should back off and retry.
+
+class PoolTimeoutMiddleware(MiddlewareMixin):
+    def process_exception(self, request, exception):
+        if not isinstance(exception, PoolTimeout):
+            return None
+        response = JsonResponse(
+            {"detail": "The server is busy right now, please retry shortly."}, status=503,
+        )
+        response["Retry-After"] = str(getattr(settings, "DB_POOL_RETRY_AFTER", 1))
+        return response
@@ -0,0 +1,80 @@
+import queue
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    A process-wide set of open DB-API connections shared by all threads.
+
+    At most `size` connections exist at once; a caller that finds them all
+    checked out waits up to `timeout` seconds for one to come back. Idle
+    connections are reused newest first, pinged before being handed out
+    and replaced once they are older than `recycle` seconds (keep this
+    below MySQL's wait_timeout).
+    """
+
+    def __init__(self, connect, size=10, timeout=5, recycle=3600, ping=None):
+        self.connect = connect
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping = ping
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+        self._born = {}
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"No database connection free within {self.timeout}s")
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self.connect()
+                    self._born[id(conn)] = time.monotonic()
+                    return conn
+                if self._healthy(conn):
+                    return conn
+                self._discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        try:
+            if discard:
+                self._discard(conn)
+            else:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close_idle(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def _healthy(self, conn):
+        if time.monotonic() - self._born.get(id(conn), 0) > self.recycle:
+            return False
+        if self.ping is None:
+            return True
+        try:
+            self.ping(conn)
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, conn):
+        self._born.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
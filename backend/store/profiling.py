@@ -0,0 +1,216 @@
+import hmac
+import logging
+import random
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.renderers import JSONRenderer
+
+
+# =======================
+#  REQUEST PROFILING
+# =======================
+# Opt-in timing breakdown for a single request. A request is profiled when
+# it sends PROFILING_HEADER with the PROFILING_TOKEN value, or is picked by
+# PROFILING_SAMPLE_RATE. A profiled response carries
+#
+#   Server-Timing: sql;dur=4.1;desc="12 queries (3 duplicated)",
+#                  serialize;dur=9.8, render;dur=1.2, total;dur=18.0,
+#                  field;dur=6.5;desc="ProductSerializer.variants", ...
+#
+# and one "store.profiling" log record whose `profile` attribute holds the
+# full breakdown: duplicated statements, and the time spent in every
+# serializer field (image fields show the Cloudinary URL cost, method
+# fields their own). Field times include nested serializers, so
+# "ProductSerializer.variants" also counts the variant fields.
+#
+# Unprofiled requests pay one ContextVar lookup per query, per serialized
+# object and per rendered response.
+
+logger = logging.getLogger("store.profiling")
+
+_profile = ContextVar("request_profile", default=None)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.statements = Counter()
+        self.fields = defaultdict(float)
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self._depth = 0
+
+    def add_query(self, alias, sql, params, duration):
+        self.queries += 1
+        self.sql_time += duration
+        # Same statement, same parameters: the result was already fetched.
+        self.statements[alias, sql, repr(params)] += 1
+
+    def duplicates(self):
+        return [
+            {"database": alias, "sql": sql, "count": count}
+            for (alias, sql, _), count in self.statements.most_common() if count > 1
+        ]
+
+    def serialize(self, serializer, instance, represent):
+        """
+        represent(instance) -- DRF's own to_representation() -- with the
+        serializer's fields timed.
+        """
+        if not getattr(serializer, "_fields_timed", False):
+            label = type(serializer).__name__
+            for field in serializer.fields.values():
+                if not field.write_only:
+                    self._time_field(field, f"{label}.{field.field_name}")
+            serializer._fields_timed = True
+        outermost = self._depth == 0
+        self._depth += 1
+        started = perf_counter()
+        try:
+            return represent(instance)
+        finally:
+            self._depth -= 1
+            if outermost:
+                self.serialize_time += perf_counter() - started
+
+    def _time_field(self, field, name):
+        # Fields are bound per serializer instance, and serializers per
+        # request, so the wrappers go away with the request.
+        def timed(method):
+            def wrapper(*args, **kwargs):
+                started = perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    self.fields[name] += perf_counter() - started
+            return wrapper
+        field.get_attribute = timed(field.get_attribute)
+        field.to_representation = timed(field.to_representation)
+
+    def report(self, request, response):
+        return {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": _ms(perf_counter() - self.started),
+            "queries": self.queries,
+            "sql_ms": _ms(self.sql_time),
+            "duplicate_queries": self.duplicates(),
+            "serialize_ms": _ms(self.serialize_time),
+            "fields_ms": {
+                name: _ms(duration)
+                for name, duration in sorted(self.fields.items(), key=lambda item: -item[1])
+            },
+            "render_ms": _ms(self.render_time),
+        }
+
+    def server_timing(self, report):
+        duplicated = sum(item["count"] - 1 for item in report["duplicate_queries"])
+        metrics = [
+            f'sql;dur={report["sql_ms"]};desc="{report["queries"]} queries ({duplicated} duplicated)"',
+            f'serialize;dur={report["serialize_ms"]}',
+            f'render;dur={report["render_ms"]}',
+            f'total;dur={report["total_ms"]}',
+        ]
+        top = list(report["fields_ms"].items())[:getattr(settings, "PROFILING_TOP_FIELDS", 5)]
+        metrics += [f'field;dur={duration};desc="{name}"' for name, duration in top]
+        return ", ".join(metrics)
+
+    def finish(self, request, response):
+        report = self.report(request, response)
+        timing = self.server_timing(report)
+        if response.has_header("Server-Timing"):
+            timing = f'{response["Server-Timing"]}, {timing}'
+        response["Server-Timing"] = timing
+        logger.info(
+            "%s %s %s: %s ms, %s queries (%s ms SQL)",
+            report["method"], report["path"], report["status"],
+            report["total_ms"], report["queries"], report["sql_ms"],
+            extra={"profile": report},
+        )
+
+
+def should_profile(request):
+    token = getattr(settings, "PROFILING_TOKEN", "")
+    header = getattr(settings, "PROFILING_HEADER", "X-Profile")
+    if token and hmac.compare_digest(request.headers.get(header, ""), token):
+        return True
+    rate = getattr(settings, "PROFILING_SAMPLE_RATE", 0)
+    return rate > 0 and random.random() < rate
+
+
+# -----------------------
+#  Hooks
+# -----------------------
+def profile_queries(execute, sql, params, many, context):
+    # Installed on every connection by store/signals.py.
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(context["connection"].alias, sql, params, perf_counter() - started)
+
+
+class ProfiledFieldsMixin:
+    """Times each field of the store serializers while a request is profiled."""
+
+    def to_representation(self, instance):
+        profile = _profile.get()
+        if profile is None:
+            return super().to_representation(instance)
+        return profile.serialize(self, instance, super().to_representation)
+
+
+class ProfiledJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        profile = _profile.get()
+        if profile is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        started = perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            profile.render_time += perf_counter() - started
+
+
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not should_profile(request):
+                return await get_response(request)
+            profile = RequestProfile()
+            token = _profile.set(profile)
+            try:
+                response = await get_response(request)
+            finally:
+                _profile.reset(token)
+            profile.finish(request, response)
+            return response
+    else:
+        def middleware(request):
+            if not should_profile(request):
+                return get_response(request)
+            profile = RequestProfile()
+            token = _profile.set(profile)
+            try:
+                response = get_response(request)
+            finally:
+                _profile.reset(token)
+            profile.finish(request, response)
+            return response
+    return middleware
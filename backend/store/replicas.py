@@ -0,0 +1,115 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.decorators import sync_and_async_middleware
+
+from .cache import get_cache
+from .models import CatalogVersion, Category, Product, ProductVariant
+
+
+# =======================
+#  READ REPLICAS
+# =======================
+# Catalog reads made while a view has opted in (ReplicaReadMixin on
+# CategoryViewSet / ProductViewSet) go to one of REPLICA_DATABASES; all
+# other reads and every write use the primary. Reads stay on the primary
+# when:
+#   - the current request has already written to the primary (seen by
+#     track_writes, installed on the primary connection in store/signals.py),
+#     or
+#   - the user wrote anything in the last REPLICA_STICKY_SECONDS, so their
+#     own changes (e.g. stock after a checkout) are visible before the
+#     replicas catch up. Recorded per user in the cache by
+#     replica_stickiness_middleware.
+
+REPLICA_MODELS = {Category, Product, ProductVariant, CatalogVersion}
+STICKY_PREFIX = "replica-sticky:"
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_replica_reads = ContextVar("replica_reads", default=False)
+_wrote = ContextVar("wrote_to_primary", default=False)
+_served = ContextVar("served_from_replica", default=False)
+
+
+def replica_databases():
+    return getattr(settings, "REPLICA_DATABASES", [])
+
+
+def allow_replica_reads(enabled=True):
+    _replica_reads.set(enabled)
+
+
+def start_request():
+    _wrote.set(False)
+    _replica_reads.set(False)
+    _served.set(False)
+
+
+def served_from_replica():
+    """Whether any read of the current request went to a replica."""
+    return _served.get()
+
+
+def is_sticky(user):
+    if not getattr(user, "is_authenticated", False):
+        return False
+    return get_cache().get(f"{STICKY_PREFIX}{user.id}") is not None
+
+
+def _remember_write(request):
+    user = getattr(request, "user", None)
+    if getattr(user, "is_authenticated", False):
+        get_cache().set(f"{STICKY_PREFIX}{user.id}", 1, getattr(settings, "REPLICA_STICKY_SECONDS", 10))
+
+
+def track_writes(execute, sql, params, many, context):
+    # Not db_for_write(): get_or_create() and select_for_update() route
+    # through it without writing anything.
+    if sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+        _wrote.set(True)
+    return execute(sql, params, many, context)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = replica_databases()
+        if not replicas or not _replica_reads.get() or model not in REPLICA_MODELS:
+            return None
+        if _wrote.get():
+            return None
+        _served.set(True)
+        # Related lookups (prefetches) follow the row they start from.
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db in replicas:
+            return instance._state.db
+        return random.choice(replicas)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        databases = {DEFAULT_DB_ALIAS, *replica_databases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+@sync_and_async_middleware
+def replica_stickiness_middleware(get_response):
+    """Marks the user sticky to the primary after a request that wrote."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            start_request()
+            response = await get_response(request)
+            if _wrote.get():
+                await sync_to_async(_remember_write)(request)
+            return response
+    else:
+        def middleware(request):
+            start_request()
+            response = get_response(request)
+            if _wrote.get():
+                _remember_write(request)
+            return response
+    return middleware
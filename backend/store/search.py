@@ -0,0 +1,519 @@
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework import filters
+
+from .models import Category, Product
+
+
+# =======================
+#  TOKENIZER
+# =======================
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    """Lowercase, accent-folded word tokens."""
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKD", str(text))
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    return TOKEN_RE.findall(folded.lower())
+
+
+# =======================
+#  SEARCH BACKENDS
+# =======================
+class BaseSearchBackend:
+    """
+    Filters a queryset down to rows matching every search term and annotates
+    them with a `search_rank` float (higher is more relevant). Terms match as
+    word prefixes so results update while the user is typing.
+    """
+
+    def search(self, queryset, terms, fields):
+        raise NotImplementedError
+
+
+class MySQLFullTextBackend(BaseSearchBackend):
+    """
+    MATCH ... AGAINST in boolean mode over a FULLTEXT index on `fields`
+    (created by migration 0004 on MySQL). InnoDB ignores tokens shorter than
+    innodb_ft_min_token_size (3 by default), so those terms fall back to
+    `icontains` on the same fields.
+    """
+    min_token_size = 3
+
+    def search(self, queryset, terms, fields):
+        words = [word for term in terms for word in tokenize(term)]
+        long_words = [w for w in words if len(w) >= self.min_token_size]
+        short_words = [w for w in words if len(w) < self.min_token_size]
+
+        for word in short_words:
+            condition = Q()
+            for field in fields:
+                condition |= Q(**{f"{field}__icontains": word})
+            queryset = queryset.filter(condition)
+
+        if not long_words:
+            return queryset.annotate(search_rank=Value(1.0, output_field=FloatField()))
+
+        # Every word required; every word may be a prefix.
+        against = " ".join(f"+{word}*" for word in long_words)
+        connection = connections[router.db_for_read(queryset.model)]
+        table = connection.ops.quote_name(queryset.model._meta.db_table)
+        columns = ", ".join(
+            f"{table}.{connection.ops.quote_name(queryset.model._meta.get_field(f).column)}"
+            for f in fields
+        )
+        rank = RawSQL(
+            f"MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)", [against], output_field=FloatField()
+        )
+        return queryset.annotate(search_rank=rank).filter(search_rank__gt=0)
+
+
+def run_in_background(name, target, *args):
+    """Run target(*args) on a daemon thread that closes its connections when done."""
+    def run():
+        try:
+            target(*args)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+class InvertedIndexBackend(BaseSearchBackend):
+    """
+    In-process inverted index, for SQLite (tests, local runs) or any database
+    without full-text support. Each worker holds its own copy, kept current by
+    the save/delete signals in that process and rebuilt once it is older than
+    SEARCH_INDEX_MAX_AGE seconds so edits made by other workers show up.
+
+    Only the first build runs on a request thread. Later rebuilds run in a
+    background thread while searches keep using the old index; changes
+    made during the rebuild are replayed onto the new index before it is
+    swapped in.
+    """
+    _indexes = {}
+    # key -> [(method, args)] recorded while that index is being rebuilt
+    _rebuilding = {}
+    _lock = threading.Lock()
+    _build_lock = threading.Lock()
+
+    def get_index(self, model, fields):
+        key = (model._meta.label, tuple(fields))
+        index = self._indexes.get(key)
+        if index is None:
+            with self._build_lock:
+                index = self._indexes.get(key)
+                if index is None:
+                    # None only if a rebuild raced us; build a private copy.
+                    index = self.rebuild(model, fields) or self._build(model, fields)
+        elif time.monotonic() - index.built_at > getattr(settings, "SEARCH_INDEX_MAX_AGE", 300):
+            self.rebuild(model, fields, background=True)
+        return index
+
+    @classmethod
+    def rebuild(cls, model, fields, background=False):
+        """
+        Build a fresh index and swap it in. Returns the index, or the
+        started thread with background=True (None if a rebuild of this
+        index is already running).
+        """
+        key = (model._meta.label, tuple(fields))
+        with cls._lock:
+            if key in cls._rebuilding:
+                return None
+            pending = cls._rebuilding[key] = []
+        if not background:
+            return cls._rebuild(key, pending, model, fields)
+        return run_in_background(f"search-index-rebuild:{key[0]}", cls._rebuild, key, pending, model, fields)
+
+    @classmethod
+    def _build(cls, model, fields):
+        index = InvertedIndex(fields)
+        index.build(model._default_manager.values_list("pk", *fields).iterator(chunk_size=2000))
+        return index
+
+    @classmethod
+    def _rebuild(cls, key, pending, model, fields):
+        index = None
+        try:
+            index = cls._build(model, fields)
+        finally:
+            with cls._lock:
+                # reset() may have dropped this rebuild meanwhile.
+                if cls._rebuilding.get(key) is pending:
+                    del cls._rebuilding[key]
+                    if index is not None:
+                        for method, args in pending:
+                            getattr(index, method)(*args)
+                        cls._indexes[key] = index
+        return index
+
+    @classmethod
+    def _apply(cls, label, method, args_for):
+        with cls._lock:
+            targets = [(key, index) for key, index in cls._indexes.items() if key[0] == label]
+            for key, pending in cls._rebuilding.items():
+                if key[0] == label:
+                    pending.append((method, args_for(key[1])))
+        for key, index in targets:
+            getattr(index, method)(*args_for(key[1]))
+
+    @classmethod
+    def update(cls, instance):
+        cls._apply(
+            instance._meta.label, "add",
+            lambda fields: (instance.pk, [getattr(instance, f) for f in fields]),
+        )
+
+    @classmethod
+    def remove(cls, model, pk):
+        cls._apply(model._meta.label, "remove", lambda fields: (pk,))
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._indexes.clear()
+            cls._rebuilding.clear()
+
+    def search(self, queryset, terms, fields):
+        index = self.get_index(queryset.model, fields)
+        limit = getattr(settings, "SEARCH_MAX_RESULTS", 1000)
+        hits = index.search(terms, limit=limit)
+        if not hits:
+            return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+        rank = Case(
+            *[When(pk=pk, then=Value(score)) for pk, score in hits],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+        return queryset.filter(pk__in=[pk for pk, _ in hits]).annotate(search_rank=rank)
+
+
+class InvertedIndex:
+    """
+    token -> {pk: weight} postings plus a sorted token list for prefix lookup.
+    The first field (the name) counts three times as much as the others.
+    """
+    first_field_weight = 3.0
+    prefix_penalty = 0.8
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.postings = defaultdict(dict)
+        self.doc_tokens = defaultdict(set)
+        self.tokens = []
+        self.built_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _weights(self, texts):
+        weights = defaultdict(float)
+        for position, text in enumerate(texts):
+            field_weight = self.first_field_weight if position == 0 else 1.0
+            for token in tokenize(text):
+                weights[token] += field_weight
+        return weights
+
+    def build(self, rows):
+        for pk, *texts in rows:
+            for token, weight in self._weights(texts).items():
+                self.postings[token][pk] = weight
+                self.doc_tokens[pk].add(token)
+        self.tokens = sorted(self.postings)
+        self.built_at = time.monotonic()
+
+    def add(self, pk, texts):
+        with self._lock:
+            self._remove(pk)
+            for token, weight in self._weights(texts).items():
+                if token not in self.postings:
+                    self.tokens.insert(bisect_left(self.tokens, token), token)
+                self.postings[token][pk] = weight
+                self.doc_tokens[pk].add(token)
+
+    def remove(self, pk):
+        with self._lock:
+            self._remove(pk)
+
+    def _remove(self, pk):
+        for token in self.doc_tokens.pop(pk, ()):
+            docs = self.postings.get(token)
+            if docs is None:
+                continue
+            docs.pop(pk, None)
+            if not docs:
+                del self.postings[token]
+                i = bisect_left(self.tokens, token)
+                if i < len(self.tokens) and self.tokens[i] == token:
+                    del self.tokens[i]
+
+    def _idf(self, token, total):
+        return math.log(1 + total / len(self.postings[token]))
+
+    def _expand(self, word):
+        """Tokens equal to or starting with `word`."""
+        i = bisect_left(self.tokens, word)
+        matches = []
+        while i < len(self.tokens) and self.tokens[i].startswith(word):
+            matches.append(self.tokens[i])
+            i += 1
+        return matches
+
+    def search(self, terms, limit=1000):
+        words = [word for term in terms for word in tokenize(term)]
+        if not words:
+            return []
+        # add()/remove() run from on_commit hooks on other request threads.
+        with self._lock:
+            return self._search(words, limit)
+
+    def _search(self, words, limit):
+        total = max(len(self.doc_tokens), 1)
+
+        # (token, score factor) per word, narrowest word first so the later
+        # words only probe the surviving candidates.
+        expansions = []
+        for word in words:
+            tokens = [
+                (token, self._idf(token, total) * (1.0 if token == word else self.prefix_penalty))
+                for token in self._expand(word)
+            ]
+            if not tokens:
+                return []
+            expansions.append(tokens)
+        expansions.sort(key=lambda tokens: sum(len(self.postings[t]) for t, _ in tokens))
+
+        scores = defaultdict(float)
+        for token, factor in expansions[0]:
+            for pk, weight in self.postings[token].items():
+                scores[pk] = max(scores[pk], weight * factor)
+
+        for tokens in expansions[1:]:
+            narrowed = {}
+            for pk, score in scores.items():
+                best = 0.0
+                for token, factor in tokens:
+                    weight = self.postings[token].get(pk)
+                    if weight is not None and weight * factor > best:
+                        best = weight * factor
+                if best:
+                    narrowed[pk] = score + best
+            scores = narrowed
+            if not scores:
+                return []
+
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(pk, round(score, 6)) for pk, score in ranked]
+
+
+class SuggestionIndex:
+    """
+    Sorted array of (token, kind, pk) over product and category names for
+    search-as-you-type. Thumbnails come from the rows' precomputed
+    `image_urls`, so a lookup is a bisect plus a short scan with no database
+    or Cloudinary work. Like the inverted index it is per process: signals keep it current
+    locally and it is rebuilt in the background after SEARCH_INDEX_MAX_AGE
+    seconds, replaying changes made meanwhile.
+    """
+    max_candidates = 200
+
+    _instance = None
+    # [(method, args)] recorded while a rebuild runs
+    _pending = None
+    _lock = threading.Lock()
+    _build_lock = threading.Lock()
+
+    def __init__(self):
+        self.keys = []
+        self.records = {}
+        self.record_tokens = {}
+        self.built_at = time.monotonic()
+        self._index_lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        index = cls._instance
+        if index is None:
+            with cls._build_lock:
+                index = cls._instance
+                if index is None:
+                    index = cls.rebuild() or cls._build()
+        elif time.monotonic() - index.built_at > getattr(settings, "SEARCH_INDEX_MAX_AGE", 300):
+            cls.rebuild(background=True)
+        return index
+
+    @classmethod
+    def rebuild(cls, background=False):
+        """Same contract as InvertedIndexBackend.rebuild()."""
+        with cls._lock:
+            if cls._pending is not None:
+                return None
+            pending = cls._pending = []
+        if not background:
+            return cls._rebuild(pending)
+        return run_in_background("suggestion-index-rebuild", cls._rebuild, pending)
+
+    @classmethod
+    def _build(cls):
+        index = cls()
+        index.build()
+        return index
+
+    @classmethod
+    def _rebuild(cls, pending):
+        index = None
+        try:
+            index = cls._build()
+        finally:
+            with cls._lock:
+                if cls._pending is pending:
+                    cls._pending = None
+                    if index is not None:
+                        for method, args in pending:
+                            getattr(index, method)(*args)
+                        cls._instance = index
+        return index
+
+    @classmethod
+    def _apply(cls, method, *args):
+        with cls._lock:
+            index = cls._instance
+            if cls._pending is not None:
+                cls._pending.append((method, args))
+        if index is not None:
+            getattr(index, method)(*args)
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._instance = None
+            cls._pending = None
+
+    @classmethod
+    def instance_saved(cls, instance):
+        cls._apply("add", instance)
+
+    @classmethod
+    def instance_deleted(cls, model, pk):
+        cls._apply("remove", cls._kind(model), pk)
+
+    @staticmethod
+    def _kind(model):
+        return "category" if issubclass(model, Category) else "product"
+
+    def _record(self, instance):
+        kind = self._kind(type(instance))
+        thumbnail = instance.get_image_url("image" if kind == "category" else "main_image", "thumbnail")
+        return kind, {"type": kind, "id": instance.pk, "name": instance.name, "thumbnail": thumbnail}
+
+    def build(self):
+        rows = [
+            *Category.objects.only("category_id", "name", "image", "image_urls").iterator(chunk_size=2000),
+            *Product.objects.only("id", "name", "main_image", "image_urls").iterator(chunk_size=2000),
+        ]
+        for instance in rows:
+            kind, record = self._record(instance)
+            tokens = set(tokenize(record["name"]))
+            self.records[(kind, instance.pk)] = record
+            self.record_tokens[(kind, instance.pk)] = tokens
+            self.keys.extend((token, kind, instance.pk) for token in tokens)
+        self.keys.sort()
+        self.built_at = time.monotonic()
+
+    def add(self, instance):
+        kind, record = self._record(instance)
+        with self._index_lock:
+            self._remove(kind, instance.pk)
+            tokens = set(tokenize(record["name"]))
+            self.records[(kind, instance.pk)] = record
+            self.record_tokens[(kind, instance.pk)] = tokens
+            for token in tokens:
+                insort(self.keys, (token, kind, instance.pk))
+
+    def remove(self, kind, pk):
+        with self._index_lock:
+            self._remove(kind, pk)
+
+    def _remove(self, kind, pk):
+        self.records.pop((kind, pk), None)
+        for token in self.record_tokens.pop((kind, pk), ()):
+            i = bisect_left(self.keys, (token, kind, pk))
+            if i < len(self.keys) and self.keys[i] == (token, kind, pk):
+                del self.keys[i]
+
+    def suggest(self, query, limit=8):
+        words = tokenize(query)
+        if not words:
+            return []
+        # Seek on the longest word (most selective), verify the rest.
+        seek = max(words, key=len)
+        others = [w for w in words if w is not seek]
+
+        matches = {}
+        # add()/remove() run from on_commit hooks on other request threads.
+        with self._index_lock:
+            i = bisect_left(self.keys, (seek,))
+            while i < len(self.keys) and len(matches) < self.max_candidates:
+                token, kind, pk = self.keys[i]
+                if not token.startswith(seek):
+                    break
+                i += 1
+                tokens = self.record_tokens.get((kind, pk), ())
+                if all(any(t.startswith(w) for t in tokens) for w in others):
+                    matches[(kind, pk)] = self.records[(kind, pk)]
+
+        phrase = " ".join(words)
+
+        def rank(record):
+            name = " ".join(tokenize(record["name"]))
+            return (not name.startswith(phrase), record["type"] != "category", len(name), name)
+
+        return sorted(matches.values(), key=rank)[:limit]
+
+
+def get_search_backend():
+    path = getattr(settings, "SEARCH_BACKEND", "auto")
+    if path == "auto":
+        vendor = connections["default"].vendor
+        return MySQLFullTextBackend() if vendor == "mysql" else InvertedIndexBackend()
+    return import_string(path)()
+
+
+# =======================
+#  DRF FILTERS
+# =======================
+class CatalogSearchFilter(filters.SearchFilter):
+    """`?search=` routed through the configured search backend."""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        fields = getattr(view, "search_fields", None)
+        if not terms or not fields:
+            return queryset
+        return get_search_backend().search(queryset, terms, fields)
+
+
+class RankedOrderingFilter(filters.OrderingFilter):
+    """Orders search results by relevance unless `?ordering=` says otherwise."""
+
+    def get_default_ordering(self, view):
+        request = getattr(view, "request", None)
+        if request is not None and CatalogSearchFilter().get_search_terms(request):
+            return ["-search_rank"]
+        return super().get_default_ordering(view)
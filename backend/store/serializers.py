@@ -1,9 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from .hashers import hash_password, verify_password
 from .models import (
     CustomUser, Category, Product, Cart, CartItem,
     PaymentMethod, Payment, PaymentDetail,
-    ShippingAddress, Order, OrderItem,ProductVariant
+    ShippingAddress, Order, OrderItem,ProductVariant, normalize_identifier
 )
 
 # =======================
@@ -26,19 +27,19 @@ class RegisterSerializer(serializers.ModelSerializer):
         fields = ['id', 'email', 'username', 'first_name', 'last_name', 'address', 'phone', 'password']
 
     def validate_email(self, value):
-        if CustomUser.objects.filter(email__iexact=value).exists():
+        if CustomUser.objects.filter(email_lower=normalize_identifier(value)).exists():
             raise serializers.ValidationError("Email is already taken.")
         return value
 
     def validate_username(self, value):
-        if CustomUser.objects.filter(username__iexact=value).exists():
+        if CustomUser.objects.filter(username_lower=normalize_identifier(value)).exists():
             raise serializers.ValidationError("Username is already taken.")
         return value
 
     def create(self, validated_data):
         password = validated_data.pop('password')
         user = CustomUser(**validated_data)
-        user.set_password(password)
+        user.password = hash_password(password)
         user.save()
         return user
 
@@ -48,8 +49,77 @@ class RegisterSerializer(serializers.ModelSerializer):
 # =======================
 from rest_framework import serializers
 from .models import Product, ProductVariant
+from .profiling import ProfiledFieldsMixin
+
+
+class DynamicFieldsMixin:
+    """
+    Per-request field control for store serializers.
+
+    fields -- whitelist of field names to render
+    omit   -- field names to drop
+    expand -- names from `Meta.expandable_fields` to render as nested objects
+
+    `Meta.method_field_sources` maps SerializerMethodFields to the model
+    attributes they read, so views can trim `only()` and `prefetch_related()`
+    to match the fields that survive.
+    """
+
+    def __init__(self, *args, fields=None, omit=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        expandable = getattr(self.Meta, "expandable_fields", {})
+        for name in set(expand or ()) & set(expandable):
+            serializer_class, options = expandable[name]
+            self.fields[name] = serializer_class(read_only=True, **options)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in set(omit or ()) & set(self.fields):
+            self.fields.pop(name)
+
+    def get_source_attributes(self):
+        """Return the model attribute names read by the remaining fields."""
+        method_sources = getattr(self.Meta, "method_field_sources", {})
+        attributes = set()
+        for name, field in self.fields.items():
+            if isinstance(field, serializers.SerializerMethodField):
+                attributes.update(method_sources.get(name, ()))
+            elif field.source != "*":
+                attributes.add(field.source.split(".")[0])
+        return attributes
+
+
+class CachedImageMixin:
+    """
+    Reads image URLs from the model's precomputed `image_urls` instead of
+    building them through the Cloudinary SDK. The size comes from the
+    `image_size` serializer context (see SparseFieldsetMixin) and defaults to
+    the untransformed original.
+    """
+
+    def _image_url(self, obj, name):
+        return obj.get_image_url(name, self.context.get("image_size", "original"))
+
+
+class CategoryListSerializer(ProfiledFieldsMixin, CachedImageMixin, DynamicFieldsMixin,
+                             serializers.ModelSerializer):
+    """Shallow category row for list views; expects a `product_count` annotation."""
+    image = serializers.SerializerMethodField()
+    product_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Category
+        fields = ["category_id", "name", "image", "product_count"]
+        method_field_sources = {"image": ["image_urls", "image"]}
+
+    def get_image(self, obj):
+        return self._image_url(obj, "image")
 
-class ProductVariantSerializer(serializers.ModelSerializer):
+
+class ProductVariantSerializer(ProfiledFieldsMixin, CachedImageMixin, DynamicFieldsMixin,
+                               serializers.ModelSerializer):
     variant_id = serializers.IntegerField(source="id", read_only=True)
     color_hex = serializers.SerializerMethodField()   # maps color_code -> color_hex
     storage = serializers.SerializerMethodField()     # maps storage_option -> storage
@@ -75,9 +145,15 @@ class ProductVariantSerializer(serializers.ModelSerializer):
             "image3",
             "image4",
         ]
-
-    def _get_url(self, field):
-        return field.url if field and hasattr(field, "url") else None
+        method_field_sources = {
+            "color_hex": ["color_code"],
+            "storage": ["storage_option"],
+            "main_image": ["image_urls", "image_main"],
+            "image1": ["image_urls", "image1"],
+            "image2": ["image_urls", "image2"],
+            "image3": ["image_urls", "image3"],
+            "image4": ["image_urls", "image4"],
+        }
 
     def get_color_hex(self, obj):
         return obj.color_code if getattr(obj, "color_code", None) else None
@@ -86,22 +162,52 @@ class ProductVariantSerializer(serializers.ModelSerializer):
         return obj.storage_option if getattr(obj, "storage_option", None) else None
 
     def get_main_image(self, obj):
-        return self._get_url(obj.image_main)
+        return self._image_url(obj, "image_main")
 
     def get_image1(self, obj):
-        return self._get_url(obj.image1)
+        return self._image_url(obj, "image1")
 
     def get_image2(self, obj):
-        return self._get_url(obj.image2)
+        return self._image_url(obj, "image2")
 
     def get_image3(self, obj):
-        return self._get_url(obj.image3)
+        return self._image_url(obj, "image3")
 
     def get_image4(self, obj):
-        return self._get_url(obj.image4)
-
-
-class ProductSerializer(serializers.ModelSerializer):
+        return self._image_url(obj, "image4")
+
+
+def summarize_variants(variants):
+    """
+    Build the colour/storage lookups exposed by ProductSerializer in a single
+    pass over `variants`. Dicts double as insertion-ordered sets so that
+    de-duplication stays O(1) per variant.
+    """
+    colors = {}
+    storages = {}
+    availability = {}
+    by_storage = {}
+    for v in variants:
+        colors.setdefault((v.color_name, v.color_code), None)
+        key = v.color_code or v.color_name or f"color_{v.id}"
+        color_storages = availability.setdefault(key, {})
+        if v.storage_option:
+            storages.setdefault(v.storage_option, None)
+            color_storages.setdefault(v.storage_option, None)
+        by_storage.setdefault(v.storage_option or "default", {}).setdefault(key, None)
+
+    return {
+        "available_colors": [
+            {"color_name": name, "color_hex": code} for name, code in colors
+        ],
+        "available_storages": list(storages),
+        "availability_map": {key: list(values) for key, values in availability.items()},
+        "storage_map": {key: list(values) for key, values in by_storage.items()},
+    }
+
+
+class ProductSerializer(ProfiledFieldsMixin, CachedImageMixin, DynamicFieldsMixin,
+                        serializers.ModelSerializer):
     main_image = serializers.SerializerMethodField()
     image1 = serializers.SerializerMethodField()
     image2 = serializers.SerializerMethodField()
@@ -124,86 +230,73 @@ class ProductSerializer(serializers.ModelSerializer):
             "variants",
             "available_colors", "available_storages", "availability_map", "storage_map",
         ]
-
-    def _get_url(self, field):
-        return field.url if field and hasattr(field, "url") else None
+        expandable_fields = {
+            "category": (CategoryListSerializer, {"fields": ["category_id", "name", "image"]}),
+        }
+        method_field_sources = {
+            "main_image": ["image_urls", "main_image"],
+            "image1": ["image_urls", "image1"],
+            "image2": ["image_urls", "image2"],
+            "image3": ["image_urls", "image3"],
+            "image4": ["image_urls", "image4"],
+            "available_colors": ["variants"],
+            "available_storages": ["variants"],
+            "availability_map": ["variants"],
+            "storage_map": ["variants"],
+        }
 
     def get_main_image(self, obj):
-        return self._get_url(obj.main_image)
+        return self._image_url(obj, "main_image")
 
     def get_image1(self, obj):
-        return self._get_url(obj.image1)
+        return self._image_url(obj, "image1")
 
     def get_image2(self, obj):
-        return self._get_url(obj.image2)
+        return self._image_url(obj, "image2")
 
     def get_image3(self, obj):
-        return self._get_url(obj.image3)
+        return self._image_url(obj, "image3")
 
     def get_image4(self, obj):
-        return self._get_url(obj.image4)
+        return self._image_url(obj, "image4")
+
+    def _variant_summary(self, obj):
+        # Computed once per product and reused by the four getters below.
+        summary = getattr(obj, "_variant_summary", None)
+        if summary is None:
+            summary = obj._variant_summary = summarize_variants(obj.variants.all())
+        return summary
 
     def get_available_colors(self, obj):
-        colors = []
-        seen = set()
-        for v in obj.variants.all():
-            key = (v.color_name, v.color_code)
-            if key in seen:
-                continue
-            seen.add(key)
-            colors.append({
-                "color_name": v.color_name,
-                "color_hex": v.color_code,
-            })
-        return colors
+        return self._variant_summary(obj)["available_colors"]
 
     def get_available_storages(self, obj):
-        storages = []
-        seen = set()
-        for v in obj.variants.all():
-            s = v.storage_option
-            if s and s not in seen:
-                seen.add(s)
-                storages.append(s)
-        return storages
+        return self._variant_summary(obj)["available_storages"]
 
     def get_availability_map(self, obj):
-        result = {}
-        for v in obj.variants.all():
-            key = v.color_code or v.color_name or f"color_{v.id}"
-            if key not in result:
-                result[key] = []
-            if v.storage_option and v.storage_option not in result[key]:
-                result[key].append(v.storage_option)
-        return result
+        return self._variant_summary(obj)["availability_map"]
 
     def get_storage_map(self, obj):
-        result = {}
-        for v in obj.variants.all():
-            s = v.storage_option or "default"
-            key = v.color_code or v.color_name or f"color_{v.id}"
-            if s not in result:
-                result[s] = []
-            if key not in result[s]:
-                result[s].append(key)
-        return result
-
-
-class CategorySerializer(serializers.ModelSerializer):
+        return self._variant_summary(obj)["storage_map"]
+
+
+class CategorySerializer(ProfiledFieldsMixin, CachedImageMixin, DynamicFieldsMixin,
+                         serializers.ModelSerializer):
     products = ProductSerializer(many=True, read_only=True)
     image = serializers.SerializerMethodField()
 
     class Meta:
         model = Category
         fields = ["category_id", "name", "description", "image", "products"]
+        method_field_sources = {"image": ["image_urls", "image"]}
 
     def get_image(self, obj):
-        return obj.image.url if obj.image and hasattr(obj.image, "url") else None
+        return self._image_url(obj, "image")
 
 
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(ProfiledFieldsMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
 
     class Meta:
@@ -211,15 +304,16 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(ProfiledFieldsMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = Cart
-        fields = ['id', 'user', 'items', 'created_at']
+        fields = ['id', 'user', 'items', 'item_count', 'subtotal', 'created_at']
+        read_only_fields = ('user',)
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(ProfiledFieldsMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
 
     class Meta:
@@ -227,12 +321,65 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(ProfiledFieldsMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
         fields = '__all__'
+        # Set by the view and by checkout from the cart, never by the client.
+        read_only_fields = ('user', 'total_amount', 'item_count')
+
+
+# =======================
+#  CART BATCH OPERATIONS
+# =======================
+class CartOperationSerializer(serializers.Serializer):
+    """
+    One cart change. Lines are identified by (product, variant):
+      add    -- increase the line's quantity (default 1), creating it if needed
+      set    -- set the line's quantity; 0 removes it
+      remove -- delete the line
+    """
+    op = serializers.ChoiceField(choices=["add", "set", "remove"])
+    product = serializers.IntegerField()
+    variant = serializers.IntegerField(required=False, allow_null=True, default=None)
+    quantity = serializers.IntegerField(required=False, min_value=0, max_value=1000)
+
+    def validate(self, data):
+        if data["op"] == "add":
+            data.setdefault("quantity", 1)
+            if data["quantity"] < 1:
+                raise serializers.ValidationError({"quantity": "Must be at least 1 to add."})
+        elif data["op"] == "set" and "quantity" not in data:
+            raise serializers.ValidationError({"quantity": "This field is required."})
+        return data
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+
+    def validate_operations(self, operations):
+        # Plain integer fields above, checked here with two queries in total
+        # instead of a lookup per operation.
+        product_ids = {op["product"] for op in operations}
+        variant_ids = {op["variant"] for op in operations if op["variant"] is not None}
+        products = set(Product.objects.filter(pk__in=product_ids).values_list("pk", flat=True))
+        variants = dict(
+            ProductVariant.objects.filter(pk__in=variant_ids).values_list("pk", "product_id")
+        ) if variant_ids else {}
+
+        errors = []
+        for op in operations:
+            error = {}
+            if op["product"] not in products:
+                error["product"] = f"Unknown product {op['product']}."
+            elif op["variant"] is not None and variants.get(op["variant"]) != op["product"]:
+                error["variant"] = f"Variant {op['variant']} does not belong to product {op['product']}."
+            errors.append(error)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return operations
 
 
 User = get_user_model()
@@ -248,12 +395,10 @@ class LoginSerializer(serializers.Serializer):
         if not identifier or not password:
             raise serializers.ValidationError({'non_field_errors': ['Email/username and password are required']})
 
-        # try email, then username
-        user = User.objects.filter(email__iexact=identifier).first()
-        if not user:
-            user = User.objects.filter(username__iexact=identifier).first()
+        # email or username in one indexed query
+        user = User.objects.get_by_identifier(identifier)
 
-        if not user or not user.check_password(password):
+        if not user or not verify_password(user, password):
             raise serializers.ValidationError({'non_field_errors': ['Incorrect email/username or password']})
 
         if not user.is_active:
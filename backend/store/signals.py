@@ -0,0 +1,168 @@
+import threading
+
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.backends.signals import connection_created
+
+from .authentication import forget_user_state
+from .cache import bump_versions
+from .checkout import recalculate_cart_totals
+from .models import Cart, CartItem, CatalogVersion, Category, CustomUser, Product, ProductVariant
+from .profiling import profile_queries
+from .replicas import track_writes
+from .search import InvertedIndexBackend, SuggestionIndex
+
+
+# =======================
+#  CATALOG CACHE INVALIDATION
+# =======================
+# Every catalog change bumps CatalogVersion (same transaction, drives ETags)
+# and the affected response-cache namespaces (after commit).
+@receiver(pre_save, sender=Product)
+def remember_previous_category(sender, instance, raw=False, **kwargs):
+    # A product moving category must also invalidate its old category page;
+    # a price change must reprice the carts holding it (see below).
+    if instance.pk and not raw:
+        instance._previous_category_id, instance._previous_price = (
+            Product.objects.filter(pk=instance.pk).values_list("category_id", "price").first()
+            or (None, None)
+        )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    CatalogVersion.bump()
+    category_ids = {instance.category_id, getattr(instance, "_previous_category_id", None)}
+    bump_versions(
+        "product-list",
+        f"product:{instance.pk}",
+        "category-list",
+        *(f"category:{pk}" for pk in category_ids if pk),
+    )
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def invalidate_variant(sender, instance, **kwargs):
+    CatalogVersion.bump()
+    product = Product.objects.filter(pk=instance.product_id).only("category_id").first()
+    namespaces = ["product-list", f"product:{instance.product_id}", "category-list"]
+    if product is not None:
+        namespaces.append(f"category:{product.category_id}")
+    bump_versions(*namespaces)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    # Category fields are embedded in product responses (?expand=category),
+    # and category edits are rare, so drop the whole catalog.
+    CatalogVersion.bump()
+    bump_versions("catalog")
+
+
+# =======================
+#  IN-PROCESS SEARCH INDEXES
+# =======================
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: InvertedIndexBackend.update(instance))
+        transaction.on_commit(lambda: SuggestionIndex.instance_saved(instance))
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def remove_from_search_index(sender, instance, **kwargs):
+    pk = instance.pk  # cleared on the instance once the delete finishes
+    transaction.on_commit(lambda: InvertedIndexBackend.remove(sender, pk))
+    transaction.on_commit(lambda: SuggestionIndex.instance_deleted(sender, pk))
+
+
+# =======================
+#  CART TOTALS
+# =======================
+# Cart subtotals use live prices, so a price change reprices the carts that
+# hold the product or variant (one UPDATE, only when the price moved).
+@receiver(pre_save, sender=ProductVariant)
+def remember_previous_variant_price(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._previous_price = (
+            ProductVariant.objects.filter(pk=instance.pk).values_list("price", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductVariant)
+def reprice_carts(sender, instance, created=False, raw=False, **kwargs):
+    if created or raw or getattr(instance, "_previous_price", instance.price) == instance.price:
+        return
+    lookup = "product_id" if sender is Product else "variant_id"
+    recalculate_cart_totals(Cart.objects.filter(
+        pk__in=CartItem.objects.filter(**{lookup: instance.pk}).values("cart_id")
+    ))
+
+
+# Deleting a product or variant cascades to the cart lines holding it. The
+# collector sends one post_delete per line, so collect the carts and
+# recalculate each once after commit. Deletes that start from a cart or its
+# items (checkout, batch edits, the cart admin) adjust the totals themselves.
+_deleted_lines = threading.local()
+
+
+def _recalculate_pending_carts():
+    cart_ids = getattr(_deleted_lines, "cart_ids", None)
+    _deleted_lines.cart_ids = set()
+    if cart_ids:
+        recalculate_cart_totals(Cart.objects.filter(pk__in=cart_ids))
+
+
+@receiver(post_delete, sender=CartItem)
+def recalculate_cart_after_cascade(sender, instance, origin=None, **kwargs):
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if model in (Cart, CartItem):
+        return
+    if not hasattr(_deleted_lines, "cart_ids"):
+        _deleted_lines.cart_ids = set()
+    _deleted_lines.cart_ids.add(instance.cart_id)
+    # The first callback to run takes the whole set; the rest find it empty.
+    # Carts left over from a rolled-back transaction are simply recounted.
+    transaction.on_commit(_recalculate_pending_carts)
+
+
+# =======================
+#  AUTH STATE
+# =======================
+# Drop the cached state record used by StatelessJWTAuthentication so a
+# deactivation, demotion or password change applies to the next request.
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def forget_auth_state(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: forget_user_state(user_id))
+
+
+# =======================
+#  REPLICA STICKINESS
+# =======================
+# Watch the primary's statements so a request that wrote reads its own
+# writes back from the primary (store/replicas.py).
+@receiver(connection_created)
+def track_primary_writes(sender, connection, **kwargs):
+    if connection.alias == DEFAULT_DB_ALIAS and track_writes not in connection.execute_wrappers:
+        connection.execute_wrappers.append(track_writes)
+
+
+# =======================
+#  REQUEST PROFILING
+# =======================
+# Time every statement while a request is being profiled (store/profiling.py).
+@receiver(connection_created)
+def install_query_profiler(sender, connection, **kwargs):
+    if profile_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(profile_queries)
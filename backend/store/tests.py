@@ -1,3 +1,1909 @@
-from django.test import TestCase
+import gc
+import os
+import statistics
+import tempfile
+from asyncio import iscoroutinefunction
+from base64 import b64encode
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from cloudinary import CloudinaryResource
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import authenticate
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, close_old_connections, connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .admin import OrderItemAdmin
+from .async_views import async_read_routes
+from .authentication import ClaimsUser, tokens_for_user
+from .cache import bump_versions
+from .catalog_io import CatalogImportError, import_rows, read_rows
+from .checkout import InsufficientStock, checkout, recalculate_cart_totals, with_available_stock
+from .hashers import HashingBusy, HashingPool
+from .management.commands.bench_variant_summary import legacy_summary
+from .models import (
+    Cart, CartItem, CatalogVersion, Category, CustomUser, Order, OrderItem, Product, ProductVariant,
+    StockReservation,
+)
+from .pooled_mysql.pool import ConnectionPool, PoolTimeout
+from .profiling import RequestProfile
+from .replicas import ReplicaRouter, allow_replica_reads, start_request, track_writes
+from .search import InvertedIndex, InvertedIndexBackend, SuggestionIndex
+from .serializers import summarize_variants
+from .urls import router
+
+
+# =======================
+#  CART / ORDER QUERY COUNTS
+# =======================
+class CartOrderQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("buyer@example.com", "buyer", "secret123")
+        cls.other = CustomUser.objects.create_user("other@example.com", "other", "secret123")
+        category = Category.objects.create(name="Phones")
+        cls.products = []
+        for i in range(12):
+            product = Product.objects.create(category=category, name=f"Phone {i}", price=Decimal("100.00"))
+            for color in ("Black", "White"):
+                ProductVariant.objects.create(product=product, color_name=color, storage_option="128GB")
+            cls.products.append(product)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _fill_cart(self, user, count):
+        cart, _ = Cart.objects.get_or_create(user=user)
+        CartItem.objects.bulk_create(CartItem(cart=cart, product=p) for p in self.products[:count])
+        return cart
+
+    def _place_order(self, user, count):
+        order = Order.objects.create(user=user, total_amount=Decimal("0.00"))
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=p, price=p.price) for p in self.products[:count]
+        )
+        return order
+
+    def test_cart_list_query_count_is_constant(self):
+        self._fill_cart(self.user, 2)
+        with self.assertNumQueries(3):
+            small = self.client.get("/api/carts/")
+        CartItem.objects.all().delete()
+        self._fill_cart(self.user, 12)
+        with self.assertNumQueries(3):
+            large = self.client.get("/api/carts/")
+        self.assertEqual(len(small.data[0]["items"]), 2)
+        self.assertEqual(len(large.data[0]["items"]), 12)
+
+    def test_order_list_query_count_is_constant(self):
+        self._place_order(self.user, 1)
+        with self.assertNumQueries(3):
+            self.client.get("/api/orders/")
+        for _ in range(3):
+            self._place_order(self.user, 12)
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/orders/")
+        self.assertEqual(len(response.data), 4)
+
+    def test_carts_and_orders_are_scoped_to_user(self):
+        self._fill_cart(self.other, 1)
+        self._place_order(self.other, 1)
+        self.assertEqual(self.client.get("/api/carts/").data, [])
+        self.assertEqual(self.client.get("/api/orders/").data, [])
+
+    def test_anonymous_requests_are_rejected(self):
+        self.assertEqual(APIClient().get("/api/carts/").status_code, 401)
+
+
+class UserScopedWriteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("buyer@example.com", "buyer", None)
+        cls.other = CustomUser.objects.create_user("other@example.com", "other", None)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_rows_are_created_for_the_requesting_user(self):
+        response = self.client.post("/api/carts/", {"user": self.other.pk})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Cart.objects.get(pk=response.json()["id"]).user, self.user)
+        response = self.client.post("/api/orders/", {"user": self.other.pk, "total_amount": "1.00"})
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.json()["order_id"])
+        self.assertEqual((order.user, order.total_amount), (self.user, 0))
+        self.assertFalse(Order.objects.filter(user=self.other).exists())
+
+    def test_rows_cannot_be_handed_to_another_user(self):
+        order = Order.objects.create(user=self.user, total_amount=0)
+        response = self.client.patch(f"/api/orders/{order.pk}/", {"user": self.other.pk})
+        self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual(order.user, self.user)
+
+    def test_token_users_get_the_same_treatment(self):
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.user).access_token}")
+        response = self.client.post("/api/carts/", {"user": self.other.pk})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Cart.objects.get(pk=response.json()["id"]).user, self.user)
+
+    def test_user_is_not_required(self):
+        response = self.client.post("/api/carts/", {})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["user"], self.user.pk)
+
+    def test_staff_edits_keep_the_owner(self):
+        order = Order.objects.create(user=self.other, total_amount=0)
+        self.client.force_authenticate(CustomUser.objects.create_superuser("admin@example.com", "admin", None))
+        response = self.client.patch(f"/api/orders/{order.pk}/", {"status": "shipped"})
+        self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual((order.user, order.status), (self.other, "shipped"))
+
+    def test_fields_param_does_not_narrow_writes(self):
+        response = self.client.post("/api/orders/?fields=order_id", {"status": "bogus"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("status", response.json())
+        response = self.client.post("/api/carts/?fields=id", {})
+        self.assertEqual(response.status_code, 201)
+        self.assertIn("items", response.json())
+
+
+# =======================
+#  LOGIN
+# =======================
+class LoginLookupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("Ada@Example.com", "AdaL", "secret123")
+        # Another user whose username is Ada's email: the email match wins.
+        CustomUser.objects.create_user("other@example.com", "ada@example.com", "secret123")
+
+    def _login(self, identifier, password="secret123"):
+        return APIClient().post("/api/auth/login/", {"email_or_username": identifier, "password": password})
+
+    def test_email_or_username_in_one_query(self):
+        for identifier in ("ADA@example.com", " adal ", "AdaL"):
+            with self.assertNumQueries(1):
+                response = self._login(identifier)
+            self.assertEqual(response.status_code, 200, identifier)
+            self.assertEqual(response.json()["user"]["id"], self.user.pk)
+
+    def test_wrong_password_and_unknown_user(self):
+        self.assertEqual(self._login("adal", "nope").status_code, 400)
+        self.assertEqual(self._login("nobody").status_code, 400)
+
+    def test_lowercase_columns_follow_renames(self):
+        self.user.username = "Lovelace"
+        self.user.save(update_fields=["username"])
+        self.assertEqual(CustomUser.objects.get_by_identifier("LOVELACE"), self.user)
+
+    def test_backend_accepts_email_or_username(self):
+        self.assertEqual(authenticate(None, email="ada@EXAMPLE.com", password="secret123"), self.user)
+        self.assertEqual(authenticate(None, username="adal", password="secret123"), self.user)
+
+    def test_register_rejects_case_variants(self):
+        response = APIClient().post("/api/auth/register/", {
+            "email": "ADA@example.COM", "username": "adal", "password": "password123",
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {"email", "username"})
+
+
+
+@override_settings(
+    PASSWORD_HASHERS=["store.hashers.PBKDF2PasswordHasher", "store.hashers.ScryptPasswordHasher"],
+    PASSWORD_PBKDF2_ITERATIONS=1000,
+)
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("ada@example.com", "ada", "secret123")
+
+    def _login(self):
+        return APIClient().post("/api/auth/login/", {"email_or_username": "ada", "password": "secret123"})
+
+    def test_work_factor_comes_from_settings(self):
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$1000$"))
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        with self.settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            self.assertEqual(self._login().status_code, 200)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith("pbkdf2_sha256$2000$"))
+
+        with self.settings(PASSWORD_HASHERS=["store.hashers.ScryptPasswordHasher", "store.hashers.PBKDF2PasswordHasher"]):
+            self.assertEqual(self._login().status_code, 200)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith("scrypt$"))
+            self.assertEqual(self._login().status_code, 200)
+
+    def test_saturated_pool_rejects_instead_of_queueing(self):
+        pool = HashingPool(workers=1, queue=0, timeout=0.01)
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+
+        blocker = threading.Thread(target=pool.run, args=(slow,))
+        blocker.start()
+        started.wait(5)
+        try:
+            with self.assertRaises(HashingBusy):
+                pool.run(lambda: None)
+        finally:
+            release.set()
+            blocker.join()
+        self.assertEqual(pool.run(lambda: 42), 42)
+
+
+
+class StatelessJWTAuthTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("ada@example.com", "ada", "secret123")
+        Cart.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def _authenticate(self, token=None):
+        token = token or tokens_for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_cart_reads_skip_the_user_query(self):
+        self._authenticate()
+        # Empty cart: carts + items. simplejwt's JWTAuthentication adds a
+        # user query on top of these on every request.
+        with self.settings(REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_AUTHENTICATION_CLASSES": ["rest_framework_simplejwt.authentication.JWTAuthentication"],
+        }):
+            with self.assertNumQueries(3):
+                self.client.get("/api/carts/")
+
+        self.client.get("/api/carts/")  # loads and caches the state record
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/carts/")
+        self.assertEqual(len(response.json()), 1)
+
+    def test_deactivation_and_password_change_revoke_tokens(self):
+        self._authenticate()
+        self.assertEqual(self.client.get("/api/carts/").status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password("new-secret")
+            self.user.save()
+        self.assertEqual(self.client.get("/api/carts/").status_code, 401)
+
+        self._authenticate()  # token carrying the new version
+        self.assertEqual(self.client.get("/api/carts/").status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get("/api/carts/").status_code, 401)
+
+    def test_hash_upgrade_at_login_keeps_tokens_valid(self):
+        self._authenticate()
+        self.assertEqual(self.client.get("/api/carts/").status_code, 200)
+        with self.settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher", *settings.PASSWORD_HASHERS]):
+            with self.captureOnCommitCallbacks(execute=True):
+                user = authenticate(email="ada@example.com", password="secret123")
+        self.assertTrue(user.password.startswith("md5$"))
+        self.assertEqual(self.client.get("/api/carts/").status_code, 200)
+
+    def test_claims_user_loads_the_row_only_when_needed(self):
+        token = tokens_for_user(self.user).access_token
+        with self.assertNumQueries(0):
+            user = ClaimsUser(token, {"is_active": True, "is_staff": False, "token_version": 1})
+            self.assertEqual((user.id, user.username, user.is_authenticated), (self.user.pk, "ada", True))
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "ada@example.com")
+            self.assertEqual(user.date_joined, self.user.date_joined)
+
+    def test_tokens_without_extra_claims_still_work(self):
+        self._authenticate(RefreshToken.for_user(self.user).access_token)
+        self.assertEqual(self.client.get("/api/carts/").status_code, 200)
+
+
+# =======================
+#  CHECKOUT
+# =======================
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("buyer@example.com", "buyer", "secret123")
+        category = Category.objects.create(name="Phones")
+        cls.phone = Product.objects.create(category=category, name="Phone", price=Decimal("100.00"), stock=5)
+        cls.case = Product.objects.create(category=category, name="Case", price=Decimal("10.00"), stock=1)
+
+    def setUp(self):
+        cache.clear()
+        self.cart = Cart.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_checkout_creates_order_and_decrements_stock(self):
+        CartItem.objects.create(cart=self.cart, product=self.phone, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.case, quantity=1)
+        response = self.client.post(f"/api/carts/{self.cart.pk}/checkout/")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.json()["total_amount"]), Decimal("210.00"))
+        self.assertEqual(len(response.json()["items"]), 2)
+        self.phone.refresh_from_db()
+        self.case.refresh_from_db()
+        self.assertEqual((self.phone.stock, self.case.stock), (3, 0))
+        self.assertFalse(self.cart.items.exists())
+
+    def test_short_line_fails_whole_checkout(self):
+        CartItem.objects.create(cart=self.cart, product=self.phone, quantity=1)
+        CartItem.objects.create(cart=self.cart, product=self.case, quantity=2)
+        response = self.client.post(f"/api/carts/{self.cart.pk}/checkout/")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["items"], [{"product": self.case.pk, "variant": None, "requested": 2, "available": 1}])
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 5)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 2)
+
+    def test_empty_cart_is_rejected(self):
+        self.assertEqual(self.client.post(f"/api/carts/{self.cart.pk}/checkout/").status_code, 400)
+
+    def test_stock_change_invalidates_catalog_cache(self):
+        CartItem.objects.create(cart=self.cart, product=self.phone, quantity=1)
+        self.client.get(f"/api/products/{self.phone.pk}/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/api/carts/{self.cart.pk}/checkout/")
+        self.assertEqual(self.client.get(f"/api/products/{self.phone.pk}/").json()["stock"], 4)
+
+
+class CartBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("buyer@example.com", "buyer", "secret123")
+        category = Category.objects.create(name="Phones")
+        cls.phone = Product.objects.create(category=category, name="Phone", price=Decimal("100.00"), stock=5)
+        cls.black = ProductVariant.objects.create(
+            product=cls.phone, color_name="Black", price=Decimal("120.00"), stock=2,
+        )
+        cls.white = ProductVariant.objects.create(product=cls.phone, color_name="White", stock=2)
+        cls.cable = Product.objects.create(category=category, name="Cable", price=Decimal("5.00"), stock=10)
+
+    def setUp(self):
+        cache.clear()
+        self.cart = Cart.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _batch(self, *operations):
+        return self.client.post(
+            f"/api/carts/{self.cart.pk}/items/batch/", {"operations": list(operations)}, format="json",
+        )
+
+    def test_operations_apply_in_one_request_with_totals(self):
+        self._batch({"op": "add", "product": self.cable.pk, "quantity": 4})
+        with CaptureQueriesContext(connection) as queries:
+            response = self._batch(
+                {"op": "add", "product": self.phone.pk, "variant": self.black.pk},
+                {"op": "add", "product": self.phone.pk, "variant": self.black.pk, "quantity": 2},
+                {"op": "set", "product": self.phone.pk, "variant": self.white.pk, "quantity": 1},
+                {"op": "set", "product": self.cable.pk, "quantity": 1},
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        self.assertEqual(body["item_count"], 5)
+        # 3 x 120.00 (variant price) + 1 x 100.00 (no variant price) + 1 x 5.00
+        self.assertEqual(body["subtotal"], "465.00")
+        self.assertEqual(
+            sorted((i.product_id, i.variant_id, i.quantity) for i in self.cart.items.all()),
+            sorted([(self.phone.pk, self.black.pk, 3), (self.phone.pk, self.white.pk, 1), (self.cable.pk, None, 1)]),
+        )
+        self.assertLessEqual(len(queries), 12)
+
+    def test_remove_and_set_zero_delete_lines(self):
+        self._batch(
+            {"op": "add", "product": self.cable.pk},
+            {"op": "add", "product": self.phone.pk, "variant": self.black.pk},
+        )
+        response = self._batch(
+            {"op": "remove", "product": self.cable.pk},
+            {"op": "set", "product": self.phone.pk, "variant": self.black.pk, "quantity": 0},
+        )
+        self.assertEqual(response.json(), {"cart": self.cart.pk, "items": [], "item_count": 0, "subtotal": "0.00"})
+        self.assertFalse(self.cart.items.exists())
+
+    def test_invalid_operations_change_nothing(self):
+        response = self._batch(
+            {"op": "add", "product": self.cable.pk},
+            {"op": "add", "product": self.cable.pk, "variant": self.black.pk},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("variant", response.json()["operations"][1])
+        self.assertFalse(self.cart.items.exists())
+
+    def test_checkout_decrements_variant_stock(self):
+        self._batch({"op": "add", "product": self.phone.pk, "variant": self.black.pk, "quantity": 2})
+        response = self.client.post(f"/api/carts/{self.cart.pk}/checkout/")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.json()["total_amount"]), Decimal("240.00"))
+        self.assertEqual(response.json()["items"][0]["variant"], self.black.pk)
+        self.black.refresh_from_db()
+        self.phone.refresh_from_db()
+        self.assertEqual((self.black.stock, self.phone.stock), (0, 5))
+
+        self._batch({"op": "add", "product": self.phone.pk, "variant": self.black.pk})
+        response = self.client.post(f"/api/carts/{self.cart.pk}/checkout/")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["items"][0]["variant"], self.black.pk)
+
+
+class CartTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("buyer@example.com", "buyer", "secret123")
+        category = Category.objects.create(name="Phones")
+        cls.phone = Product.objects.create(category=category, name="Phone", price=Decimal("100.00"), stock=5)
+        cls.black = ProductVariant.objects.create(product=cls.phone, color_name="Black", price=Decimal("120.00"), stock=5)
+
+    def setUp(self):
+        cache.clear()
+        self.cart = Cart.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.client.post(f"/api/carts/{self.cart.pk}/items/batch/", {"operations": [
+            {"op": "add", "product": self.phone.pk, "quantity": 2},
+            {"op": "add", "product": self.phone.pk, "variant": self.black.pk},
+        ]}, format="json")
+
+    def _summary(self):
+        return self.client.get(f"/api/carts/{self.cart.pk}/summary/").json()
+
+    def test_summary_is_one_query(self):
+        self.client.get("/api/carts/")  # authenticate/warm up outside the count
+        with self.assertNumQueries(1):
+            summary = self._summary()
+        self.assertEqual(summary, {"cart": self.cart.pk, "item_count": 3, "subtotal": "320.00"})
+
+    def test_price_changes_reprice_carts(self):
+        self.phone.price = Decimal("90.00")
+        self.phone.save()
+        self.assertEqual(self._summary()["subtotal"], "300.00")
+        self.black.price = None
+        self.black.save()
+        self.assertEqual(self._summary()["subtotal"], "270.00")
+
+    def test_checkout_moves_totals_to_order(self):
+        order = self.client.post(f"/api/carts/{self.cart.pk}/checkout/").json()
+        self.assertEqual((order["item_count"], order["total_amount"]), (3, "320.00"))
+        self.assertEqual(self._summary()["item_count"], 0)
+
+    def test_recalculate_repairs_drift(self):
+        Cart.objects.filter(pk=self.cart.pk).update(item_count=99, subtotal=1)
+        recalculate_cart_totals(Cart.objects.filter(pk=self.cart.pk))
+        self.assertEqual(self._summary()["subtotal"], "320.00")
+
+    def test_cascade_deletes_recalculate_each_cart_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.black.delete()
+        self.assertEqual(self._summary(), {"cart": self.cart.pk, "item_count": 2, "subtotal": "200.00"})
+
+        self.client.post(f"/api/carts/{self.cart.pk}/items/batch/", {"operations": [
+            {"op": "add", "product": self.phone.pk, "variant": ProductVariant.objects.create(
+                product=self.phone, color_name="White", stock=5).pk},
+        ]}, format="json")
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.phone.delete()
+        with self.assertNumQueries(1):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(self._summary(), {"cart": self.cart.pk, "item_count": 0, "subtotal": "0.00"})
+
+    def test_order_item_admin_keeps_the_amount_charged(self):
+        order = self.client.post(f"/api/carts/{self.cart.pk}/checkout/").json()
+        item = OrderItem.objects.filter(order_id=order["order_id"], variant=self.black).get()
+        OrderItemAdmin(OrderItem, admin.site).delete_model(None, item)
+        order = Order.objects.get(pk=order["order_id"])
+        self.assertEqual((order.item_count, order.total_amount), (2, Decimal("320.00")))
+
+
+class CheckoutConcurrencyTests(TransactionTestCase):
+    BUYERS = 12
+    STOCK = 5
+
+    def setUp(self):
+        category = Category.objects.create(name="Phones")
+        self.product = Product.objects.create(category=category, name="Sale phone", price=1, stock=self.STOCK)
+        self.carts = []
+        for i in range(self.BUYERS):
+            user = CustomUser.objects.create(email=f"buyer{i}@example.com", username=f"buyer{i}")
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+            self.carts.append(cart)
+
+    def test_parallel_buyers_cannot_oversell(self):
+        barrier = threading.Barrier(self.BUYERS)
+        results = []
+
+        def buy(cart):
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        checkout(cart)
+                        results.append("ok")
+                        return
+                    except InsufficientStock:
+                        results.append("sold out")
+                        return
+                    except OperationalError:
+                        # SQLite serializes writers ("database is locked");
+                        # a real client would retry the same way.
+                        time.sleep(0.01)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(cart,)) for cart in self.carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.product.refresh_from_db()
+        self.assertEqual(results.count("ok"), self.STOCK)
+        self.assertEqual(results.count("sold out"), self.BUYERS - self.STOCK)
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(Order.objects.count(), self.STOCK)
+
+    def test_concurrent_checkouts_bump_the_catalog_version_after_commit(self):
+        other = Product.objects.create(category=self.product.category, name="Case", price=1, stock=1)
+        CartItem.objects.filter(cart=self.carts[1]).update(product=other)
+        start = CatalogVersion.current().version
+        bumped_in_transaction = []
+        bump = CatalogVersion.bump.__func__
+
+        def recording_bump(cls):
+            bumped_in_transaction.append(connection.in_atomic_block)
+            bump(cls)
+
+        barrier = threading.Barrier(2)
+        errors = []
+
+        def buy(cart):
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        checkout(cart)
+                        return
+                    except OperationalError:
+                        time.sleep(0.01)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        with mock.patch.object(CatalogVersion, "bump", classmethod(recording_bump)):
+            threads = [threading.Thread(target=buy, args=(cart,)) for cart in self.carts[:2]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(bumped_in_transaction, [False, False])
+        self.assertEqual(CatalogVersion.current().version, start + 2)
+
+
+class StockReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Deals")
+        cls.deal = Product.objects.create(
+            category=category, name="Deal phone", price=100, stock=3, is_deal_of_the_day=True,
+        )
+        cls.regular = Product.objects.create(category=category, name="Cable", price=5, stock=1)
+        cls.alice = CustomUser.objects.create_user("alice@example.com", "alice", "secret123")
+        cls.bob = CustomUser.objects.create_user("bob@example.com", "bob", "secret123")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def _cart(self, user, **quantities):
+        cart, _ = Cart.objects.get_or_create(user=user)
+        for name, quantity in quantities.items():
+            CartItem.objects.create(cart=cart, product=getattr(self, name), quantity=quantity)
+        self.client.force_authenticate(user)
+        return cart
+
+    def _available(self, product):
+        return with_available_stock(Product.objects.filter(pk=product.pk)).get().available_stock
+
+    def test_reserve_holds_deal_stock_only(self):
+        cart = self._cart(self.alice, deal=2, regular=1)
+        response = self.client.post(f"/api/carts/{cart.pk}/reserve/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.json()["expires_at"])
+        self.assertEqual(self._available(self.deal), 1)
+        self.assertEqual(self._available(self.regular), 1)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_other_carts_cannot_take_held_stock(self):
+        alice_cart = self._cart(self.alice, deal=2)
+        self.client.post(f"/api/carts/{alice_cart.pk}/reserve/")
+        bob_cart = self._cart(self.bob, deal=2)
+        response = self.client.post(f"/api/carts/{bob_cart.pk}/reserve/")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["items"], [{"product": self.deal.pk, "variant": None, "requested": 2, "available": 1}])
+        self.assertEqual(self.client.post(f"/api/carts/{bob_cart.pk}/checkout/").status_code, 409)
+
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(self.client.post(f"/api/carts/{alice_cart.pk}/checkout/").status_code, 201)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_holds_stop_counting_and_are_swept(self):
+        cart = self._cart(self.alice, deal=3)
+        self.client.post(f"/api/carts/{cart.pk}/reserve/")
+        self.assertEqual(self._available(self.deal), 0)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self._available(self.deal), 3)
+
+        out = StringIO()
+        call_command("release_expired_reservations", batch_size=1, stdout=out)
+        self.assertIn("Released 1", out.getvalue())
+        self.assertFalse(StockReservation.objects.exists())
+
+
+# =======================
+#  CATALOG RESPONSE CACHE
+# =======================
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Phones")
+        cls.other_category = Category.objects.create(name="Tablets")
+        cls.product = Product.objects.create(category=cls.category, name="Phone", price=Decimal("100.00"))
+        cls.other = Product.objects.create(category=cls.other_category, name="Tablet", price=Decimal("200.00"))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_repeat_requests_are_served_from_cache(self):
+        self.assertEqual(self.client.get("/api/products/")["X-Cache"], "MISS")
+        with self.assertNumQueries(1):  # CatalogVersion lookup for the ETag
+            response = self.client.get("/api/products/")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(len(response.json()["results"]), 2)
+
+    def test_query_params_are_part_of_the_key(self):
+        self.client.get("/api/products/?ordering=price")
+        self.assertEqual(self.client.get("/api/products/?ordering=-price")["X-Cache"], "MISS")
+
+    def test_product_save_invalidates_its_pages_only(self):
+        self.client.get("/api/products/")
+        self.client.get(f"/api/products/{self.product.pk}/")
+        self.client.get(f"/api/products/{self.other.pk}/")
+        self.client.get(f"/api/categories/{self.other_category.pk}/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = "Renamed phone"
+            self.product.save()
+
+        response = self.client.get(f"/api/products/{self.product.pk}/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["name"], "Renamed phone")
+        self.assertEqual(self.client.get("/api/products/")["X-Cache"], "MISS")
+        self.assertEqual(self.client.get(f"/api/products/{self.other.pk}/")["X-Cache"], "HIT")
+        self.assertEqual(self.client.get(f"/api/categories/{self.other_category.pk}/")["X-Cache"], "HIT")
+
+    def test_variant_and_category_changes_invalidate(self):
+        self.client.get(f"/api/products/{self.product.pk}/")
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductVariant.objects.create(product=self.product, color_name="Black")
+        response = self.client.get(f"/api/products/{self.product.pk}/")
+        self.assertEqual(len(response.json()["variants"]), 1)
+
+        self.client.get(f"/api/products/{self.other.pk}/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other_category.name = "Tablets & iPads"
+            self.other_category.save()
+        self.assertEqual(self.client.get(f"/api/products/{self.other.pk}/")["X-Cache"], "MISS")
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Phones")
+        cls.product = Product.objects.create(category=category, name="Phone", price=Decimal("100.00"))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_matching_etag_returns_304_with_one_query(self):
+        etag = self.client.get("/api/products/")["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_if_modified_since_returns_304(self):
+        last_modified = self.client.get("/api/categories/")["Last-Modified"]
+        response = self.client.get("/api/categories/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_catalog_change_produces_new_etag(self):
+        url = f"/api/products/{self.product.pk}/"
+        etag = self.client.get(url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal("90.00")
+            self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["price"], "90.00")
+
+    def test_etag_varies_with_query(self):
+        self.assertNotEqual(
+            self.client.get("/api/products/?ordering=price")["ETag"],
+            self.client.get("/api/products/?ordering=-price")["ETag"],
+        )
+
+
+# =======================
+#  PRODUCT FILTERS
+# =======================
+class ProductFlagFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Phones")
+        cls.featured = Product.objects.create(category=category, name="A", price=1, is_featured=True)
+        cls.deal = Product.objects.create(category=category, name="B", price=2, is_deal_of_the_day=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_flag_filters(self):
+        response = APIClient().get("/api/products/?is_featured=true")
+        self.assertEqual([p["id"] for p in response.json()["results"]], [self.featured.pk])
+        response = APIClient().get("/api/products/?is_deal_of_the_day=1&is_featured=false")
+        self.assertEqual([p["id"] for p in response.json()["results"]], [self.deal.pk])
+
+    def test_invalid_flag_value_is_rejected(self):
+        response = APIClient().get("/api/products/?is_new=maybe")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("is_new", response.json())
+
+
+# =======================
+#  KEYSET PAGINATION
+# =======================
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Phones")
+        cls.products = [
+            Product.objects.create(category=category, name=f"Phone {i}", price=10 * (i // 2))
+            for i in range(5)
+        ]
+        # Every row shares one created_at, so only the id breaks ties.
+        Product.objects.update(created_at=timezone.now())
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def pages(self, url, direction="next"):
+        pages = []
+        while url:
+            body = self.client.get(url).json()
+            pages.append([p["id"] for p in body["results"]])
+            url = body[direction]
+        return pages
+
+    def test_ties_on_created_at_span_pages(self):
+        pages = self.pages("/api/products/?page_size=2")
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), sorted((p.pk for p in self.products), reverse=True))
+
+    def test_previous_links_walk_back(self):
+        last = self.client.get("/api/products/?page_size=2").json()
+        last = self.client.get(self.client.get(last["next"]).json()["next"]).json()
+        self.assertIsNone(last["next"])
+        forward = self.pages("/api/products/?page_size=2")
+        backward = self.pages(last["previous"], direction="previous")
+        self.assertEqual(backward, forward[-2::-1])
+
+    def test_page_size_settings_apply_per_request(self):
+        with override_settings(API_PAGE_SIZE=2, API_MAX_PAGE_SIZE=3):
+            self.assertEqual([len(page) for page in self.pages("/api/products/")], [2, 2, 1])
+            self.assertEqual([len(page) for page in self.pages("/api/products/?page_size=10")], [3, 2])
+
+    def test_ordering_by_price(self):
+        pages = self.pages("/api/products/?ordering=price&page_size=2")
+        expected = [p.pk for p in sorted(self.products, key=lambda p: (p.price, p.pk))]
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_bad_cursor_is_not_found(self):
+        for position in ('["garbage",1]', "[1]", "{}"):
+            cursor = b64encode(urlencode({"p": position}).encode()).decode()
+            response = self.client.get("/api/products/", {"cursor": cursor})
+            self.assertEqual(response.status_code, 404, position)
+        self.assertEqual(self.client.get("/api/products/", {"cursor": "%%%"}).status_code, 404)
+
+
+# =======================
+#  CATALOG SERIALIZERS
+# =======================
+class CategoryListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = [Category.objects.create(name=f"Category {i}") for i in range(3)]
+        for i, category in enumerate(cls.categories):
+            for n in range(i + 1):
+                product = Product.objects.create(category=category, name=f"Product {i}.{n}", price=10)
+                ProductVariant.objects.create(product=product, color_name="Black")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_list_rows_are_shallow(self):
+        rows = self.client.get("/api/categories/").json()["results"]
+        self.assertEqual({tuple(sorted(row)) for row in rows}, {("category_id", "image", "name", "product_count")})
+        self.assertEqual(
+            {row["category_id"]: row["product_count"] for row in rows},
+            {category.pk: i + 1 for i, category in enumerate(self.categories)},
+        )
+
+    def test_list_query_count_does_not_grow_with_products(self):
+        # CatalogVersion (ETag) + the annotated category page.
+        with self.assertNumQueries(2):
+            self.client.get("/api/categories/")
+        Product.objects.create(category=self.categories[0], name="Extra", price=10)
+        cache.clear()
+        with self.assertNumQueries(2):
+            self.client.get("/api/categories/")
+
+    def test_detail_and_expand_keep_the_product_tree(self):
+        detail = self.client.get(f"/api/categories/{self.categories[2].pk}/").json()
+        self.assertEqual(len(detail["products"]), 3)
+        self.assertEqual(len(detail["products"][0]["variants"]), 1)
+        rows = self.client.get("/api/categories/?expand=products").json()["results"]
+        self.assertTrue(all("products" in row for row in rows))
+
+
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Phones")
+        cls.product = Product.objects.create(category=cls.category, name="Phone", price=10)
+        ProductVariant.objects.create(product=cls.product, color_name="Black", storage_option="128GB")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get_product(self, **params):
+        response = self.client.get(f"/api/products/{self.product.pk}/", params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_fields_and_omit(self):
+        self.assertEqual(self.get_product(fields="id,name").json(), {"id": self.product.pk, "name": "Phone"})
+        body = self.get_product(omit="variants,availability_map,description").json()
+        self.assertNotIn("variants", body)
+        self.assertNotIn("availability_map", body)
+        self.assertEqual(body["available_storages"], ["128GB"])
+
+    def test_expand_nests_the_category(self):
+        self.assertEqual(self.get_product(fields="id,category").json()["category"], self.category.pk)
+        self.assertEqual(self.get_product(fields="id,category", expand="category").json()["category"], {
+            "category_id": self.category.pk, "name": "Phones", "image": None,
+        })
+
+    def test_unknown_names_are_ignored(self):
+        self.assertEqual(self.get_product(fields="id,bogus").json(), {"id": self.product.pk})
+        self.assertIn("name", self.get_product(omit="bogus", expand="bogus").json())
+
+    def test_cache_key_and_etag_vary_with_the_selection(self):
+        by_id = self.get_product(fields="id")
+        by_name = self.get_product(fields="name")
+        self.assertEqual(by_name["X-Cache"], "MISS")
+        self.assertEqual(by_name.json(), {"name": "Phone"})
+        self.assertNotEqual(by_id["ETag"], by_name["ETag"])
+        self.assertEqual(self.get_product(fields="id")["X-Cache"], "HIT")
+        response = self.client.get(
+            f"/api/products/{self.product.pk}/", {"fields": "name"}, HTTP_IF_NONE_MATCH=by_id["ETag"],
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class VariantSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Phones")
+        cls.bare = Product.objects.create(category=category, name="No variants", price=10)
+        cls.sold_out = Product.objects.create(category=category, name="Sold out", price=10)
+        for color in ("Black", "White"):
+            ProductVariant.objects.create(product=cls.sold_out, color_name=color, stock=0)
+        cls.mixed = Product.objects.create(category=category, name="Mixed", price=10)
+        for color, code, storage, stock in [
+            ("Black", "#000000", "128GB", 3), ("Black", "#000000", "256GB", 0),
+            ("White", None, "128GB", 1), ("White", None, "128GB", 2),  # duplicate pair
+            (None, None, None, 0), (None, None, "64GB", 1),
+        ]:
+            ProductVariant.objects.create(
+                product=cls.mixed, color_name=color, color_code=code, storage_option=storage, stock=stock,
+            )
+
+    def test_matches_the_per_variant_computation(self):
+        for product in Product.objects.prefetch_related("variants").order_by("pk"):
+            with self.subTest(product=product.name):
+                self.assertEqual(summarize_variants(product.variants.all()), legacy_summary(product))
+
+    def test_products_without_variants(self):
+        self.assertEqual(summarize_variants([]), {
+            "available_colors": [], "available_storages": [], "availability_map": {}, "storage_map": {},
+        })
+
+
+# =======================
+#  SEARCH
+# =======================
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Phones")
+        cls.iphone = Product.objects.create(
+            category=category, name="iPhone 15 Pro", description="Apple smartphone", price=1000,
+        )
+        cls.case = Product.objects.create(
+            category=category, name="Leather case", description="Fits the iPhone 15", price=50,
+        )
+        cls.galaxy = Product.objects.create(
+            category=category, name="Galaxy S24", description="Samsung smartphone", price=900,
+        )
+
+    def setUp(self):
+        cache.clear()
+        InvertedIndexBackend.reset()
+        self.client = APIClient()
+
+    def _search(self, query, **params):
+        response = self.client.get("/api/products/", {"search": query, **params})
+        return [p["id"] for p in response.json()["results"]]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self._search("iphone"), [self.iphone.pk, self.case.pk])
+
+    def test_prefix_and_all_terms_required(self):
+        self.assertCountEqual(self._search("smartph"), [self.iphone.pk, self.galaxy.pk])
+        self.assertEqual(self._search("sams smart"), [self.galaxy.pk])
+        self.assertEqual(self._search("nokia"), [])
+
+    def test_ranked_results_paginate_with_cursor(self):
+        response = self.client.get("/api/products/", {"search": "iphone", "page_size": 1}).json()
+        second = self.client.get(response["next"]).json()
+        self.assertEqual(
+            [p["id"] for p in response["results"] + second["results"]],
+            [self.iphone.pk, self.case.pk],
+        )
+
+    def test_explicit_ordering_overrides_relevance(self):
+        self.assertEqual(self._search("iphone", ordering="price"), [self.case.pk, self.iphone.pk])
+
+    def test_index_follows_saves_and_deletes(self):
+        self._search("galaxy")  # builds the index
+        with self.captureOnCommitCallbacks(execute=True):
+            self.galaxy.name = "Pixel 8"
+            self.galaxy.save()
+        self.assertEqual(self._search("pixel"), [self.galaxy.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.galaxy.delete()
+        self.assertEqual(self._search("pixel"), [])
+
+    def test_searches_while_the_index_changes(self):
+        index = InvertedIndex(["name"])
+        index.build((pk, f"phone model{pk}") for pk in range(200))
+        stop, errors = threading.Event(), []
+
+        def churn():
+            pk = 200
+            while not stop.is_set():
+                index.add(pk, [f"phone model{pk}"])
+                index.remove(pk - 150)
+                pk += 1
+
+        writer = threading.Thread(target=churn)
+        writer.start()
+        try:
+            for _ in range(200):
+                try:
+                    index.search(["phone mod"])
+                except Exception as exc:  # pragma: no cover - the failure being tested
+                    errors.append(exc)
+        finally:
+            stop.set()
+            writer.join()
+        self.assertEqual(errors, [])
+
+    def test_stale_index_is_rebuilt_in_the_background(self):
+        self._search("galaxy")  # first build, on this thread
+        key = (Product._meta.label, ("name", "description"))
+        old = InvertedIndexBackend._indexes[key]
+        fresh = InvertedIndex(["name", "description"])
+        fresh.build([(self.galaxy.pk, "Galaxy S24", "")])
+        release = threading.Event()
+
+        def slow_build(model, fields):
+            release.wait(5)
+            return fresh
+
+        with mock.patch.object(InvertedIndexBackend, "_build", side_effect=slow_build), \
+                override_settings(SEARCH_INDEX_MAX_AGE=0):
+            # Served by the old index while the rebuild waits.
+            self.assertEqual(self._search("iphone"), [self.iphone.pk, self.case.pk])
+            self.assertIs(InvertedIndexBackend._indexes[key], old)
+            self.iphone.name = "Pixel 8"
+            InvertedIndexBackend.update(self.iphone)  # lands during the rebuild
+            rebuild = next(t for t in threading.enumerate() if t.name.startswith("search-index-rebuild"))
+            release.set()
+            rebuild.join(5)
+
+        self.assertIs(InvertedIndexBackend._indexes[key], fresh)
+        self.assertEqual([pk for pk, _ in fresh.search(["pixel"])], [self.iphone.pk])
+
+
+class SuggestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.phones = Category.objects.create(name="Phones")
+        cls.iphone = Product.objects.create(category=cls.phones, name="iPhone 15 Pro", price=1000)
+        cls.iphone_case = Product.objects.create(category=cls.phones, name="Clear case for iPhone", price=20)
+        Product.objects.create(category=cls.phones, name="Galaxy S24", price=900)
+
+    def setUp(self):
+        SuggestionIndex.reset()
+        self.client = APIClient()
+
+    def _suggest(self, q, **params):
+        return self.client.get("/api/products/suggest/", {"q": q, **params}).json()
+
+    def test_prefix_matches_products_and_categories(self):
+        self.assertEqual(
+            [(s["type"], s["id"]) for s in self._suggest("ip")],
+            [("product", self.iphone.pk), ("product", self.iphone_case.pk)],
+        )
+        self.assertEqual(self._suggest("pho")[0], {
+            "type": "category", "id": self.phones.pk, "name": "Phones", "thumbnail": None,
+        })
+
+    def test_every_word_must_match(self):
+        self.assertEqual([s["id"] for s in self._suggest("iphone cle")], [self.iphone_case.pk])
+        self.assertEqual(self._suggest("iphone galaxy"), [])
+
+    def test_limit_and_no_queries_once_built(self):
+        self._suggest("a")
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self._suggest("i", limit=1)), 1)
+
+    def test_index_follows_saves_and_deletes(self):
+        self._suggest("x")
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(category=self.phones, name="Pixel 8", price=700)
+        self.assertEqual([s["id"] for s in self._suggest("pix")], [product.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(self._suggest("pix"), [])
+
+    def test_suggest_while_the_index_changes(self):
+        index = SuggestionIndex()
+        for pk in range(200):
+            index.add(Product(pk=pk, name=f"Phone model{pk}"))
+        stop, errors = threading.Event(), []
+
+        def churn():
+            pk = 200
+            while not stop.is_set():
+                index.add(Product(pk=pk, name=f"Phone model{pk}"))
+                index.remove("product", pk - 150)
+                pk += 1
+
+        writer = threading.Thread(target=churn)
+        writer.start()
+        try:
+            for _ in range(200):
+                try:
+                    for record in index.suggest("phone mod", limit=20):
+                        self.assertTrue(record["name"].startswith("Phone model"))
+                except Exception as exc:  # pragma: no cover - the failure being tested
+                    errors.append(exc)
+        finally:
+            stop.set()
+            writer.join()
+        self.assertEqual(errors, [])
+
+    def test_stale_index_is_rebuilt_in_the_background(self):
+        old = SuggestionIndex.get()
+        fresh = SuggestionIndex()
+        release = threading.Event()
+
+        def slow_build():
+            release.wait(5)
+            return fresh
+
+        with mock.patch.object(SuggestionIndex, "_build", side_effect=slow_build), \
+                override_settings(SEARCH_INDEX_MAX_AGE=0):
+            self.assertEqual(self._suggest("galaxy")[0]["name"], "Galaxy S24")  # old index, no wait
+            SuggestionIndex.instance_saved(Product(pk=999, name="Pixel 8"))  # lands during the rebuild
+            rebuild = next(t for t in threading.enumerate() if t.name == "suggestion-index-rebuild")
+            release.set()
+            rebuild.join(5)
+
+        self.assertIsNot(old, fresh)
+        self.assertIs(SuggestionIndex.get(), fresh)
+        self.assertEqual([s["id"] for s in fresh.suggest("pix")], [999])
+
+
+# =======================
+#  IMAGE URLS
+# =======================
+class ImageURLCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Phones", image="image/upload/v1/categories/phones")
+        cls.product = Product.objects.create(
+            category=category, name="iPhone", price=1000, main_image="image/upload/v1/products/iphone",
+        )
+        ProductVariant.objects.create(
+            product=cls.product, color_name="Black", price=1000, image_main="image/upload/v1/variants/black",
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_urls_are_computed_on_save(self):
+        urls = self.product.image_urls["main_image"]
+        self.assertEqual(urls["original"], self.product.main_image.url)
+        self.assertIn("c_fill,f_auto,h_300,q_auto,w_300", urls["thumbnail"])
+        self.assertIsNone(self.product.image_urls["image1"])
+
+    def test_list_builds_no_urls(self):
+        with mock.patch.object(CloudinaryResource, "build_url", side_effect=AssertionError("SDK call")):
+            response = self.client.get("/api/products/", {"image_size": "thumbnail"})
+        product = response.json()["results"][0]
+        self.assertEqual(product["main_image"], self.product.image_urls["main_image"]["thumbnail"])
+        self.assertIn("h_300", product["variants"][0]["main_image"])
+
+    def test_default_size_is_original(self):
+        product = self.client.get(f"/api/products/{self.product.pk}/").json()
+        self.assertEqual(product["main_image"], self.product.image_urls["main_image"]["original"])
+
+    def test_unknown_size_is_rejected(self):
+        response = self.client.get("/api/products/", {"image_size": "huge"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("image_size", response.json())
+
+    def test_rows_without_cache_fall_back_and_refresh(self):
+        Product.objects.filter(pk=self.product.pk).update(image_urls={})
+        product = self.client.get(f"/api/products/{self.product.pk}/").json()
+        self.assertEqual(product["main_image"], self.product.image_urls["main_image"]["original"])
+        call_command("refresh_image_urls", stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertIn("main_image", self.product.image_urls)
+
+    def test_refresh_invalidates_cached_responses(self):
+        url = f"/api/products/{self.product.pk}/"
+        etag = self.client.get(url)["ETag"]
+        Product.objects.filter(pk=self.product.pk).update(main_image="image/upload/v1/products/new")
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("refresh_image_urls", stdout=StringIO())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertIn("products/new", response.json()["main_image"])
+
+
+class CatalogImportExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        phones = Category.objects.create(name="Phones", image="image/upload/v1/categories/phones")
+        cls.product = Product.objects.create(
+            category=phones, name="iPhone", price=Decimal("1000.00"), stock=5, is_featured=True,
+            main_image="image/upload/v1/products/iphone",
+        )
+        ProductVariant.objects.create(product=cls.product, color_name="Black", storage_option="128GB", price=1000)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def export(self, kind, fmt):
+        path = os.path.join(self.tmp.name, f"{kind}.{fmt}")
+        call_command("export_catalog", kind, path, stderr=StringIO())
+        with open(path, encoding="utf-8") as stream:
+            return path, stream.read()
+
+    def load(self, kind, path, **options):
+        call_command("import_catalog", kind, path, stdout=StringIO(), **options)
+
+    def test_round_trip_is_idempotent(self):
+        for fmt in ("csv", "jsonl"):
+            for kind in ("category", "product", "variant"):
+                path, _ = self.export(kind, fmt)
+                self.load(kind, path, chunk_size=1)
+        self.assertEqual(Category.objects.count(), 1)
+        self.assertEqual(Product.objects.count(), 1)
+        self.assertEqual(ProductVariant.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, Decimal("1000.00"))
+        self.assertTrue(self.product.is_featured)
+        self.assertEqual(self.product.main_image.public_id, "products/iphone")
+
+    def test_csv_upserts_by_natural_key(self):
+        path, text = self.export("product", "csv")
+        lines = text.splitlines()
+        with open(path, "w", encoding="utf-8") as stream:
+            stream.write("\n".join([lines[0], lines[1].replace("1000.00", "900.00")]) + "\n")
+            stream.write("Phones,Pixel,,500,,3,,,,,,false,true,1,0,\n")
+        self.load("product", path)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, Decimal("900.00"))
+        pixel = Product.objects.get(name="Pixel")
+        self.assertEqual((pixel.stock, pixel.is_featured, pixel.is_new), (3, True, True))
+        self.assertIsNone(pixel.abroad_delivery_days)
+        self.assertIn("main_image", pixel.image_urls)
+
+    def test_jsonl_variants_match_on_colour_and_storage(self):
+        path = os.path.join(self.tmp.name, "variants.jsonl")
+        with open(path, "w", encoding="utf-8") as stream:
+            stream.write('{"category": "Phones", "product": "iPhone", "color_name": "Black", '
+                         '"storage_option": "128GB", "price": "950", "stock": 2}\n')
+            stream.write('{"category": "Phones", "product": "iPhone", "color_name": "Black", '
+                         '"storage_option": "256GB", "price": "1100", "stock": 1}\n')
+        self.load("variant", path)
+        self.assertEqual(
+            sorted(self.product.variants.values_list("storage_option", "price")),
+            [("128GB", Decimal("950.00")), ("256GB", Decimal("1100.00"))],
+        )
+
+    def test_queries_scale_with_chunks_not_rows(self):
+        rows = ((n, {"category": "Phones", "name": f"Phone {n}", "price": "10"}) for n in range(50))
+        with CaptureQueriesContext(connection) as ctx:
+            import_rows("product", rows, chunk_size=25)
+        # Per chunk: category lookup, product lookup, insert, plus savepoints.
+        self.assertLessEqual(len(ctx.captured_queries), 2 * 6 + 2)
+        self.assertEqual(Product.objects.count(), 51)
+
+    def test_unknown_category_reports_the_row(self):
+        rows = read_rows(StringIO("category,name,price\nPhones,Ok,1\nTablets,iPad,1\n"), "csv")
+        with self.assertRaisesMessage(CatalogImportError, "row 3: unknown category 'Tablets'"):
+            import_rows("product", rows, chunk_size=10)
+        self.assertFalse(Product.objects.filter(name="Ok").exists())
+
+    def test_field_validators_report_the_row(self):
+        for bad_row, message in [
+            ("Phones,Bad,1,-5", "row 3: stock: Ensure this value is greater than or equal to 0."),
+            ("Phones,Bad,1e20,1", "row 3: price: Ensure that there are no more than 10 digits in total."),
+        ]:
+            rows = read_rows(StringIO(f"category,name,price,stock\nPhones,Ok,1,1\n{bad_row}\n"), "csv")
+            with self.assertRaisesMessage(CatalogImportError, message):
+                import_rows("product", rows, chunk_size=10)
+        self.assertFalse(Product.objects.filter(name__in=["Ok", "Bad"]).exists())
+
+    def test_padded_keys_are_stored_stripped(self):
+        for _ in range(2):
+            import_rows("product", [(2, {"category": "Phones", "name": " Galaxy ", "price": "1"})])
+            import_rows("variant", [(2, {"category": "Phones", "product": "Galaxy",
+                                         "color_name": " Blue ", "storage_option": " 64GB "})])
+        galaxy = Product.objects.get(name="Galaxy")
+        self.assertEqual(list(galaxy.variants.values_list("color_name", "storage_option")), [("Blue", "64GB")])
+
+    def test_unknown_boolean_reports_the_row(self):
+        rows = read_rows(StringIO("category,name,price,is_new\nPhones,Ok,1,yes\nPhones,Bad,1,maybe\n"), "csv")
+        with self.assertRaisesMessage(CatalogImportError, "row 3: is_new: 'maybe' is not a boolean"):
+            import_rows("product", rows, chunk_size=10)
+
+    def test_database_errors_report_the_chunk(self):
+        rows = [(2, {"category": "Phones", "name": "Ok", "price": "1"}),
+                (3, {"category": "Phones", "name": "Bad", "price": "1"})]
+        with mock.patch.object(Product.objects, "bulk_create", side_effect=IntegrityError("boom")):
+            with self.assertRaisesMessage(CatalogImportError, "rows 2-3: boom"):
+                import_rows("product", rows, chunk_size=10)
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser("admin@example.com", "admin", "secret123")
+        cls.category = Category.objects.create(name="Phones")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, n):
+        start = CustomUser.objects.count()
+        for i in range(start, start + n):
+            user = CustomUser.objects.create_user(f"u{i}@example.com", f"u{i}", None)
+            product = Product.objects.create(
+                category=self.category, name=f"Phone {i}", price=10, main_image="image/upload/v1/products/p",
+            )
+            variant = ProductVariant.objects.create(product=product, color_name="Black", price=10)
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=product, variant=variant)
+            order = Order.objects.create(user=user, total_amount=10)
+            OrderItem.objects.create(order=order, product=product, variant=variant, price=10)
+
+    def changelist_queries(self, model):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f"/admin/store/{model}/")
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_changelists_run_constant_queries(self):
+        models = ("product", "cart", "cartitem", "order", "orderitem")
+        self.add_rows(1)
+        baseline = {model: self.changelist_queries(model) for model in models}
+        self.add_rows(4)
+        with mock.patch.object(CloudinaryResource, "build_url", side_effect=AssertionError("SDK call")):
+            self.assertEqual({model: self.changelist_queries(model) for model in models}, baseline)
+
+    def page_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_change_and_delete_pages_run_constant_queries(self):
+        self.add_rows(1)
+        item, order_item = CartItem.objects.get(), OrderItem.objects.get()
+        urls = [
+            f"/admin/store/cartitem/{item.pk}/change/",
+            f"/admin/store/cartitem/{item.pk}/delete/",
+            f"/admin/store/orderitem/{order_item.pk}/change/",
+            f"/admin/store/order/{order_item.order_id}/delete/",
+            f"/admin/store/cart/{item.cart_id}/delete/",
+        ]
+        for url in urls:
+            self.page_queries(url)  # warm up: the first request loads more
+        baseline = [self.page_queries(url) for url in urls]
+        self.add_rows(4)
+        self.assertEqual([self.page_queries(url) for url in urls], baseline)
+
+    def test_order_pages_survive_deleted_products(self):
+        self.add_rows(1)
+        order_item = OrderItem.objects.get()
+        order_item.product.delete()
+        order_item.refresh_from_db()
+        self.assertEqual(str(order_item), "1 x deleted product")
+        for url in (f"/admin/store/orderitem/{order_item.pk}/change/",
+                    f"/admin/store/order/{order_item.order_id}/delete/"):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_large_tables_use_estimated_count(self):
+        self.add_rows(2)
+        with mock.patch("store.admin.estimated_row_count", return_value=250000):
+            response = self.client.get("/admin/store/order/")
+            self.assertEqual(response.context["cl"].result_count, 250000)
+            response = self.client.get("/admin/store/order/", {"status": "pending"})
+            self.assertEqual(response.context["cl"].result_count, 2)
+        with override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=10 ** 9), \
+                mock.patch("store.admin.estimated_row_count", return_value=250000):
+            self.assertEqual(self.client.get("/admin/store/order/").context["cl"].result_count, 2)
+
+
+# The store routes as backend/asgi.py serves them (ASYNC_READ_VIEWS on).
+class ASYNC_URLCONF:
+    urlpatterns = [path("api/", include(async_read_routes(router.urls)))]
+
+
+class AsyncReadViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("buyer@example.com", "buyer", None)
+        other = CustomUser.objects.create_user("other@example.com", "other", None)
+        category = Category.objects.create(name="Phones", image="image/upload/v1/categories/phones")
+        cls.products = [
+            Product.objects.create(category=category, name=f"Phone {i}", price=Decimal(100 + i))
+            for i in range(3)
+        ]
+        ProductVariant.objects.create(product=cls.products[0], color_name="Black", price=100)
+        cls.cart = Cart.objects.create(user=cls.user)
+        CartItem.objects.create(cart=cls.cart, product=cls.products[0], quantity=2)
+        cls.other_cart = Cart.objects.create(user=other)
+
+    def setUp(self):
+        cache.clear()
+        self.token = f"Bearer {tokens_for_user(self.user).access_token}"
+
+    def get_both(self, url, **headers):
+        cache.clear()
+        sync = self.client.get(url, **headers)
+        cache.clear()
+        with override_settings(ROOT_URLCONF=ASYNC_URLCONF):
+            return sync, self.client.get(url, **headers)
+
+    def test_hot_reads_are_async_views(self):
+        with override_settings(ROOT_URLCONF=ASYNC_URLCONF):
+            for url in ("/api/products/", f"/api/products/{self.products[0].pk}/",
+                        "/api/categories/", f"/api/carts/{self.cart.pk}/"):
+                self.assertTrue(iscoroutinefunction(resolve(url).func), url)
+            self.assertFalse(iscoroutinefunction(resolve(f"/api/categories/{self.cart.pk}/").func))
+
+    def test_responses_match_sync_views(self):
+        urls = [
+            "/api/products/?page_size=2",
+            "/api/products/?fields=id,name&ordering=price&is_new=false",
+            f"/api/products/{self.products[0].pk}/?image_size=thumbnail",
+            "/api/categories/",
+            "/api/products/?search=phone",  # served by the sync fallback
+        ]
+        for url in urls:
+            sync, async_ = self.get_both(url)
+            self.assertEqual(async_.status_code, 200, url)
+            self.assertEqual(async_.json(), sync.json(), url)
+        sync, async_ = self.get_both(f"/api/carts/{self.cart.pk}/", HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(async_.json(), sync.json())
+        self.assertEqual(async_.json()["items"][0]["quantity"], 2)
+
+    def test_errors_match_sync_views(self):
+        for url, headers in [
+            ("/api/products/999999/", {}),
+            ("/api/products/?is_new=maybe", {}),
+            (f"/api/carts/{self.cart.pk}/", {}),
+            (f"/api/carts/{self.other_cart.pk}/", {"HTTP_AUTHORIZATION": self.token}),
+        ]:
+            sync, async_ = self.get_both(url, **headers)
+            self.assertEqual((async_.status_code, async_.json()), (sync.status_code, sync.json()), url)
+
+    def test_cache_and_conditional_get(self):
+        with override_settings(ROOT_URLCONF=ASYNC_URLCONF):
+            first = self.client.get("/api/products/")
+            second = self.client.get("/api/products/")
+            self.assertEqual((first["X-Cache"], second["X-Cache"]), ("MISS", "HIT"))
+            self.assertEqual(second.content, first.content)
+            response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=first["ETag"])
+            self.assertEqual(response.status_code, 304)
+
+    def test_writes_fall_back_to_sync_view(self):
+        with override_settings(ROOT_URLCONF=ASYNC_URLCONF):
+            response = self.client.delete(f"/api/carts/{self.cart.pk}/", HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Cart.objects.filter(pk=self.cart.pk).exists())
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        start_request()
+        self.addCleanup(start_request)
+
+    @override_settings(REPLICA_DATABASES=["replica1"])
+    def test_only_catalog_reads_in_replica_views_leave_the_primary(self):
+        self.assertIsNone(self.router.db_for_read(Product))
+        allow_replica_reads()
+        for model in (Category, Product, ProductVariant, CatalogVersion):
+            self.assertEqual(self.router.db_for_read(model), "replica1")
+        for model in (Cart, CartItem, Order, OrderItem, CustomUser):
+            self.assertIsNone(self.router.db_for_read(model))
+
+    @override_settings(REPLICA_DATABASES=["replica1"])
+    def test_a_write_pins_the_rest_of_the_request_to_the_primary(self):
+        allow_replica_reads()
+        execute = mock.Mock()
+        track_writes(execute, "SELECT 1", None, False, {})
+        self.assertEqual(self.router.db_for_read(Product), "replica1")
+        track_writes(execute, ' UPDATE "store_product" SET stock = 1', None, False, {})
+        self.assertIsNone(self.router.db_for_read(Product))
+        self.assertEqual(execute.call_count, 2)
+
+    def test_no_replicas_configured(self):
+        allow_replica_reads()
+        self.assertIsNone(self.router.db_for_read(Product))
+
+
+REPLICA = "replica_test"
+
+
+@override_settings(REPLICA_DATABASES=[REPLICA])
+class ReplicaReadTests(TestCase):
+    """
+    Runs against a second in-memory SQLite database, migrated for this class
+    only. It is not a test mirror, so its rows differ from the primary's and
+    tell which database answered.
+    """
+    # The runner sets up "default"; the replica is added in setUpClass().
+    databases = {"default"}
+
+    @classmethod
+    def setUpClass(cls):
+        connections.settings[REPLICA] = connections.configure_settings({
+            "default": connections.settings["default"],
+            REPLICA: {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"},
+        })[REPLICA]
+        cls.addClassCleanup(cls.drop_replica)
+        call_command("migrate", database=REPLICA, verbosity=0)
+        cls.databases = {"default", REPLICA}
+        super().setUpClass()
+
+    @classmethod
+    def drop_replica(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("buyer@example.com", "buyer", None)
+        cls.cart = Cart.objects.create(user=cls.user)
+        cls.phone = Product.objects.create(
+            category=Category.objects.create(name="Phones"), name="Primary phone", price=10, stock=5,
+        )
+        # Deliberately different rows, to tell which database answered.
+        cls.replica_phone = Product.objects.using(REPLICA).create(
+            category=Category.objects.using(REPLICA).create(name="Phones"), name="Replica phone", price=10,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def product_names(self, query=""):
+        return [p["name"] for p in self.client.get(f"/api/products/{query}").json()["results"]]
+
+    def test_catalog_reads_use_the_replica(self):
+        self.assertEqual(self.product_names(), ["Replica phone"])
+        self.assertEqual(self.client.get("/api/categories/").json()["results"][0]["product_count"], 1)
+        self.assertEqual(
+            self.client.get(f"/api/products/{self.replica_phone.pk}/").json()["name"], "Replica phone"
+        )
+
+    def test_user_reads_the_primary_after_writing(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.user).access_token}")
+        self.assertEqual(self.product_names(), ["Replica phone"])
+        response = self.client.post(
+            f"/api/carts/{self.cart.pk}/items/batch/",
+            {"operations": [{"op": "add", "product": self.phone.pk}]}, format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        # A new query string skips the cached response.
+        self.assertEqual(self.product_names("?page_size=5"), ["Primary phone"])
+        self.assertEqual(APIClient().get("/api/products/?page_size=6").json()["results"][0]["name"],
+                         "Replica phone")
+
+    def test_cart_reads_stay_on_the_primary(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get("/api/carts/").json()[0]["id"], self.cart.pk)
+
+    def test_lagging_replica_responses_are_not_cached_after_a_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.phone.pk).update(name="Renamed phone")
+            bump_versions("product-list")
+        for _ in range(2):
+            response = APIClient().get("/api/products/")
+            self.assertEqual(response["X-Cache"], "MISS")
+            self.assertEqual(response.json()["results"][0]["name"], "Replica phone")
+
+        # Once the lag window has passed the replica is trusted again.
+        with override_settings(REPLICA_STICKY_SECONDS=0):
+            self.assertEqual(APIClient().get("/api/products/")["X-Cache"], "MISS")
+        self.assertEqual(APIClient().get("/api/products/")["X-Cache"], "HIT")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.alive = True
+
+    def ping(self):
+        if not self.alive:
+            raise OSError("gone away")
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def make_pool(self, **kwargs):
+        self.opened = []
+
+        def connect():
+            self.opened.append(FakeConnection())
+            return self.opened[-1]
+        return ConnectionPool(connect, ping=FakeConnection.ping, **kwargs)
+
+    def test_released_connections_are_reused(self):
+        pool = self.make_pool(size=2)
+        conn = pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_waits_then_times_out_when_exhausted(self):
+        pool = self.make_pool(size=1, timeout=0.05)
+        conn = pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+
+    def test_dead_old_and_discarded_connections_are_replaced(self):
+        pool = self.make_pool(size=1, recycle=3600)
+        dead = pool.acquire()
+        pool.release(dead)
+        dead.alive = False
+        fresh = pool.acquire()
+        self.assertIsNot(fresh, dead)
+        self.assertTrue(dead.closed)
+
+        pool.recycle = -1
+        pool.release(fresh)
+        self.assertIsNot(pool.acquire(), fresh)
+        self.assertTrue(fresh.closed)
+
+        broken = self.opened[-1]
+        pool.release(broken, discard=True)
+        self.assertTrue(broken.closed)
+        self.assertIsNot(pool.acquire(), broken)
+
+    @override_settings(DB_POOL_RETRY_AFTER=3)
+    def test_exhausted_pool_answers_503_with_retry_after(self):
+        with mock.patch("store.views.ProductViewSet.list", side_effect=PoolTimeout("No database connection free")):
+            response = APIClient().get("/api/products/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "3")
+        self.assertIn("retry", response.json()["detail"])
+
+
+# =======================
+#  PERFORMANCE BUDGETS
+# =======================
+# queries: maximum SQL statements for one request
+# max_bytes: response body size
+# p50_ms / p95_ms: request latency through the test client, scaled by
+#   STORE_PERF_LATENCY_FACTOR so slow machines can loosen them. Wall-clock
+#   budgets depend on the machine, so they are only checked with
+#   STORE_PERF_TIMINGS=1; the query and size budgets always run.
+# runs: timed repetitions (auth routes hash passwords, so they run fewer)
+Budget = namedtuple("Budget", "queries p50_ms p95_ms max_bytes runs", defaults=(40,))
+
+PERF_SCALE = int(os.getenv("STORE_PERF_SCALE", "1"))
+PERF_TIMINGS = os.getenv("STORE_PERF_TIMINGS", "").lower() in ("1", "true", "yes")
+PERF_LATENCY_FACTOR = float(os.getenv("STORE_PERF_LATENCY_FACTOR", "1"))
+
+
+class StoreApiPerformanceTests(TestCase):
+    """
+    Query-count, latency and payload budgets for every route in store/urls.py.
+
+    Latency budgets run against SQLite with:
+        USE_SQLITE=1 STORE_PERF_TIMINGS=1 python manage.py test store.tests.StoreApiPerformanceTests
+    Raise STORE_PERF_SCALE to seed a bigger catalog.
+    """
+
+    BUDGETS = {
+        "api-root": Budget(queries=0, p50_ms=10, p95_ms=25, max_bytes=1_000),
+        "category-list": Budget(queries=2, p50_ms=25, p95_ms=50, max_bytes=10_000),
+        "category-detail": Budget(queries=4, p50_ms=100, p95_ms=250, max_bytes=150_000),
+        "product-list": Budget(queries=3, p50_ms=75, p95_ms=150, max_bytes=80_000),
+        "product-list-grid": Budget(queries=2, p50_ms=25, p95_ms=50, max_bytes=10_000),
+        "product-detail": Budget(queries=3, p50_ms=30, p95_ms=60, max_bytes=8_000),
+        "cart-list": Budget(queries=3, p50_ms=50, p95_ms=100, max_bytes=40_000),
+        "cart-detail": Budget(queries=3, p50_ms=50, p95_ms=100, max_bytes=40_000),
+        "cart-summary": Budget(queries=1, p50_ms=10, p95_ms=20, max_bytes=200),
+        "cart-batch": Budget(queries=9, p50_ms=30, p95_ms=60, max_bytes=2_000),
+        "cart-reserve": Budget(queries=6, p50_ms=30, p95_ms=60, max_bytes=200),
+        # One guarded stock UPDATE per line: 25 is for the seeded ten-line cart.
+        "cart-checkout": Budget(queries=25, p50_ms=60, p95_ms=120, max_bytes=40_000),
+        "order-list": Budget(queries=3, p50_ms=75, p95_ms=150, max_bytes=80_000),
+        "order-detail": Budget(queries=3, p50_ms=40, p95_ms=80, max_bytes=20_000),
+        "register": Budget(queries=6, p50_ms=1_500, p95_ms=3_000, max_bytes=2_000, runs=3),
+        "login": Budget(queries=1, p50_ms=1_500, p95_ms=3_000, max_bytes=2_000, runs=3),
+        "token-refresh": Budget(queries=1, p50_ms=20, p95_ms=40, max_bytes=1_000),
+        "product-suggest": Budget(queries=0, p50_ms=5, p95_ms=10, max_bytes=3_000),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            "seed_catalog",
+            categories=5 * PERF_SCALE,
+            products_per_category=40 * PERF_SCALE,
+            variants_per_product=6,
+            users=5,
+            cart_items=10,
+            orders_per_user=5,
+            items_per_order=4,
+            prefix="perf",
+            stdout=StringIO(),
+        )
+        cls.user = CustomUser.objects.filter(username__startswith="perf-user").order_by("pk").first()
+        cls.category = Category.objects.order_by("pk").first()
+        cls.product = Product.objects.order_by("pk").first()
+        cls.cart = Cart.objects.get(user=cls.user)
+        cls.order = Order.objects.filter(user=cls.user).first()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self._counter = 0
+
+    def _measure(self, route, request, prepare=None):
+        # prepare() runs before every request, outside the measurement: write
+        # routes like checkout need their starting state back each time.
+        budget = self.BUDGETS[route]
+        cache.clear()
+        if prepare:
+            prepare()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertLess(response.status_code, 300, f"{route}: {response.status_code}")
+        self.assertLessEqual(
+            len(queries), budget.queries,
+            f"{route} ran {len(queries)} queries:\n" + "\n".join(q["sql"] for q in queries),
+        )
+        self.assertLessEqual(len(response.content), budget.max_bytes, f"{route} response too large")
+        if not PERF_TIMINGS:
+            return
+
+        gc.collect()
+        timings = []
+        for _ in range(budget.runs):
+            cache.clear()  # time the full render, not catalog cache hits
+            if prepare:
+                prepare()
+            start = time.perf_counter()
+            request()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p50 = statistics.median(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.assertLessEqual(p50, budget.p50_ms * PERF_LATENCY_FACTOR, f"{route} p50 {p50:.1f}ms")
+        self.assertLessEqual(p95, budget.p95_ms * PERF_LATENCY_FACTOR, f"{route} p95 {p95:.1f}ms")
+
+    def test_api_root(self):
+        self._measure("api-root", lambda: self.client.get("/api/"))
+
+    def test_category_routes(self):
+        self._measure("category-list", lambda: self.client.get("/api/categories/"))
+        self._measure("category-detail", lambda: self.client.get(f"/api/categories/{self.category.pk}/"))
+
+    def test_product_routes(self):
+        self._measure("product-list", lambda: self.client.get("/api/products/"))
+        self._measure(
+            "product-list-grid",
+            lambda: self.client.get("/api/products/?fields=id,name,price,main_image"),
+        )
+        self._measure("product-detail", lambda: self.client.get(f"/api/products/{self.product.pk}/"))
+        SuggestionIndex.reset()
+        SuggestionIndex.get()  # built once per process, not per request
+        self._measure("product-suggest", lambda: self.client.get("/api/products/suggest/?q=perf+prod"))
+
+    def test_cart_routes(self):
+        self._measure("cart-list", lambda: self.client.get("/api/carts/"))
+        self._measure("cart-detail", lambda: self.client.get(f"/api/carts/{self.cart.pk}/"))
+
+    def test_cart_action_routes(self):
+        lines = list(CartItem.objects.filter(cart=self.cart).values("product_id", "variant_id", "quantity"))
+        # Deals, so reserve has lines to hold; enough stock for every timed checkout.
+        Product.objects.filter(pk__in=[line["product_id"] for line in lines]).update(
+            stock=10 ** 6, is_deal_of_the_day=True,
+        )
+
+        def refill():
+            CartItem.objects.filter(cart=self.cart).delete()
+            CartItem.objects.bulk_create([CartItem(cart=self.cart, **line) for line in lines])
+            recalculate_cart_totals(Cart.objects.filter(pk=self.cart.pk))
+
+        base = f"/api/carts/{self.cart.pk}"
+        self._measure("cart-summary", lambda: self.client.get(f"{base}/summary/"))
+        self._measure("cart-batch", lambda: self.client.post(f"{base}/items/batch/", {"operations": [
+            {"op": "add", "product": lines[0]["product_id"]},
+            {"op": "set", "product": lines[1]["product_id"], "quantity": 2},
+        ]}, format="json"), prepare=refill)
+        self._measure("cart-reserve", lambda: self.client.post(f"{base}/reserve/"), prepare=refill)
+        self._measure("cart-checkout", lambda: self.client.post(f"{base}/checkout/"), prepare=refill)
+
+    def test_order_routes(self):
+        self._measure("order-list", lambda: self.client.get("/api/orders/"))
+        self._measure("order-detail", lambda: self.client.get(f"/api/orders/{self.order.pk}/"))
+
+    def test_auth_routes(self):
+        client = APIClient()
+
+        def register():
+            self._counter += 1
+            return client.post("/api/auth/register/", {
+                "email": f"perf-new{self._counter}@example.com",
+                "username": f"perf-new{self._counter}",
+                "password": "password123",
+            })
+
+        self._measure("register", register)
+        self._measure("login", lambda: client.post("/api/auth/login/", {
+            "email_or_username": self.user.email,
+            "password": "password123",
+        }))
+        refresh = str(RefreshToken.for_user(self.user))
+        self._measure("token-refresh", lambda: client.post("/api/auth/token/refresh/", {"refresh": refresh}))
+
+
+@override_settings(PROFILING_TOKEN="secret", PROFILING_SAMPLE_RATE=0)
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Phones")
+        for i in range(3):
+            product = Product.objects.create(category=category, name=f"Phone {i}", price=10 + i)
+            ProductVariant.objects.create(product=product, color_name="Black", price=10 + i)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_unprofiled_requests_are_untouched(self):
+        self.assertFalse(self.client.get("/api/products/").has_header("Server-Timing"))
+        response = self.client.get("/api/products/", HTTP_X_PROFILE="wrong")
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    def test_header_reports_sql_serializer_and_render_time(self):
+        with self.assertLogs("store.profiling", "INFO") as logs:
+            response = self.client.get("/api/products/", HTTP_X_PROFILE="secret")
+        self.assertEqual(response.status_code, 200)
+        metrics = [metric.split(";")[0] for metric in response["Server-Timing"].split(", ")]
+        self.assertEqual(metrics[:4], ["sql", "serialize", "render", "total"])
+        self.assertIn("field", metrics)
+
+        report = logs.records[0].profile
+        self.assertEqual(report["path"], "/api/products/")
+        self.assertGreater(report["queries"], 0)
+        self.assertIn("ProductSerializer.variants", report["fields_ms"])
+        self.assertIn("ProductVariantSerializer.price", report["fields_ms"])
+        self.assertGreater(report["render_ms"], 0)
+
+    def test_profiled_responses_match_unprofiled(self):
+        plain = self.client.get("/api/products/").json()
+        cache.clear()
+        with self.assertLogs("store.profiling", "INFO") as logs:
+            profiled = self.client.get("/api/products/", HTTP_X_PROFILE="secret")
+        self.assertEqual(profiled.json(), plain)
+        self.assertEqual(profiled["X-Cache"], "MISS")
+        self.assertIn("ProductSerializer.category", logs.records[0].profile["fields_ms"])
+
+    def test_sample_rate(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1), self.assertLogs("store.profiling", "INFO"):
+            self.assertTrue(self.client.get("/api/categories/").has_header("Server-Timing"))
+
+    def test_duplicate_queries(self):
+        profile = RequestProfile()
+        for params in ([1], [1], [2]):
+            profile.add_query("default", "SELECT * FROM store_product WHERE id = %s", params, 0.001)
+        self.assertEqual(profile.duplicates(), [
+            {"database": "default", "sql": "SELECT * FROM store_product WHERE id = %s", "count": 2},
+        ])
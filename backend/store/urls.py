@@ -1,8 +1,10 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 from .views import CategoryViewSet, ProductViewSet, CartViewSet, OrderViewSet
 from .auth_views import RegisterView, LoginView
+from .async_views import async_read_routes
 
 router = DefaultRouter()
 router.register(r'categories', CategoryViewSet)
@@ -10,8 +12,12 @@ router.register(r'products', ProductViewSet)
 router.register(r'carts', CartViewSet)
 router.register(r'orders', OrderViewSet)
 
+router_urls = router.urls
+if getattr(settings, 'ASYNC_READ_VIEWS', False):
+    router_urls = async_read_routes(router_urls)
+
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(router_urls)),
 
     # Authentication endpoints
     path('auth/register/', RegisterView.as_view(), name='register'),
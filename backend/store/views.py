@@ -1,33 +1,310 @@
-from rest_framework import viewsets, filters
-from .models import Category, Product, Cart, Order
-from .serializers import CategorySerializer, ProductSerializer, CartSerializer, OrderSerializer
+import time
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Category.objects.prefetch_related("products__variants").all()
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Count, Prefetch
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from rest_framework import viewsets, permissions, serializers, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from .cache import CachedResponseMixin, ConditionalGetMixin
+from .checkout import apply_cart_operations, checkout, reserve_cart
+from .models import IMAGE_SIZES, Category, Product, Cart, CartItem, Order, OrderItem, ShippingAddress
+from .pagination import KeysetCursorPagination
+from .replicas import allow_replica_reads, is_sticky, replica_databases, served_from_replica
+from .search import CatalogSearchFilter, RankedOrderingFilter, SuggestionIndex
+from .serializers import (
+    CategorySerializer, CategoryListSerializer, ProductSerializer,
+    CartSerializer, CartBatchSerializer, OrderSerializer,
+)
+
+
+class SparseFieldsetMixin:
+    """
+    Forwards `?fields=`, `?omit=` and `?expand=` to the serializer on reads and
+    can trim the queryset down to the columns and relations those fields
+    actually read. Writes always validate and render the full serializer.
+    `?image_size=` picks which precomputed image URL is rendered.
+    """
+    # Relation name -> prefetch lookups to use when that relation is rendered.
+    sparse_prefetch = {}
+
+    def _query_param_list(self, name):
+        raw = self.request.query_params.get(name, "") if self.request else ""
+        return [item.strip() for item in raw.split(",") if item.strip()]
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request is not None and self.request.method in permissions.SAFE_METHODS:
+            fields = self._query_param_list("fields")
+            if fields:
+                kwargs.setdefault("fields", fields)
+            kwargs.setdefault("omit", self._query_param_list("omit"))
+            kwargs.setdefault("expand", self._query_param_list("expand"))
+        return super().get_serializer(*args, **kwargs)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        size = self.request.query_params.get("image_size") if self.request else None
+        if size:
+            if size not in IMAGE_SIZES:
+                raise serializers.ValidationError(
+                    {"image_size": f"Expected one of: {', '.join(IMAGE_SIZES)}."}
+                )
+            context["image_size"] = size
+        return context
+
+    def sparse_queryset(self, queryset):
+        serializer = self.get_serializer()
+        opts = queryset.model._meta
+        columns = {opts.pk.name}
+        # Cursor pagination reads the ordering columns off the last row.
+        for name in list(getattr(self, "ordering_fields", None) or []) + list(getattr(self, "ordering", None) or []):
+            columns.add(name.lstrip("-"))
+
+        prefetch, select = [], []
+        for attr in serializer.get_source_attributes():
+            try:
+                field = opts.get_field(attr)
+            except FieldDoesNotExist:
+                continue  # annotations such as product_count
+            if field.one_to_many or field.many_to_many:
+                prefetch.extend(self.sparse_prefetch.get(attr, [attr]))
+                continue
+            columns.add(attr)
+            nested = serializer.fields.get(attr)
+            if field.many_to_one and hasattr(nested, "get_source_attributes"):
+                select.append(attr)
+                columns.add(f"{attr}__{field.related_model._meta.pk.name}")
+                columns.update(f"{attr}__{name}" for name in nested.get_source_attributes())
+
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset.only(*columns)
+
+
+class AsyncReadMixin:
+    """
+    `alist` / `aretrieve`: list and retrieve for the async routes in
+    store/async_views.py. Same queryset, filters, serializers and pagination
+    as the sync actions; only the queries go through the async ORM.
+    """
+
+    def async_supported(self, request):
+        # The in-process search index is built synchronously on first use.
+        return not CatalogSearchFilter().get_search_terms(request)
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+            if page is not None:
+                return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer([obj async for obj in queryset], many=True).data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return Response(self.get_serializer(await self.aget_object()).data)
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, DjangoValidationError):
+            raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+
+class ReplicaReadMixin:
+    """Catalog reads from a read replica unless the user wrote recently (store/replicas.py)."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if replica_databases() and request.method in permissions.SAFE_METHODS:
+            allow_replica_reads(not is_sticky(request.user))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        allow_replica_reads(False)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def cacheable(self, response, changed_at):
+        # Shortly after a catalog change the replica may still serve the old
+        # rows; cached under the new namespace tokens they would outlive the
+        # lag. Leave those responses uncached until the window has passed.
+        lag = getattr(settings, "REPLICA_STICKY_SECONDS", 10)
+        if served_from_replica() and changed_at is not None and time.time() - changed_at < lag:
+            return False
+        return super().cacheable(response, changed_at)
+
+
+class CategoryViewSet(ReplicaReadMixin, ConditionalGetMixin, CachedResponseMixin, SparseFieldsetMixin,
+                      AsyncReadMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Category.objects.all()
     serializer_class = CategorySerializer
-    filter_backends = [filters.SearchFilter]
+    pagination_class = KeysetCursorPagination
+    filter_backends = [CatalogSearchFilter]
     search_fields = ["name", "description"]
+    ordering = ["category_id"]
+    sparse_prefetch = {"products": ["products__variants"]}
+
+    def _is_shallow(self):
+        # The list route is shallow unless the client asks for ?expand=products;
+        # the detail route always returns the nested product tree.
+        return self.action == "list" and "products" not in self._query_param_list("expand")
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self._is_shallow():
+            queryset = queryset.annotate(product_count=Count("products"))
+        return self.sparse_queryset(queryset)
+
+    def get_cache_namespaces(self):
+        if self.action == "retrieve":
+            return ["catalog", self.detail_namespace("category")]
+        return ["catalog", "category-list"]
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Product.objects.select_related("category").prefetch_related("variants").all()
+    def get_serializer_class(self):
+        if self._is_shallow():
+            return CategoryListSerializer
+        return super().get_serializer_class()
+
+
+class ProductViewSet(ReplicaReadMixin, ConditionalGetMixin, CachedResponseMixin, SparseFieldsetMixin,
+                     AsyncReadMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = KeysetCursorPagination
+    filter_backends = [CatalogSearchFilter, RankedOrderingFilter]
     search_fields = ["name", "description"]
     ordering_fields = ["price", "created_at"]
+    ordering = ["-created_at"]
+    flag_filters = ["is_deal_of_the_day", "is_featured", "is_new", "is_abroad_order"]
+
+    def get_cache_namespaces(self):
+        if self.action == "retrieve":
+            return ["catalog", self.detail_namespace("product")]
+        return ["catalog", "product-list"]
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = self.sparse_queryset(super().get_queryset())
         category_id = self.request.query_params.get("category")
         if category_id:
             queryset = queryset.filter(category_id=category_id)
+        for flag in self.flag_filters:
+            value = self.request.query_params.get(flag)
+            if value is not None:
+                try:
+                    value = serializers.BooleanField().to_internal_value(value)
+                except serializers.ValidationError as exc:
+                    raise serializers.ValidationError({flag: exc.detail})
+                queryset = queryset.filter(**{flag: value})
+        return queryset
+
+    @action(detail=False, authentication_classes=[], permission_classes=[permissions.AllowAny])
+    def suggest(self, request):
+        """Search-as-you-type: `?q=ip` -> [{type, id, name, thumbnail}, ...]."""
+        try:
+            limit = min(max(int(request.query_params.get("limit", 8)), 1), 20)
+        except ValueError:
+            limit = 8
+        return Response(SuggestionIndex.get().suggest(request.query_params.get("q", ""), limit=limit))
+
+class UserScopedQuerysetMixin:
+    """Limits a viewset to the requesting user's rows; staff see everything."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not self.request.user.is_staff:
+            # By id: request.user may be a token-backed ClaimsUser.
+            queryset = queryset.filter(user_id=self.request.user.id)
         return queryset
 
-class CartViewSet(viewsets.ModelViewSet):
-    queryset = Cart.objects.all()
+    def _owner(self):
+        # The row itself: request.user may be a token-backed ClaimsUser.
+        return getattr(self.request.user, "instance", self.request.user)
+
+    def perform_create(self, serializer):
+        # `user` is read-only on the serializers; updates keep the owner.
+        serializer.save(user=self._owner())
+
+
+class CartViewSet(UserScopedQuerysetMixin, SparseFieldsetMixin, AsyncReadMixin, viewsets.ModelViewSet):
+    # carts -> items + products -> variants: three queries whatever the cart size.
+    queryset = Cart.objects.prefetch_related(
+        Prefetch(
+            "items",
+            queryset=CartItem.objects.select_related("product").prefetch_related("product__variants"),
+        )
+    ).order_by("-created_at")
     serializer_class = CartSerializer
 
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
-    serializer_class = OrderSerializer
+    @action(detail=True, methods=["post"])
+    def checkout(self, request, pk=None):
+        """Turn the cart into an order; 409 with per-item shortages if stock ran out."""
+        # Only the cart row is needed; skip the items/products prefetch.
+        cart = get_object_or_404(self.get_queryset().prefetch_related(None), pk=pk)
+        address = None
+        address_id = request.data.get("shipping_address")
+        if address_id is not None:
+            address = ShippingAddress.objects.filter(pk=address_id, user_id=cart.user_id).first()
+            if address is None:
+                raise serializers.ValidationError({"shipping_address": "Unknown shipping address."})
+        order = checkout(cart, shipping_address=address)
+        order = OrderViewSet.queryset.get(pk=order.pk)
+        return Response(
+            OrderSerializer(order, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED,
+        )
 
+    @action(detail=True)
+    def summary(self, request, pk=None):
+        """Stored totals only: one query, no items or products serialized."""
+        summary = get_object_or_404(
+            self.get_queryset().prefetch_related(None).values("id", "item_count", "subtotal"), pk=pk
+        )
+        return Response({
+            "cart": summary["id"],
+            "item_count": summary["item_count"],
+            "subtotal": str(summary["subtotal"]),
+        })
+
+    @action(detail=True, methods=["post"], url_path="items/batch")
+    def batch(self, request, pk=None):
+        """
+        Apply many add/set/remove operations in one transaction:
+        {"operations": [{"op": "add", "product": 1, "variant": 4, "quantity": 2}, ...]}
+        Responds with the resulting lines and recomputed totals.
+        """
+        cart = get_object_or_404(self.get_queryset().prefetch_related(None), pk=pk)
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines, totals = apply_cart_operations(cart, serializer.validated_data["operations"])
+        return Response({
+            "cart": cart.pk,
+            "items": [
+                {"product": item.product_id, "variant": item.variant_id, "quantity": item.quantity}
+                for item in lines
+            ],
+            "item_count": totals["item_count"],
+            "subtotal": str(totals["subtotal"]),
+        })
+
+    @action(detail=True, methods=["post"])
+    def reserve(self, request, pk=None):
+        """Hold (or extend) stock for the cart's flash-deal items; 409 if any is short."""
+        cart = get_object_or_404(self.get_queryset().prefetch_related(None), pk=pk)
+        return Response({"expires_at": reserve_cart(cart)})
+
+
+class OrderViewSet(UserScopedQuerysetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
+    queryset = Order.objects.prefetch_related(
+        Prefetch(
+            "items",
+            queryset=OrderItem.objects.select_related("product").prefetch_related("product__variants"),
+        )
+    ).order_by("-created_at")
+    serializer_class = OrderSerializer